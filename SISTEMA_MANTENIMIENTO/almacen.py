@@ -0,0 +1,252 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from ingesta import leer_excel
+
+# --- Almacén de lecturas de los sensores ---
+# Las lecturas subidas (Excel, CSV o Parquet) se guardan en formato largo (estacion, fecha, mes, valor)
+# en SQLite y pasan a ser los datos de referencia: el análisis, la página de clima y el dashboard
+# consultan rangos de fechas sin volver a leer ningún libro.
+# La clave primaria (estacion, fecha) en una tabla WITHOUT ROWID agrupa físicamente las lecturas
+# por estación y fecha, así que las de una estación y mes quedan contiguas; el índice
+# (estacion, mes) sirve para los resúmenes mensuales. Los valores faltantes se guardan como NULL
+# porque también son información (conteo de faltantes).
+# Las lecturas que llegan en línea (/api/lecturas) son sub-diarias y con fecha UTC, así que van a su
+# propia tabla (lecturas_en_linea) con su propio contador de versión: no cambian la versión de
+# `lecturas` ni, por tanto, los análisis, la tabla de clima ni sus ETag y páginas ya servidas.
+
+RUTA_ALMACEN = os.environ.get('ALMACEN_LECTURAS_PATH', os.path.join('cache', 'lecturas.sqlite'))
+FORMATO_FECHA = '%Y-%m-%d %H:%M:%S'
+
+
+def _texto_fechas(fechas):
+    """Serie datetime a texto ISO 'YYYY-MM-DD HH:MM:SS' (ordenable como texto)."""
+    return np.char.replace(np.datetime_as_string(fechas.to_numpy().astype('datetime64[s]'), unit='s'), 'T', ' ')
+
+
+def _limites(desde, hasta):
+    """Convierte un rango de fechas (inclusivo, por días) en límites de texto para la consulta."""
+    inicio = pd.Timestamp(desde).normalize().strftime(FORMATO_FECHA) if desde is not None else None
+    fin = (pd.Timestamp(hasta).normalize() + pd.Timedelta(days=1)).strftime(FORMATO_FECHA) if hasta is not None else None
+    return inicio, fin
+
+
+def formato_ancho(partes, estaciones=None):
+    """
+    Une {estacion: DataFrame (Fecha, estacion)} en un DataFrame ancho (Fecha + una columna por
+    estación) sobre la unión de fechas; una estación sin fila en una fecha queda como NaN.
+    """
+    estaciones = list(estaciones) if estaciones is not None else list(partes)
+    series = [partes[e].set_index('Fecha')[e] for e in estaciones if e in partes and not partes[e].empty]
+    if not series:
+        return pd.DataFrame(columns=['Fecha'] + estaciones)
+    ancho = pd.concat(series, axis=1).reindex(columns=estaciones).sort_index()
+    ancho.index.name = 'Fecha'
+    return ancho.reset_index().astype({e: float for e in estaciones})
+
+
+class AlmacenLecturas:
+    """Serie temporal de lecturas por estación sobre SQLite."""
+
+    def __init__(self, ruta=RUTA_ALMACEN):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._inicializada = False
+
+    def _conectar(self):
+        if not self._inicializada:
+            carpeta = os.path.dirname(self.ruta)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+        conn = sqlite3.connect(self.ruta, timeout=30)
+        # Con WAL basta sincronizar en los checkpoints; acelera mucho las cargas grandes
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not self._inicializada:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lecturas ("
+                " estacion TEXT NOT NULL, fecha TEXT NOT NULL, mes TEXT NOT NULL, valor REAL,"
+                " PRIMARY KEY (estacion, fecha)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lecturas_mes ON lecturas (estacion, mes)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('version', 0)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lecturas_en_linea ("
+                " estacion TEXT NOT NULL, fecha TEXT NOT NULL, valor REAL,"
+                " PRIMARY KEY (estacion, fecha)) WITHOUT ROWID"
+            )
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('version_en_linea', 0)")
+            conn.commit()
+            self._inicializada = True
+        return conn
+
+    def escribir(self, df, estaciones):
+        """
+        Inserta o reemplaza las lecturas de las estaciones indicadas (columnas de df con Fecha).
+        Devuelve el número de lecturas escritas.
+        """
+        datos = df[df['Fecha'].notna()]
+        if datos.empty or not estaciones:
+            return 0
+        fechas = _texto_fechas(datos['Fecha'])
+        meses = fechas.astype('<U7')
+        filas = 0
+        with self._lock, closing(self._conectar()) as conn:
+            for estacion in estaciones:
+                valores = pd.to_numeric(datos[estacion], errors='coerce').to_numpy(dtype=float)
+                valores = np.where(np.isnan(valores), None, valores).tolist()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO lecturas (estacion, fecha, mes, valor) VALUES (?, ?, ?, ?)",
+                    zip([estacion] * len(fechas), fechas.tolist(), meses.tolist(), valores),
+                )
+                filas += len(fechas)
+            conn.execute("UPDATE meta SET valor = valor + 1 WHERE clave = 'version'")
+            conn.commit()
+        return filas
+
+    def escribir_lecturas(self, lecturas):
+        """
+        Inserta o reemplaza en lecturas_en_linea las lecturas [(estacion, segundos epoch, valor o None)]
+        que llegan por /api/lecturas (fecha en UTC). Devuelve el número de lecturas escritas.
+        """
+        if not lecturas:
+            return 0
+        estaciones, segundos, valores = zip(*lecturas)
+        fechas = np.char.replace(np.datetime_as_string(np.array(segundos).astype('datetime64[s]'), unit='s'), 'T', ' ')
+        with self._lock, closing(self._conectar()) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO lecturas_en_linea (estacion, fecha, valor) VALUES (?, ?, ?)",
+                zip(estaciones, fechas.tolist(), valores),
+            )
+            conn.execute("UPDATE meta SET valor = valor + 1 WHERE clave = 'version_en_linea'")
+            conn.commit()
+        return len(lecturas)
+
+    def consultar(self, estaciones=None, desde=None, hasta=None):
+        """
+        Lecturas en formato ancho (Fecha + una columna por estación) para el rango de días
+        [desde, hasta]; None en cualquiera de los límites significa sin límite.
+        Las estaciones sin fila en una fecha de otra quedan como NaN: para contar faltantes
+        usar consultar_por_estacion.
+        """
+        estaciones = list(estaciones) if estaciones is not None else self.estaciones()
+        if not estaciones:
+            return pd.DataFrame(columns=['Fecha'])
+        return formato_ancho(self.consultar_por_estacion(estaciones, desde, hasta), estaciones)
+
+    def consultar_por_estacion(self, estaciones=None, desde=None, hasta=None):
+        """
+        {estacion: DataFrame (Fecha, estacion)} con solo las fechas guardadas de cada estación en
+        el rango [desde, hasta]. Aquí un NaN es siempre un faltante guardado (NULL).
+        """
+        estaciones = list(estaciones) if estaciones is not None else self.estaciones()
+        if not estaciones:
+            return {}
+        inicio, fin = _limites(desde, hasta)
+        condiciones = [f"estacion IN ({', '.join('?' * len(estaciones))})"]
+        parametros = list(estaciones)
+        if inicio is not None:
+            condiciones.append("fecha >= ?")
+            parametros.append(inicio)
+        if fin is not None:
+            condiciones.append("fecha < ?")
+            parametros.append(fin)
+        with closing(self._conectar()) as conn:
+            largo = pd.read_sql_query(
+                f"SELECT estacion, fecha, valor FROM lecturas WHERE {' AND '.join(condiciones)}"
+                " ORDER BY estacion, fecha",
+                conn, params=parametros,
+            )
+        largo['fecha'] = pd.to_datetime(largo['fecha'], format=FORMATO_FECHA)
+        largo['valor'] = largo['valor'].astype(float)
+        partes = {estacion: pd.DataFrame({'Fecha': pd.Series(dtype='datetime64[ns]'), estacion: pd.Series(dtype=float)})
+                  for estacion in estaciones}
+        for estacion, grupo in largo.groupby('estacion', sort=False):
+            partes[estacion] = pd.DataFrame({'Fecha': grupo['fecha'].to_numpy(), estacion: grupo['valor'].to_numpy()})
+        return partes
+
+    def resumen_mensual(self, estaciones=None, desde=None, hasta=None):
+        """Por estación y mes: lecturas, faltantes, suma y promedio, calculados en SQLite."""
+        inicio, fin = _limites(desde, hasta)
+        condiciones, parametros = [], []
+        if estaciones is not None:
+            condiciones.append(f"estacion IN ({', '.join('?' * len(estaciones))})")
+            parametros.extend(estaciones)
+        if inicio is not None:
+            condiciones.append("fecha >= ?")
+            parametros.append(inicio)
+        if fin is not None:
+            condiciones.append("fecha < ?")
+            parametros.append(fin)
+        donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        with closing(self._conectar()) as conn:
+            resumen = pd.read_sql_query(
+                "SELECT estacion, mes, COUNT(*) AS total, COUNT(*) - COUNT(valor) AS faltantes,"
+                f" SUM(valor) AS suma, AVG(valor) AS promedio FROM lecturas {donde}"
+                " GROUP BY estacion, mes ORDER BY estacion, mes",
+                conn, params=parametros,
+            )
+        resumen['mes'] = pd.to_datetime(resumen['mes'], format='%Y-%m')
+        return resumen
+
+    def estaciones(self):
+        with closing(self._conectar()) as conn:
+            return [fila[0] for fila in conn.execute("SELECT DISTINCT estacion FROM lecturas ORDER BY estacion")]
+
+    def rango_fechas(self, estaciones=None):
+        """(primera, última) fecha con lecturas, o None si el almacén está vacío."""
+        consulta, parametros = "SELECT MIN(fecha), MAX(fecha) FROM lecturas", []
+        if estaciones:
+            consulta += f" WHERE estacion IN ({', '.join('?' * len(estaciones))})"
+            parametros = list(estaciones)
+        with closing(self._conectar()) as conn:
+            primera, ultima = conn.execute(consulta, parametros).fetchone()
+        if primera is None:
+            return None
+        return pd.Timestamp(primera), pd.Timestamp(ultima)
+
+    def version(self):
+        """Número que cambia con cada escritura; sirve como clave de caché de resultados derivados."""
+        with closing(self._conectar()) as conn:
+            return conn.execute("SELECT valor FROM meta WHERE clave = 'version'").fetchone()[0]
+
+    def version_en_linea(self):
+        """Como version(), pero de lecturas_en_linea."""
+        with closing(self._conectar()) as conn:
+            return conn.execute("SELECT valor FROM meta WHERE clave = 'version_en_linea'").fetchone()[0]
+
+    def importado(self, huella):
+        """True si el archivo con esta huella fue lo último escrito: el almacén ya refleja su contenido."""
+        with closing(self._conectar()) as conn:
+            fila = conn.execute("SELECT valor FROM meta WHERE clave = ?", (f"archivo:{huella}",)).fetchone()
+            version = conn.execute("SELECT valor FROM meta WHERE clave = 'version'").fetchone()[0]
+        return fila is not None and fila[0] == version
+
+    def registrar_importacion(self, huella):
+        """Anota que la versión actual del almacén incluye el archivo con esta huella."""
+        with self._lock, closing(self._conectar()) as conn:
+            conn.execute("INSERT OR REPLACE INTO meta SELECT ?, valor FROM meta WHERE clave = 'version'",
+                         (f"archivo:{huella}",))
+            conn.commit()
+
+    def vacio(self):
+        with closing(self._conectar()) as conn:
+            return conn.execute("SELECT 1 FROM lecturas LIMIT 1").fetchone() is None
+
+    def importar_si_vacio(self, ruta_excel, estaciones, dayfirst=False):
+        """Carga un Excel inicial (p. ej. el archivo fijo de data/) si el almacén aún no tiene lecturas."""
+        if not self.vacio() or not os.path.exists(ruta_excel):
+            return 0
+        df = leer_excel(ruta_excel, dayfirst=dayfirst)
+        presentes = [e for e in estaciones if e in df.columns]
+        print(f"Importando {ruta_excel} al almacén de lecturas ({', '.join(presentes)}).")
+        return self.escribir(df, presentes)
+
+
+almacen_lecturas = AlmacenLecturas()
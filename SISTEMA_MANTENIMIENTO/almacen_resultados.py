@@ -0,0 +1,189 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+# --- Resultados compartidos entre procesos ---
+# Con varios workers (gunicorn, waitress en varios procesos) las variables globales de cada
+# proceso divergen: cada worker tiene su propio último análisis y su propia tabla de clima, y
+# recalcula por su cuenta. Este almacén guarda los resultados en SQLite, con versiones por
+# clave (p. ej. el hash del archivo subido), de modo que todos los workers sirven lo mismo.
+# obtener_o_calcular reserva la clave antes de calcular: si otro worker ya está calculando el
+# mismo resultado, se espera a que lo guarde en lugar de repetir el trabajo.
+
+RUTA_RESULTADOS = os.environ.get('ALMACEN_RESULTADOS_PATH', os.path.join('cache', 'resultados.sqlite'))
+MAX_VERSIONES = int(os.environ.get('ALMACEN_RESULTADOS_MAX_VERSIONES', 3))
+MAX_ENTRADAS = int(os.environ.get('ALMACEN_RESULTADOS_MAX_ENTRADAS', 200))
+# Estado de los trabajos en segundo plano: archivo y límite propios para que no desplace resultados
+RUTA_TRABAJOS = os.environ.get('ALMACEN_TRABAJOS_PATH', os.path.join('cache', 'trabajos.sqlite'))
+MAX_TRABAJOS = int(os.environ.get('ALMACEN_TRABAJOS_MAX_ENTRADAS', 500))
+# Una reserva más antigua que esto se considera abandonada (worker caído)
+ESPERA_MAXIMA = int(os.environ.get('ALMACEN_RESULTADOS_ESPERA', 600))
+
+
+class Entrada:
+    def __init__(self, clave, version, valor, creado):
+        self.clave = clave
+        self.version = version
+        self.valor = valor
+        self.creado = creado
+
+
+class AlmacenResultados:
+    """Resultados versionados por clave, en SQLite, compartidos por todos los procesos."""
+
+    def __init__(self, ruta=RUTA_RESULTADOS, max_versiones=MAX_VERSIONES, max_entradas=MAX_ENTRADAS):
+        self.ruta = ruta
+        self.max_versiones = max_versiones
+        self.max_entradas = max_entradas
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._inicializada = False
+
+    def _conectar(self):
+        if not self._inicializada:
+            carpeta = os.path.dirname(self.ruta)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+        conn = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+        if not self._inicializada:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS resultados ("
+                " clave TEXT, version INTEGER, valor BLOB, creado REAL, ultimo_uso REAL,"
+                " PRIMARY KEY (clave, version))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_resultados_uso ON resultados (ultimo_uso)")
+            conn.execute("CREATE TABLE IF NOT EXISTS reservas (clave TEXT PRIMARY KEY, pid INTEGER, inicio REAL)")
+            self._inicializada = True
+        return conn
+
+    def guardar(self, clave, valor, max_versiones=None):
+        """
+        Guarda valor como nueva versión de clave y devuelve el número de versión.
+        max_versiones limita las versiones que se conservan de esta clave (por defecto, las del almacén).
+        """
+        max_versiones = max_versiones or self.max_versiones
+        datos = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        ahora = time.time()
+        with closing(self._conectar()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute(
+                    "SELECT COALESCE(MAX(version), 0) + 1 FROM resultados WHERE clave = ?", (clave,)
+                ).fetchone()[0]
+                conn.execute("INSERT INTO resultados VALUES (?, ?, ?, ?, ?)", (clave, version, datos, ahora, ahora))
+                # Conserva las últimas versiones de la clave y las entradas usadas más recientemente
+                conn.execute("DELETE FROM resultados WHERE clave = ? AND version <= ?",
+                             (clave, version - max_versiones))
+                conn.execute(
+                    "DELETE FROM resultados WHERE rowid NOT IN"
+                    " (SELECT rowid FROM resultados ORDER BY ultimo_uso DESC LIMIT ?)",
+                    (self.max_entradas,),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return version
+
+    def _leer(self, consulta, parametros):
+        with closing(self._conectar()) as conn:
+            fila = conn.execute(consulta, parametros).fetchone()
+            if fila is not None:
+                conn.execute("UPDATE resultados SET ultimo_uso = ? WHERE clave = ? AND version = ?",
+                             (time.time(), fila[0], fila[1]))
+        with self._lock:
+            if fila is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return Entrada(fila[0], fila[1], pickle.loads(fila[2]), fila[3])
+
+    def obtener(self, clave, version=None):
+        """Entrada con la versión indicada (o la última) de clave, o None."""
+        if version is None:
+            return self._leer("SELECT clave, version, valor, creado FROM resultados WHERE clave = ?"
+                              " ORDER BY version DESC LIMIT 1", (clave,))
+        return self._leer("SELECT clave, version, valor, creado FROM resultados WHERE clave = ? AND version = ?",
+                          (clave, version))
+
+    def ultimo(self, prefijo):
+        """Entrada creada más recientemente entre las claves que empiezan por prefijo, o None."""
+        # Por creación y no por uso: leer una entrada antigua no la convierte en la última
+        return self._leer("SELECT clave, version, valor, creado FROM resultados WHERE clave >= ? AND clave < ?"
+                          " ORDER BY creado DESC, version DESC LIMIT 1", (prefijo, prefijo + '￿'))
+
+    def version(self, clave):
+        """Última versión guardada de clave, sin leer su valor; o None."""
+        with closing(self._conectar()) as conn:
+            fila = conn.execute("SELECT MAX(version) FROM resultados WHERE clave = ?", (clave,)).fetchone()
+        return fila[0]
+
+    def ultima_version(self, prefijo):
+        """(clave, version) de la entrada creada más recientemente con prefijo, sin leer su valor; o None."""
+        with closing(self._conectar()) as conn:
+            fila = conn.execute("SELECT clave, version FROM resultados WHERE clave >= ? AND clave < ?"
+                                " ORDER BY creado DESC, version DESC LIMIT 1", (prefijo, prefijo + '￿')).fetchone()
+        return tuple(fila) if fila is not None else None
+
+    def _reservar(self, clave):
+        ahora = time.time()
+        with closing(self._conectar()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            fila = conn.execute("SELECT inicio FROM reservas WHERE clave = ?", (clave,)).fetchone()
+            if fila is not None and ahora - fila[0] < ESPERA_MAXIMA:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("INSERT OR REPLACE INTO reservas VALUES (?, ?, ?)", (clave, os.getpid(), ahora))
+            conn.execute("COMMIT")
+            return True
+
+    def _liberar(self, clave):
+        with closing(self._conectar()) as conn:
+            conn.execute("DELETE FROM reservas WHERE clave = ?", (clave,))
+
+    def obtener_o_calcular(self, clave, funcion, vigente_desde=None, intervalo=0.5, guardar_si=None):
+        """
+        Devuelve el último valor de clave si existe y se creó después de vigente_desde (epoch);
+        si no, lo calcula con funcion() en un solo proceso y lo guarda como nueva versión.
+        Con guardar_si(valor) falso el valor se devuelve sin guardarlo (p. ej. un error), y la
+        siguiente petición lo vuelve a calcular.
+        """
+        inicio = time.time()
+        while True:
+            entrada = self.obtener(clave)
+            if entrada is not None and (vigente_desde is None or entrada.creado >= vigente_desde):
+                return entrada.valor
+            if self._reservar(clave):
+                try:
+                    valor = funcion()
+                    if guardar_si is None or guardar_si(valor):
+                        self.guardar(clave, valor)
+                    return valor
+                finally:
+                    self._liberar(clave)
+            if time.time() - inicio > ESPERA_MAXIMA:
+                print(f"Tiempo de espera agotado para {clave}; se calcula en este proceso.")
+                return funcion()
+            time.sleep(intervalo)
+
+    def limpiar(self):
+        with closing(self._conectar()) as conn:
+            conn.execute("DELETE FROM resultados")
+            conn.execute("DELETE FROM reservas")
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def estadisticas(self):
+        with closing(self._conectar()) as conn:
+            entradas = conn.execute("SELECT COUNT(*) FROM resultados").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entradas': entradas}
+
+
+almacen_resultados = AlmacenResultados()
+almacen_trabajos = AlmacenResultados(RUTA_TRABAJOS, max_versiones=1, max_entradas=MAX_TRABAJOS)
@@ -0,0 +1,271 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+import anomalias
+from cache_analisis import cache_analisis
+
+# --- Análisis vectorizado de todas las estaciones ---
+# Calcula para cada estación la serie mensual de faltantes, las anomalías y el reporte mensual,
+# pero la clave de mes se calcula una vez y se hace un único groupby sobre todas las columnas
+# de estaciones.
+# El estado se acumula por bloques (AcumuladorEstaciones), de modo que un archivo grande puede
+# procesarse por partes con memoria acotada: solo se guardan agregados mensuales, el último valor
+# válido de cada estación, el estado del detector de anomalías (anomalias.py) y, opcionalmente,
+# un número limitado de fechas de ejemplo.
+# El método estacional es la excepción: el puntaje de cada lectura depende de la climatología de
+# todo el archivo, así que se guardan las fechas y valores de todos los bloques y se puntúan en
+# resultados() con la climatología final (memoria proporcional a filas x estaciones).
+# El mismo estado se persiste (cache_analisis) para reanalizar solo las filas añadidas; con
+# cualquier método el resultado es igual al de analizar todas las filas de una vez.
+
+# Cambiar si cambia el estado de AcumuladorEstaciones, para no reutilizar estados antiguos
+VERSION_ACUMULADOR = 3
+
+
+def resumen_mensual(df, estaciones):
+    """
+    Agregados mensuales de todas las estaciones con un solo groupby.
+    Devuelve (total_por_mes, suma, conteo): total de filas por mes y, por estación,
+    suma y número de valores no nulos.
+    """
+    mes = df['Fecha'].dt.to_period('M').dt.to_timestamp()
+    agregados = df[estaciones].groupby(mes).agg(['sum', 'count'])
+    total_por_mes = mes.groupby(mes).size()
+    agregados.index.name = 'mes'
+    total_por_mes.index.name = 'mes'
+    return total_por_mes, agregados.xs('sum', axis=1, level=1), agregados.xs('count', axis=1, level=1)
+
+
+class AcumuladorEstaciones:
+    """
+    Análisis incremental de estaciones: agregar(df) procesa un bloque de filas y
+    resultados() devuelve lo mismo que analizar_estaciones sobre todas las filas vistas.
+
+    Los bloques deben llegar en orden cronológico para que las variaciones porcentuales
+    entre bloques coincidan con las del archivo completo.
+    max_fechas limita cuántas fechas faltantes y anomalías se guardan por estación
+    (None = todas); los conteos siempre son exactos.
+    metodo es el de anomalias.METODOS; umbral_porcentaje se aplica a la variación % y umbral
+    (por defecto anomalias.UMBRALES) al puntaje de los demás métodos.
+    """
+
+    def __init__(self, estaciones, umbral_porcentaje=50, max_fechas=None,
+                 metodo=anomalias.METODO_ANOMALIAS, umbral=None, ventana=anomalias.VENTANA):
+        self.estaciones = list(estaciones)
+        self.umbral_porcentaje = umbral_porcentaje
+        self.max_fechas = max_fechas
+        self.metodo = anomalias.validar_metodo(metodo)
+        self.umbral = anomalias.UMBRALES[metodo] if umbral is None else umbral
+        self.ventana = ventana
+        self.total = 0
+        self.total_por_mes = pd.Series(dtype=float)
+        self.suma = pd.DataFrame(columns=self.estaciones, dtype=float)
+        self.conteo = pd.DataFrame(columns=self.estaciones, dtype=float)
+        self.faltantes = pd.Series(0, index=self.estaciones, dtype=int)
+        # Estado de los detectores entre bloques: última lectura válida (variación %) y el del método
+        self.ultimo_valor = None
+        self.estado_anomalias = None
+        self.ultima_fecha = None
+        # Fechas y variaciones se guardan como arreglos de NumPy (por bloques) y se formatean
+        # solo en resultados(); así el estado se serializa rápido aunque el histórico sea largo
+        self.fechas_faltantes = {e: [] for e in self.estaciones}
+        self.anomalias = {e: [] for e in self.estaciones}
+        self.total_anomalias = {e: 0 for e in self.estaciones}
+        # Solo para el método estacional: (fechas, valores) de cada bloque, en orden cronológico
+        self.lecturas = []
+        self._aviso_orden = False
+
+    def _guardar(self, partes, *arreglos):
+        guardadas = sum(len(p[0]) for p in partes)
+        limite = None if self.max_fechas is None else max(0, self.max_fechas - guardadas)
+        if limite == 0 or len(arreglos[0]) == 0:
+            return
+        partes.append(tuple(a[:limite] for a in arreglos))
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        # Une los bloques para que el estado persistido sea compacto
+        for nombre in ('fechas_faltantes', 'anomalias'):
+            estado[nombre] = {
+                e: [tuple(np.concatenate(columna) for columna in zip(*partes))] if partes else []
+                for e, partes in estado[nombre].items()
+            }
+        if estado['lecturas']:
+            estado['lecturas'] = [tuple(np.concatenate(columna) for columna in zip(*estado['lecturas']))]
+        return estado
+
+    def agregar(self, df):
+        """Incorpora un bloque de filas con columna Fecha (datetime) y las columnas de estaciones."""
+        if df.empty:
+            return
+        estaciones = self.estaciones
+
+        total_por_mes, suma, conteo = resumen_mensual(df, estaciones)
+        self.total_por_mes = self.total_por_mes.add(total_por_mes, fill_value=0)
+        self.suma = suma if self.suma.empty else self.suma.add(suma, fill_value=0)
+        self.conteo = conteo if self.conteo.empty else self.conteo.add(conteo, fill_value=0)
+        self.total += len(df)
+
+        faltante = df[estaciones].isna()
+        self.faltantes += faltante.sum().astype(int)
+        fechas_df = df['Fecha'].to_numpy()
+        for estacion in estaciones:
+            self._guardar(self.fechas_faltantes[estacion], fechas_df[faltante[estacion].to_numpy()])
+
+        inicio = df['Fecha'].min()
+        if self.ultima_fecha is not None and inicio < self.ultima_fecha and not self._aviso_orden:
+            print("Advertencia: los datos no están en orden cronológico; las variaciones entre bloques son aproximadas.")
+            self._aviso_orden = True
+        ordenado = df.sort_values('Fecha', kind='stable')
+        fechas = ordenado['Fecha'].to_numpy()
+        valores = ordenado[estaciones].to_numpy(dtype=float)
+        # La variación % se guarda siempre (es la columna que muestran las plantillas)
+        variacion, self.ultimo_valor = anomalias.variacion_porcentual(valores, self.ultimo_valor)
+        if self.metodo == 'estacional':
+            # Se puntúan todas juntas en resultados(), con la climatología de todos los bloques
+            self.lecturas.append((fechas, valores))
+            marcas = None
+        elif self.metodo == 'variacion':
+            puntaje = None
+            marcas = anomalias.marcar(variacion, self.umbral_porcentaje)
+        else:
+            puntaje, self.estado_anomalias = anomalias.puntuar(valores, fechas, self.metodo, self.ventana,
+                                                              self.estado_anomalias)
+            marcas = anomalias.marcar(puntaje, self.umbral)
+        if marcas is not None:
+            self._marcar(self.anomalias, self.total_anomalias, fechas, marcas, variacion, puntaje)
+
+        fin = df['Fecha'].max()
+        if pd.notna(fin) and (self.ultima_fecha is None or fin > self.ultima_fecha):
+            self.ultima_fecha = fin
+
+    def _marcar(self, partes, totales, fechas, marcas, variacion, puntaje):
+        """Suma y guarda en partes/totales las anomalías marcadas de cada estación."""
+        for i, (estacion, filas) in enumerate(zip(self.estaciones, anomalias.indices_por_columna(marcas))):
+            totales[estacion] += len(filas)
+            columnas = (variacion[filas, i],) if puntaje is None else (variacion[filas, i], puntaje[filas, i])
+            self._guardar(partes[estacion], fechas[filas], *columnas)
+
+    def _anomalias_estacionales(self):
+        """Anomalías del método estacional sobre todas las lecturas vistas: (partes, totales)."""
+        partes = {e: [] for e in self.estaciones}
+        totales = {e: 0 for e in self.estaciones}
+        if self.lecturas:
+            fechas = np.concatenate([f for f, _ in self.lecturas])
+            valores = np.concatenate([v for _, v in self.lecturas])
+            # Mismo orden que al ordenar todas las filas juntas, aunque los bloques no lleguen en orden
+            orden = np.argsort(fechas, kind='stable')
+            fechas, valores = fechas[orden], valores[orden]
+            variacion, _ = anomalias.variacion_porcentual(valores)
+            puntaje, _ = anomalias.puntuar(valores, fechas, 'estacional')
+            self._marcar(partes, totales, fechas, anomalias.marcar(puntaje, self.umbral), variacion, puntaje)
+        return partes, totales
+
+    def _fechas_faltantes(self, estacion):
+        partes = self.fechas_faltantes[estacion]
+        if not partes:
+            return []
+        return anomalias.formatear_fechas(np.concatenate([p[0] for p in partes])).tolist()
+
+    @staticmethod
+    def _anomalias(partes):
+        if not partes:
+            return []
+        return anomalias.registros_anomalias(*(np.concatenate(columna) for columna in zip(*partes)))
+
+    def resultados(self):
+        """Devuelve {estacion: {...}} con las piezas que usa analizar_excel."""
+        total_por_mes = self.total_por_mes.sort_index().astype(int)
+        conteo = self.conteo.reindex(total_por_mes.index).fillna(0)
+        suma = self.suma.reindex(total_por_mes.index).fillna(0)
+        faltantes_por_mes = conteo.rsub(total_por_mes, axis=0).astype(int)
+        promedio_por_mes = suma / conteo.replace(0, np.nan)
+        if self.metodo == 'estacional':
+            partes_anomalias, total_anomalias = self._anomalias_estacionales()
+        else:
+            partes_anomalias, total_anomalias = self.anomalias, self.total_anomalias
+
+        resultados = {}
+        for estacion in self.estaciones:
+            reporte = pd.DataFrame({
+                'mes': total_por_mes.index,
+                'total': total_por_mes.to_numpy(),
+                'faltantes': faltantes_por_mes[estacion].to_numpy(),
+                'promedio': promedio_por_mes[estacion].to_numpy(),
+            })
+            reporte['porcentaje_faltantes'] = (reporte['faltantes'] / reporte['total']) * 100
+            serie = pd.DataFrame({'ds': reporte['mes'], 'y': reporte['faltantes'] / reporte['total']})
+
+            datos_faltantes = int(self.faltantes[estacion])
+            resultados[estacion] = {
+                'total': self.total,
+                'faltantes': datos_faltantes,
+                'porcentaje': (datos_faltantes / self.total) * 100 if self.total else 0.0,
+                'fechas_faltantes': self._fechas_faltantes(estacion),
+                'fechas_anomalias': self._anomalias(partes_anomalias[estacion]),
+                'total_anomalias': total_anomalias[estacion],
+                'reporte_mensual': reporte,
+                'serie_faltantes': serie,
+            }
+        return resultados
+
+
+def analizar_estaciones(df, estaciones, umbral_porcentaje=50, metodo=anomalias.METODO_ANOMALIAS):
+    """
+    Calcula para todas las estaciones los conteos de faltantes, el reporte mensual,
+    la serie mensual de proporción de faltantes y las anomalías (por defecto, por variación porcentual).
+    Devuelve {estacion: {...}} con las mismas piezas que usa analizar_excel.
+    """
+    if not estaciones:
+        return {}
+    acumulador = AcumuladorEstaciones(estaciones, umbral_porcentaje, metodo=metodo)
+    acumulador.agregar(df)
+    return acumulador.resultados()
+
+
+def _huella(hashes):
+    return hashlib.sha256(np.ascontiguousarray(hashes).tobytes()).hexdigest()
+
+
+def analizar_incremental(df, estaciones, umbral_porcentaje=50, cache=cache_analisis,
+                         metodo=anomalias.METODO_ANOMALIAS):
+    """
+    Igual que analizar_estaciones, pero reutiliza el estado guardado de un análisis anterior
+    cuyas filas coinciden con las de df hasta su última fecha: solo se procesan las filas
+    posteriores (p. ej. el mes añadido al volver a subir el mismo libro).
+    """
+    if not estaciones:
+        return {}
+    if cache is None or df['Fecha'].isna().any():
+        return analizar_estaciones(df, estaciones, umbral_porcentaje, metodo)
+
+    firma = json.dumps({'estaciones': list(estaciones), 'umbral': umbral_porcentaje, 'metodo': metodo,
+                        'umbral_metodo': anomalias.UMBRALES[metodo], 'ventana': anomalias.VENTANA,
+                        'version': VERSION_ACUMULADOR})
+    # Un hash por fila; las huellas del prefijo y del total salen del mismo arreglo
+    hashes = pd.util.hash_pandas_object(df[['Fecha'] + list(estaciones)], index=False).to_numpy()
+    fechas = df['Fecha']
+
+    acumulador = None
+    for id_, ultima_fecha, filas, huella in cache.buscar(firma):
+        prefijo = (fechas <= ultima_fecha).to_numpy()
+        if prefijo.sum() != filas or _huella(hashes[prefijo]) != huella:
+            continue
+        acumulador = cache.cargar(id_)
+        if acumulador is None:
+            continue
+        nuevas = df[~prefijo]
+        print(f"Análisis incremental: {len(nuevas)} filas nuevas de {len(df)}.")
+        if nuevas.empty:
+            return acumulador.resultados()
+        acumulador.agregar(nuevas)
+        break
+
+    if acumulador is None:
+        acumulador = AcumuladorEstaciones(estaciones, umbral_porcentaje, metodo=metodo)
+        acumulador.agregar(df)
+    cache.guardar(firma, acumulador, _huella(hashes))
+    return acumulador.resultados()
@@ -0,0 +1,216 @@
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# --- Detección de anomalías para todas las estaciones a la vez ---
+# Un único motor para Flask (analisis.py) y Streamlit. Cada método recibe una matriz
+# fechas x estaciones (filas en orden cronológico, NaN = sin dato) y devuelve una matriz de
+# puntajes del mismo tamaño; una lectura es anomalía si |puntaje| > umbral. Métodos:
+#   - variacion:  variación % respecto a la última lectura válida (el criterio de siempre).
+#   - zscore:     desviaciones estándar respecto a la media de las `ventana` filas anteriores.
+#   - mad:        como zscore pero con mediana y MAD (desviación absoluta mediana) de la ventana;
+#                 no se deja arrastrar por los propios picos.
+#   - estacional: residuo respecto al promedio del mismo mes del año, en desviaciones estándar
+#                 del residuo de la estación.
+# Todo son operaciones de NumPy sobre la matriz completa (sumas acumuladas, ventanas deslizantes
+# ordenadas, productos matriciales), sin bucles por fila ni por estación.
+# puntuar() devuelve además un estado para continuar con el bloque siguiente (última lectura,
+# últimas filas de la ventana o sumas por mes), de modo que un archivo se puede procesar por
+# bloques; detectar() devuelve los índices marcados de cada estación como arreglos compactos.
+
+METODOS = ('variacion', 'zscore', 'mad', 'estacional')
+METODO_ANOMALIAS = os.environ.get('METODO_ANOMALIAS', 'variacion')
+# Umbral por defecto de |puntaje| (en % para variacion; en desviaciones para el resto)
+UMBRALES = {'variacion': 50, 'zscore': 3.0, 'mad': 3.5, 'estacional': 3.5}
+# Filas anteriores con las que se compara cada lectura (zscore y mad)
+VENTANA = int(os.environ.get('VENTANA_ANOMALIAS', 30))
+# Filas por tramo al ordenar ventanas deslizantes, para acotar la memoria (filas x estaciones x ventana)
+FILAS_POR_TRAMO = 4096
+# Factor que hace a la MAD comparable con la desviación estándar en datos normales
+ESCALA_MAD = 0.6745
+
+
+def validar_metodo(metodo):
+    if metodo not in METODOS:
+        raise ValueError(f"Método de anomalías desconocido: {metodo}. Opciones: {', '.join(METODOS)}")
+    return metodo
+
+
+def rellenar_hacia_adelante(valores):
+    """ffill por columnas: cada NaN toma la última lectura válida anterior de su columna."""
+    filas = np.arange(len(valores))[:, None]
+    indice = np.where(np.isnan(valores), 0, filas)
+    np.maximum.accumulate(indice, axis=0, out=indice)
+    return np.take_along_axis(valores, indice, axis=0)
+
+
+def variacion_porcentual(valores, estado=None):
+    """
+    Variación % de cada lectura respecto a la última válida de su columna (pct_change sin
+    nulos). estado es la última lectura válida de cada columna en el bloque anterior.
+    """
+    if estado is None:
+        estado = np.full(valores.shape[1], np.nan)
+    llenos = rellenar_hacia_adelante(np.vstack([estado, valores]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variacion = (valores / llenos[:-1] - 1) * 100
+    variacion[np.isnan(valores)] = np.nan
+    return variacion, llenos[-1]
+
+
+def _con_previas(valores, estado, ventana):
+    """Las `ventana` filas anteriores (NaN si no hay) seguidas de las del bloque."""
+    previas = np.full((ventana, valores.shape[1]), np.nan)
+    if estado is not None and len(estado):
+        previas[-len(estado):] = estado[-ventana:]
+    extendido = np.vstack([previas, valores])
+    return extendido, extendido[-ventana:].copy()
+
+
+def zscore_movil(valores, ventana=VENTANA, estado=None):
+    """Puntaje z de cada lectura frente a la media y desviación de las `ventana` filas anteriores."""
+    extendido, siguiente = _con_previas(valores, estado, ventana)
+    validos = ~np.isnan(extendido)
+    # Se centra por columna antes de acumular para no perder precisión en las restas
+    centro = np.where(validos, extendido, 0).sum(axis=0) / np.maximum(validos.sum(axis=0), 1)
+    x = np.where(validos, extendido - centro, 0.0)
+    ceros = np.zeros((1, valores.shape[1]))
+    suma = np.vstack([ceros, np.cumsum(x, axis=0)])
+    suma2 = np.vstack([ceros, np.cumsum(x * x, axis=0)])
+    conteo = np.vstack([ceros, np.cumsum(validos, axis=0)])
+    # La ventana de la fila i del bloque son las filas [i, i + ventana) del arreglo extendido
+    n = len(valores)
+    inicio, fin = slice(0, n), slice(ventana, ventana + n)
+    c = conteo[fin] - conteo[inicio]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        media = (suma[fin] - suma[inicio]) / c
+        dispersion = (suma2[fin] - suma2[inicio]) - c * media ** 2
+        z = (valores - centro - media) / np.sqrt(dispersion / (c - 1))
+    # Ventanas con pocos datos o constantes (la dispersión no supera el error de las sumas acumuladas)
+    z[(c < max(2, ventana // 2)) | ~(dispersion > 1e-10 * suma2[fin])] = np.nan
+    return z, siguiente
+
+
+def _mediana_ordenada(ordenadas, conteo):
+    """Mediana de ventanas ya ordenadas (NaN al final) con `conteo` valores válidos cada una."""
+    bajo = np.maximum((conteo - 1) // 2, 0)[..., None]
+    alto = np.maximum(conteo // 2, 0)[..., None]
+    mediana = (np.take_along_axis(ordenadas, bajo, -1) + np.take_along_axis(ordenadas, alto, -1))[..., 0] / 2
+    mediana[conteo == 0] = np.nan
+    return mediana
+
+
+def mad_movil(valores, ventana=VENTANA, estado=None):
+    """Puntaje robusto 0.6745 * (x - mediana) / MAD sobre las `ventana` filas anteriores."""
+    extendido, siguiente = _con_previas(valores, estado, ventana)
+    # ventanas[i] son las `ventana` filas anteriores a la fila i del bloque (vista, sin copiar)
+    ventanas = sliding_window_view(extendido[:-1], ventana, axis=0)
+    puntaje = np.empty_like(valores)
+    minimo = max(2, ventana // 2)
+    for inicio in range(0, len(valores), FILAS_POR_TRAMO):
+        tramo = slice(inicio, inicio + FILAS_POR_TRAMO)
+        ordenadas = np.sort(ventanas[tramo], axis=-1)
+        conteo = (~np.isnan(ordenadas)).sum(axis=-1)
+        mediana = _mediana_ordenada(ordenadas, conteo)
+        desvios = np.sort(np.abs(ordenadas - mediana[..., None]), axis=-1)
+        mad = _mediana_ordenada(desvios, conteo)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = ESCALA_MAD * (valores[tramo] - mediana) / mad
+        z[(conteo < minimo) | ~(mad > 0)] = np.nan
+        puntaje[tramo] = z
+    return puntaje, siguiente
+
+
+def residuo_estacional(valores, meses, estado=None):
+    """
+    Residuo de cada lectura respecto al promedio de su mes del año (0-11 en meses), dividido
+    por la desviación estándar de los residuos de la estación. estado son las sumas por mes
+    (suma, suma de cuadrados, conteo) de los bloques anteriores; cada bloque se compara con la
+    climatología acumulada hasta él.
+    """
+    validos = ~np.isnan(valores)
+    x = np.where(validos, valores, 0.0)
+    # Matriz indicadora filas x 12: las sumas por mes salen de un producto matricial
+    indicador = np.zeros((len(valores), 12))
+    indicador[np.arange(len(valores)), meses] = 1
+    suma = indicador.T @ x
+    suma2 = indicador.T @ (x * x)
+    conteo = indicador.T @ validos
+    if estado is not None:
+        suma, suma2, conteo = suma + estado[0], suma2 + estado[1], conteo + estado[2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        media = suma / conteo
+        # Varianza del residuo: suma de cuadrados dentro de cada mes entre los grados de libertad
+        dentro = np.where(conteo > 0, suma2 - suma * media, 0).sum(axis=0)
+        libertad = conteo.sum(axis=0) - (conteo > 0).sum(axis=0)
+        desviacion = np.sqrt(np.maximum(dentro, 0) / libertad)
+        z = (valores - media[meses]) / desviacion
+    z[:, ~(desviacion > 0)] = np.nan
+    return z, (suma, suma2, conteo)
+
+
+def meses_del_anio(fechas):
+    """Mes del año (0-11) de un arreglo datetime64."""
+    fechas = np.asarray(fechas, dtype='datetime64[M]')
+    return (fechas.astype(int) % 12).astype(np.intp)
+
+
+def puntuar(valores, fechas=None, metodo=METODO_ANOMALIAS, ventana=VENTANA, estado=None):
+    """
+    Puntajes (filas x estaciones, NaN donde no aplica) del método y el estado para continuar
+    con el bloque siguiente. fechas (datetime64, en el orden de las filas) solo se usa en
+    el método estacional.
+    """
+    valores = np.asarray(valores, dtype=float)
+    validar_metodo(metodo)
+    if metodo == 'variacion':
+        return variacion_porcentual(valores, estado)
+    if metodo == 'zscore':
+        return zscore_movil(valores, ventana, estado)
+    if metodo == 'mad':
+        return mad_movil(valores, ventana, estado)
+    return residuo_estacional(valores, meses_del_anio(fechas), estado)
+
+
+def marcar(puntajes, umbral):
+    """Matriz booleana de anomalías: |puntaje| > umbral (los NaN nunca lo son)."""
+    with np.errstate(invalid='ignore'):
+        return np.abs(puntajes) > umbral
+
+
+def indices_por_columna(marcas):
+    """Filas marcadas de cada columna, como arreglos int32 (en una sola pasada de nonzero)."""
+    columnas, filas = np.nonzero(marcas.T)
+    cortes = np.searchsorted(columnas, np.arange(1, marcas.shape[1]))
+    return np.split(filas.astype(np.int32), cortes)
+
+
+def detectar(df, estaciones, metodo=METODO_ANOMALIAS, umbral=None, ventana=VENTANA):
+    """
+    Anomalías de todas las estaciones de df (columna Fecha y una columna por estación).
+    Devuelve (fechas ordenadas, matriz de puntajes, {estacion: índices de filas marcadas}).
+    """
+    ordenado = df.sort_values('Fecha', kind='stable')
+    fechas = ordenado['Fecha'].to_numpy()
+    puntajes, _ = puntuar(ordenado[list(estaciones)].to_numpy(dtype=float), fechas, metodo, ventana)
+    marcas = marcar(puntajes, UMBRALES[metodo] if umbral is None else umbral)
+    return fechas, puntajes, dict(zip(estaciones, indices_por_columna(marcas)))
+
+
+def formatear_fechas(fechas):
+    """Arreglo datetime64 a texto YYYY-MM-DD (mucho más rápido que strftime)."""
+    return np.datetime_as_string(np.asarray(fechas).astype('datetime64[D]'), unit='D')
+
+
+def registros_anomalias(fechas, variacion, puntaje=None):
+    """
+    Anomalías en el formato de las plantillas: [{'Fecha_str', 'variacion'}], más 'puntaje'
+    cuando el método no es la variación porcentual.
+    """
+    textos = formatear_fechas(fechas).tolist()
+    variacion = np.asarray(variacion).tolist()
+    if puntaje is None:
+        return [{'Fecha_str': f, 'variacion': v} for f, v in zip(textos, variacion)]
+    puntaje = np.asarray(puntaje).tolist()
+    return [{'Fecha_str': f, 'variacion': v, 'puntaje': p} for f, v, p in zip(textos, variacion, puntaje)]
@@ -1,82 +1,74 @@
+import hashlib
+import json
 import os
 import traceback # Asegúrate de que esto esté aquí
 import pandas as pd
-import requests
-from flask import Flask, render_template, request, send_file, jsonify, Response
+from flask import Flask, render_template, request, send_file, jsonify, Response, url_for, stream_with_context
 from werkzeug.utils import secure_filename
 from datetime import timedelta, datetime
-from prophet import Prophet
 from dotenv import load_dotenv
-import time # Añadir para los delays
+from trabajos import GestorTrabajos, COMPLETADO, ERROR
+from analisis import analizar_incremental, AcumuladorEstaciones
+from anomalias import validar_metodo, METODO_ANOMALIAS
+from ingesta import leer_excel, leer_por_bloques, hash_archivo, EXTENSIONES_POR_BLOQUES
+from almacen import almacen_lecturas, formato_ancho
+from almacen_resultados import almacen_resultados, almacen_trabajos
+from graficos import reducir_serie, histograma, METODOS
+from paginacion import leer_parametros, tabla_guardada, paginar
+from contexto_bot import contexto_actual
+from tiempo_real import detector_en_linea, leer_lote
+from pronostico import predecir_estaciones, calentar_en_segundo_plano, MOTOR_PRONOSTICO, PRONOSTICO_WORKERS
 load_dotenv()
-try:
-    from tqdm import tqdm
-except ImportError:
-    tqdm = lambda x, **kwargs: x
 
 app = Flask(__name__)
 
 # Configuración de la aplicación principal
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+# Los CSV/Parquet de telemetría pueden pesar cientos de MB; Werkzeug los vuelca a disco al recibirlos.
+# Este límite solo se aplica a la subida de archivos para análisis (POST /, ver limite_subida)
+MAX_SUBIDA_POR_BLOQUES = int(os.environ.get('MAX_CONTENT_LENGTH_MB', 1024)) * 1024 * 1024
+# Los Excel se cargan completos en memoria, así que mantienen el límite anterior
+MAX_EXCEL_BYTES = 16 * 1024 * 1024
+# Fechas faltantes y anomalías de ejemplo guardadas por estación al analizar por bloques
+MAX_FECHAS_POR_ESTACION = 1000
+# Fechas que se escriben en la página por estación; las series completas se piden como gráfico
+MAX_FECHAS_EN_PAGINA = 200
+# Límites de los datos de gráfico que devuelve /api/estaciones/<estacion>/grafico
+MAX_PUNTOS_GRAFICO = 5000
+MAX_BINS_GRAFICO = 200
+# Lecturas por petición a /api/lecturas y si, además de evaluarse en línea, se guardan en la tabla
+# lecturas_en_linea del almacén (aparte de las lecturas diarias; desactivado por defecto)
+MAX_LECTURAS_POR_LOTE = int(os.environ.get('TIEMPO_REAL_MAX_LOTE', 10000))
+GUARDAR_LECTURAS_EN_LINEA = os.environ.get('TIEMPO_REAL_GUARDAR', '0') == '1'
+# Motor de pronóstico ('armonico' o 'prophet') y procesos usados para ajustar Prophet (1 = en serie)
+app.config['MOTOR_PRONOSTICO'] = MOTOR_PRONOSTICO
+app.config['PRONOSTICO_WORKERS'] = PRONOSTICO_WORKERS
+# Método de detección de anomalías (ver METODOS en anomalias.py); por defecto la variación porcentual
+app.config['METODO_ANOMALIAS'] = validar_metodo(METODO_ANOMALIAS)
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-ALLOWED_EXTENSIONS = {'xlsx'}
+ALLOWED_EXTENSIONS = {'xlsx'} | EXTENSIONES_POR_BLOQUES
+
+# Estaciones esperadas; cualquier otra columna con el mismo formato (P + número) también se analiza
+ESTACIONES = ['P42', 'P43', 'P55']
+PATRON_ESTACION = r'^P\d+$'
 
 def allowed_file(filename):
     """Verifica si la extensión del archivo es permitida."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# --- Funciones de mantenimiento de Sensores ---
+def detectar_estaciones(df):
+    """Devuelve las estaciones presentes en el DataFrame: las esperadas y las adicionales."""
+    for estacion in ESTACIONES:
+        if estacion not in df.columns:
+            print(f"Advertencia: La columna '{estacion}' no se encontró en el archivo Excel.")
+    # Las cabeceras pueden no ser texto (p. ej. años como números en un CSV)
+    adicionales = [c for c in df.columns[df.columns.astype(str).str.match(PATRON_ESTACION)] if c not in ESTACIONES]
+    return [e for e in ESTACIONES if e in df.columns] + adicionales
 
-def preparar_serie_faltantes(df, estacion):
-    """Prepara una serie de tiempo para Prophet con datos faltantes por mes."""
-    df_tmp = df[['Fecha', estacion]].copy()
-    df_tmp['faltante'] = df_tmp[estacion].isna().astype(int)
-    df_tmp['mes'] = df_tmp['Fecha'].dt.to_period('M').dt.to_timestamp()
-    total_por_mes = df_tmp.groupby('mes').size()
-    faltantes_por_mes = df_tmp.groupby('mes')['faltante'].sum()
-    proporcion = (faltantes_por_mes / total_por_mes).reset_index()
-    proporcion.columns = ['ds', 'y']
-    return proporcion
-
-def predecir_faltantes(serie, umbral=0.01, meses_a_predecir=12):
-    if len(serie) < 3:
-        return []
-    model = Prophet(yearly_seasonality=True, weekly_seasonality=False, daily_seasonality=False)
-    model.fit(serie)
-    future = model.make_future_dataframe(periods=meses_a_predecir, freq='M')
-    forecast = model.predict(future)
-    
-    hoy = pd.to_datetime(datetime.today().date())
-    # CORRECCIÓN DE UNBOUNDLOCALERROR: Usa 'forecast' para el filtro inicial
-    predicciones_futuras = forecast[forecast['ds'] > hoy] 
-    
-    fechas_alerta = predicciones_futuras[predicciones_futuras['yhat'] > umbral]['ds'].dt.strftime('%Y-%m-%d').tolist()
-    return fechas_alerta
-
-def detectar_anomalias_y_tendencias(df, estacion, umbral_porcentaje=50):
-    """Detecta anomalías en los datos de una estación basándose en la variación porcentual."""
-    df_tmp = df[['Fecha', estacion]].dropna().copy()
-    df_tmp.sort_values('Fecha', inplace=True)
-    if not df_tmp.empty and len(df_tmp) > 1:
-        df_tmp['variacion'] = df_tmp[estacion].pct_change() * 100
-        df_tmp['tipo'] = df_tmp['variacion'].apply(lambda x: 'anomalía' if pd.notna(x) and abs(x) > umbral_porcentaje else 'normal')
-        df_tmp['Fecha_str'] = df_tmp['Fecha'].dt.strftime('%Y-%m-%d')
-        anomalias = df_tmp[df_tmp['tipo'] == 'anomalía'][['Fecha_str', 'variacion']].to_dict(orient='records')
-        return anomalias
-    return []
-
-def generar_reporte_mensual(df, estacion):
-    """Genera un reporte mensual resumido para una estación."""
-    df_tmp = df[['Fecha', estacion]].copy()
-    df_tmp['mes'] = df_tmp['Fecha'].dt.to_period('M').dt.to_timestamp()
-    resumen = df_tmp.groupby('mes').agg(total=('Fecha', 'count'),
-                                         faltantes=(estacion, lambda x: x.isna().sum()),
-                                         promedio=(estacion, 'mean')).reset_index()
-    resumen['porcentaje_faltantes'] = (resumen['faltantes'] / resumen['total']) * 100
-    return resumen
+# --- Funciones de mantenimiento de Sensores ---
 
 def generar_recomendaciones(estacion, datos):
     recomendaciones = []
@@ -84,6 +76,7 @@ def generar_recomendaciones(estacion, datos):
     porcentaje = datos.get('porcentaje', 0)
     fechas_faltantes = datos.get('fechas_faltantes', [])
     anomalias = datos.get('fechas_anomalias', [])
+    total_anomalias = datos.get('total_anomalias', len(anomalias))
     estado = datos.get('estado', 'ok')
     fechas_mantenimiento = datos.get('fechas_mantenimiento', [])
 
@@ -110,7 +103,7 @@ def generar_recomendaciones(estacion, datos):
         recomendaciones.append(f"🛠️ Próximo mantenimiento predictivo recomendado para el sensor {estacion}: {prox_fecha}.")
 
     if anomalias:
-        recomendaciones.append(f"⚠️ Se detectaron {len(anomalias)} anomalías en los datos de {estacion}.")
+        recomendaciones.append(f"⚠️ Se detectaron {total_anomalias} anomalías en los datos de {estacion}.")
         muestra = ', '.join([f"{a['Fecha_str']} ({a['variacion']:.1f}%)" for a in anomalias[:3]])
         recomendaciones.append(f"📊 Ejemplos de anomalías: {muestra}.")
         recomendaciones.append("🔧 Validar calibración del sensor y eventos climáticos extremos en esas fechas.")
@@ -118,92 +111,179 @@ def generar_recomendaciones(estacion, datos):
     recomendaciones.append("📁 Registrar en bitácora todas las acciones realizadas.")
     return recomendaciones
 
+def construir_resultados(analisis):
+    """Completa el análisis de cada estación con pronóstico, estado y recomendaciones."""
+    estaciones = list(analisis)
+
+    # Los pronósticos de todas las estaciones se calculan juntos (en paralelo con Prophet)
+    series = {estacion: analisis[estacion]['serie_faltantes'] for estacion in estaciones}
+    predicciones = predecir_estaciones(series, umbral=0.01,
+                                       max_workers=app.config['PRONOSTICO_WORKERS'],
+                                       motor=app.config['MOTOR_PRONOSTICO'])
+
+    resultados = {}
+    for estacion in estaciones:
+        datos = analisis[estacion]
+        datos_faltantes = datos['faltantes']
+        total = datos['total']
+        porcentaje = datos['porcentaje']
+        fechas_faltantes = datos['fechas_faltantes']
+        fechas_mantenimiento_predictivas = predicciones[estacion]
+        anomalias = datos['fechas_anomalias']
+        total_anomalias = datos.get('total_anomalias', len(anomalias))
+        estado = 'ok'
+        if porcentaje > 30 and datos_faltantes > 0:
+            estado = 'critico'
+        elif porcentaje > 20 or total_anomalias > 0:
+            estado = 'riesgo'
+
+        resultados[estacion] = {
+            'total': total,
+            'faltantes': datos_faltantes,
+            'porcentaje': porcentaje,
+            'fechas_faltantes': fechas_faltantes,
+            'fechas_mantenimiento': fechas_mantenimiento_predictivas,
+            'fechas_anomalias': anomalias,
+            'total_anomalias': total_anomalias,
+            'estado': estado,
+            'alerta': estado in ['riesgo', 'critico'],
+            'reporte_mensual': datos['reporte_mensual'].to_dict(orient='records'),
+            'recomendaciones': generar_recomendaciones(estacion, {
+                'porcentaje': porcentaje,
+                'fechas_faltantes': fechas_faltantes,
+                'fechas_anomalias': anomalias,
+                'total_anomalias': total_anomalias,
+                'estado': estado,
+                'fechas_mantenimiento': fechas_mantenimiento_predictivas
+            })
+        }
+    return resultados
+
 def analizar_excel(filepath):
     """Analiza el archivo Excel para obtener el estado de los sensores."""
     try:
-        df = pd.read_excel(filepath, engine='openpyxl')
+        df = leer_excel(filepath)
     except Exception as e:
         print(f"Error al leer el archivo Excel: {e}")
         return {}, "Error al leer el archivo Excel. Asegúrate de que sea un formato válido."
 
-    df.columns = df.columns.str.strip()
-    df['Fecha'] = pd.to_datetime(df['Fecha'])
-    resultados = {}
-    for estacion in ['P42', 'P43', 'P55']:
-        if estacion in df.columns:
-            datos_faltantes = df[estacion].isna().sum()
-            total = df[estacion].shape[0]
-            porcentaje = (datos_faltantes / total) * 100
-            fechas_faltantes = df[df[estacion].isna()]['Fecha'].dt.strftime('%Y-%m-%d').tolist()
-            serie = preparar_serie_faltantes(df, estacion)
-            fechas_mantenimiento_predictivas = predecir_faltantes(serie, umbral=0.01)
-            anomalias = detectar_anomalias_y_tendencias(df, estacion)
-            estado = 'ok'
-            if porcentaje > 30 and datos_faltantes > 0:
-                estado = 'critico'
-            elif porcentaje > 20 or len(anomalias) > 0:
-                estado = 'riesgo'
-
-            resultados[estacion] = {
-                'total': total,
-                'faltantes': datos_faltantes,
-                'porcentaje': porcentaje,
-                'fechas_faltantes': fechas_faltantes,
-                'fechas_mantenimiento': fechas_mantenimiento_predictivas,
-                'fechas_anomalias': anomalias,
-                'estado': estado,
-                'alerta': estado in ['riesgo', 'critico'],
-                'reporte_mensual': generar_reporte_mensual(df, estacion).to_dict(orient='records'),
-                'recomendaciones': generar_recomendaciones(estacion, {
-                    'porcentaje': porcentaje,
-                    'fechas_faltantes': fechas_faltantes,
-                    'fechas_anomalias': anomalias,
-                    'estado': estado,
-                    'fechas_mantenimiento': fechas_mantenimiento_predictivas
-                })
-            }
-        else:
-            print(f"Advertencia: La columna '{estacion}' no se encontró en el archivo Excel.")
-    return resultados, None
-
-# --- Funciones de clima ---
-
-TIMEZONE = 'America/Guayaquil'
-SENSORES_COORDS = {
-    'P42': {'lat': -0.6022867145410288, 'lon': -78.1986689291808},
-    'P43': {'lat': -0.5934839659614135, 'lon': -78.20825370752031},
-    'P55': {'lat': -0.5731364867736277, 'lon': -78.138},
-}
-
-def consultar_clima(fecha, lat, lon):
-    fecha_str = fecha.strftime('%Y-%m-%d')
-    url = (
-        f"https://archive-api.open-meteo.com/v1/archive"
-        f"?latitude={lat}&longitude={lon}"
-        f"&start_date={fecha_str}&end_date={fecha_str}"
-        f"&daily=precipitation_sum,windspeed_10m_max,temperature_2m_max"
-        f"&timezone={TIMEZONE}"
-    )
+    estaciones = detectar_estaciones(df)
+
+    # Conteos, reportes mensuales, series y anomalías de todas las estaciones en una pasada;
+    # si el libro ya se analizó con menos filas, solo se procesan las añadidas
+    analisis = analizar_incremental(df, estaciones, metodo=app.config['METODO_ANOMALIAS'])
+    return construir_resultados(analisis), None
+
+def analizar_por_bloques(filepath):
+    """
+    Analiza un CSV o Parquet por bloques de filas, con memoria acotada: solo se mantienen
+    los agregados mensuales y hasta MAX_FECHAS_POR_ESTACION fechas de ejemplo por estación.
+    """
+    acumulador = None
     try:
-        r = requests.get(url)
-        r.raise_for_status()
-        data = r.json()
-        if 'daily' in data and data['daily']:
-            return {
-                "precipitacion_mm": data['daily']['precipitation_sum'][0],
-                "viento_max_kmh": data['daily']['windspeed_10m_max'][0],
-                "temperatura_max": data['daily']['temperature_2m_max'][0]
-            }
+        for bloque in leer_por_bloques(filepath):
+            if acumulador is None:
+                if 'Fecha' not in bloque.columns:
+                    return {}, "El archivo debe tener una columna 'Fecha'."
+                acumulador = AcumuladorEstaciones(detectar_estaciones(bloque),
+                                                  max_fechas=MAX_FECHAS_POR_ESTACION,
+                                                  metodo=app.config['METODO_ANOMALIAS'])
+            acumulador.agregar(bloque)
+    except Exception as e:
+        print(f"Error al leer el archivo por bloques: {e}")
+        traceback.print_exc()
+        return {}, "Error al leer el archivo. Asegúrate de que sea un CSV o Parquet válido."
+
+    if acumulador is None:
+        return {}, "El archivo está vacío."
+    return construir_resultados(acumulador.resultados()), None
+
+def guardar_lecturas(filepath, huella):
+    """
+    Guarda en el almacén las lecturas de un archivo subido, salvo que sea lo último que se guardó
+    (mismo contenido). Se hace fuera del análisis compartido, que puede venir de la caché; un
+    fallo aquí no impide el análisis.
+    """
+    if almacen_lecturas.importado(huella):
+        return
+    try:
+        if filepath.rsplit('.', 1)[-1].lower() in EXTENSIONES_POR_BLOQUES:
+            estaciones = None
+            for bloque in leer_por_bloques(filepath):
+                if 'Fecha' not in bloque.columns:
+                    return
+                estaciones = estaciones if estaciones is not None else detectar_estaciones(bloque)
+                almacen_lecturas.escribir(bloque, estaciones)
         else:
-            print(f"Advertencia: Datos incompletos para {fecha_str}.")
-            return {"precipitacion_mm": None, "viento_max_kmh": None, "temperatura_max": None}
+            df = leer_excel(filepath)
+            if 'Fecha' not in df.columns:
+                return
+            almacen_lecturas.escribir(df, detectar_estaciones(df))
+        almacen_lecturas.registrar_importacion(huella)
     except Exception as e:
-        print(f"Error consultando clima para {fecha_str}: {e}")
-        return {"precipitacion_mm": None, "viento_max_kmh": None, "temperatura_max": None}
+        print(f"Error al guardar las lecturas en el almacén: {e}")
+        traceback.print_exc()
+
+def analizar_almacen(desde=None, hasta=None):
+    """Analiza las lecturas guardadas en el almacén para un rango de fechas, sin leer ningún archivo."""
+    partes = {e: df for e, df in almacen_lecturas.consultar_por_estacion(desde=desde, hasta=hasta).items() if not df.empty}
+    if not partes:
+        return {}, "No hay lecturas guardadas en el rango de fechas seleccionado."
+    # Cada estación se analiza sobre sus propias fechas: una fecha en la que solo otra estación
+    # tiene lectura no cuenta como faltante
+    analisis = {}
+    for estacion in detectar_estaciones(pd.DataFrame(columns=['Fecha', *partes])):
+        analisis.update(analizar_incremental(partes[estacion], [estacion], metodo=app.config['METODO_ANOMALIAS']))
+    return construir_resultados(analisis), None
+
+def inicio_del_dia():
+    """
+    Los resultados guardados valen solo durante el día en que se calcularon: las alertas del
+    pronóstico dependen de la fecha actual.
+    """
+    return datetime.combine(datetime.now().date(), datetime.min.time()).timestamp()
 
-global_climate_data_df = None
-global_sensor_analysis_results = {}
-last_processed_excel_data = []
+def analisis_compartido(clave, calcular):
+    """
+    (resultados, error) guardados en el almacén compartido bajo clave; si no existen (o son de
+    otro día) se calculan una sola vez aunque varios workers los pidan a la vez.
+    """
+    # Los errores (p. ej. un archivo ilegible) no se guardan: la siguiente petición lo reintenta
+    return almacen_resultados.obtener_o_calcular(clave, calcular, vigente_desde=inicio_del_dia(),
+                                                 guardar_si=lambda valor: valor[1] is None)
+
+def ultimos_datos_clima():
+    """Registros de la última tabla de clima calculada en cualquier worker, o []."""
+    entrada = almacen_resultados.ultimo('clima:')
+    return entrada.valor if entrada is not None else []
+
+def rango_fechas_solicitado(parametros):
+    """Lee desde/hasta (YYYY-MM-DD) de los parámetros de la petición; ValueError si no son válidos."""
+    rango = []
+    for nombre in ('desde', 'hasta'):
+        valor = parametros.get(nombre)
+        rango.append(pd.Timestamp(datetime.strptime(valor, '%Y-%m-%d')) if valor else None)
+    return tuple(rango)
+
+def archivo_demasiado_grande(filepath):
+    """Los Excel se cargan completos en memoria: por encima de MAX_EXCEL_BYTES no se leen."""
+    extension = filepath.rsplit('.', 1)[-1].lower()
+    return extension not in EXTENSIONES_POR_BLOQUES and os.path.getsize(filepath) > MAX_EXCEL_BYTES
+
+def analizar_archivo(filepath):
+    """Elige el análisis según la extensión: Excel en memoria, CSV/Parquet por bloques."""
+    if filepath.rsplit('.', 1)[-1].lower() in EXTENSIONES_POR_BLOQUES:
+        return analizar_por_bloques(filepath)
+    if archivo_demasiado_grande(filepath):
+        return {}, (f"El archivo Excel supera {MAX_EXCEL_BYTES // (1024 * 1024)} MB. "
+                    "Para archivos grandes usa CSV o Parquet.")
+    return analizar_excel(filepath)
+
+@app.before_request
+def limite_subida():
+    """Amplía el tamaño máximo de la petición solo en la subida que admite CSV/Parquet."""
+    if request.endpoint == 'index' and request.method == 'POST':
+        request.max_content_length = MAX_SUBIDA_POR_BLOQUES
 
 # --- Rutas de la Aplicación ---
 
@@ -212,7 +292,6 @@ def index():
     """
     Ruta principal para la carga de archivos Excel y visualización de mantenimiento de sensores.
     """
-    global global_sensor_analysis_results
     resultados = {}
     error = None
     if request.method == 'POST':
@@ -221,86 +300,101 @@ def index():
             filename = secure_filename(file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             file.save(filepath)
-            resultados, error = analizar_excel(filepath)
-            global_sensor_analysis_results = resultados
+            huella = hash_archivo(filepath)
+            if not archivo_demasiado_grande(filepath):
+                guardar_lecturas(filepath, huella)
+            # El mismo contenido se analiza una vez para todos los workers
+            clave = f"analisis:archivo:{huella}:{app.config['MOTOR_PRONOSTICO']}:{app.config['METODO_ANOMALIAS']}"
+            resultados, error = analisis_compartido(clave, lambda: analizar_archivo(filepath))
         else:
             error = "Tipo de archivo no permitido o ningún archivo seleccionado."
-    return render_template('index.html', resultados=resultados, error=error)
+    elif 'desde' in request.args or 'hasta' in request.args:
+        # Consulta de un rango de fechas sobre las lecturas ya guardadas (vacío = sin límite)
+        try:
+            desde, hasta = rango_fechas_solicitado(request.args)
+        except ValueError:
+            error = "Las fechas deben tener el formato AAAA-MM-DD."
+        else:
+            clave = f"analisis:almacen:{almacen_lecturas.version()}:{desde}:{hasta}:{app.config['MOTOR_PRONOSTICO']}:{app.config['METODO_ANOMALIAS']}"
+            resultados, error = analisis_compartido(clave, lambda: analizar_almacen(desde, hasta))
+    return render_template('index.html', resultados=resultados, error=error, limite_fechas=MAX_FECHAS_EN_PAGINA,
+                           extensiones=sorted(ALLOWED_EXTENSIONS, key=['xlsx', 'csv', 'parquet'].index))
 
-@app.route('/datos-climaticos')
-def datos_climaticos_page():
-    global last_processed_excel_data
-    upload_folder = os.path.abspath(app.config.get('UPLOAD_FOLDER', 'uploads'))
-    os.makedirs(upload_folder, exist_ok=True)
+EXCEL_CLIMA_FIJO = os.path.join('data', 'Precipitacion_Mensual__P42_P43_P5522062025222139.xlsx')
 
-    excel_path_fijo = os.path.join('data', 'Precipitacion_Mensual__P42_P43_P5522062025222139.xlsx')
+def publicar_trabajo(trabajo):
+    """Copia el estado del trabajo al almacén compartido para que cualquier worker lo consulte."""
+    almacen_trabajos.guardar(f"trabajo:{trabajo['id']}", trabajo)
 
-    df_fijo = pd.DataFrame() # Inicializar como DataFrame vacío
-    
-    if os.path.exists(excel_path_fijo):
+gestor_trabajos = GestorTrabajos(publicar=publicar_trabajo)
+
+# Cada trabajo de clima escribe su propio Excel; se conservan los más recientes
+MAX_REPORTES_CLIMA = int(os.environ.get('MAX_REPORTES_CLIMA', 20))
+
+def recortar_reportes_clima(upload_folder, conservar=MAX_REPORTES_CLIMA):
+    """Borra los Excel de clima_faltantes_*.xlsx más antiguos, dejando los conservar más recientes."""
+    rutas = [os.path.join(upload_folder, nombre) for nombre in os.listdir(upload_folder)
+             if nombre.startswith('clima_faltantes_') and nombre.endswith('.xlsx')]
+    for ruta in sorted(rutas, key=os.path.getmtime, reverse=True)[conservar:]:
         try:
-            df_fijo = pd.read_excel(excel_path_fijo)
-            df_fijo['Fecha'] = pd.to_datetime(df_fijo['Fecha'], dayfirst=True)
-            print(f"Archivo Excel fijo leído correctamente para datos climáticos. Shape: {df_fijo.shape}")
-        except Exception as e:
-            print(f"Error al leer el archivo Excel fijo para datos climáticos: {e}")
-            traceback.print_exc()
-            # Si hay un error al leer el archivo fijo, aún podemos usar los datos procesados anteriormente
-            if last_processed_excel_data:
-                print("INFO: Usando los últimos datos procesados por Streamlit para la tabla debido a error en archivo fijo.")
-                return render_template('resultado.html', datos=last_processed_excel_data)
-            else:
-                return "Error: El archivo Excel de precipitaciones no se pudo leer y no hay datos previos para mostrar.", 500
-    else:
-        print(f"Error: Archivo Excel no encontrado en {excel_path_fijo}. No se cargan datos fijos.")
-        # Si el archivo fijo no existe, intentamos cargar desde `last_processed_excel_data`
-        # si hay datos de una carga anterior por Streamlit.
-        if last_processed_excel_data:
-            print("INFO: Usando los últimos datos procesados por Streamlit para la tabla.")
-            return render_template('resultado.html', datos=last_processed_excel_data)
-        else:
-            return "Error: El archivo Excel de precipitaciones no se encontró en el servidor y no hay datos previos para mostrar.", 500
+            os.remove(ruta)
+        except OSError as e:
+            print(f"No se pudo borrar el reporte {ruta}: {e}")
+
 
+SENSORES_CLIMA = ['P42', 'P43', 'P55']
 
-    sensores = ['P42', 'P43', 'P55']
+
+def procesar_datos_climaticos(desde, hasta, upload_folder, progreso=None, archivo='faltantes_resultado.xlsx'):
+    """
+    Completa con datos climáticos las fechas faltantes de las lecturas guardadas en el rango
+    [desde, hasta], guarda el reporte en upload_folder/archivo y devuelve los registros para
+    la tabla de resultado.html.
+    """
+    # requests y el cliente de clima se importan al primer uso, no al arrancar
+    from clima import consultar_clima_lote, completar_filas_con_clima, cliente_clima
+    from cache_clima import cache_clima
+
+    if progreso is None:
+        progreso = lambda *args, **kwargs: None
+
+    progreso(0, 1, "Consultando lecturas")
+    guardadas = almacen_lecturas.estaciones()
+    partes = almacen_lecturas.consultar_por_estacion([s for s in SENSORES_CLIMA if s in guardadas], desde, hasta)
+    df_fijo = formato_ancho(partes)
+    print(f"Lecturas consultadas del almacén para datos climáticos. Shape: {df_fijo.shape}")
+
+    sensores = SENSORES_CLIMA
     fechas_faltantes = []
 
-    # Solo procesa si df_fijo no está vacío después del intento de carga
-    if not df_fijo.empty:
-        for sensor in sensores:
-            if sensor in df_fijo.columns:
-                faltantes = df_fijo[df_fijo[sensor].isna()][['Fecha']].copy()
-                faltantes['Sensor'] = sensor
-                fechas_faltantes.append(faltantes)
-            else:
-                print(f"Advertencia: El sensor '{sensor}' no se encontró en las columnas del Excel fijo.")
+    for sensor in sensores:
+        if sensor in partes:
+            # Solo los faltantes guardados del sensor, no las fechas en que no tiene fila
+            lecturas = partes[sensor]
+            faltantes = lecturas[lecturas[sensor].isna()][['Fecha']].copy()
+            faltantes['Sensor'] = sensor
+            fechas_faltantes.append(faltantes)
+        else:
+            print(f"Advertencia: El sensor '{sensor}' no tiene lecturas en el almacén.")
 
     if not fechas_faltantes:
-        print("INFO: No hay datos faltantes en el archivo Excel fijo o el archivo está vacío. Mostrando tabla vacía.")
-        # Si no hay faltantes, aún podemos mostrar una tabla vacía o los últimos datos procesados
-        if last_processed_excel_data:
-            return render_template('resultado.html', datos=last_processed_excel_data)
-        else:
-            return render_template('resultado.html', datos=[])
+        print("INFO: No hay lecturas de los sensores en el rango seleccionado. Mostrando tabla vacía.")
+        # Si no hay faltantes, aún podemos mostrar los últimos datos procesados
+        return ultimos_datos_clima()
 
     faltantes_total = pd.concat(fechas_faltantes).reset_index(drop=True)
     faltantes_total = faltantes_total.drop_duplicates(subset=['Fecha', 'Sensor']).reset_index(drop=True)
 
-    climas = []
-    print(f"Consultando clima para {len(faltantes_total)} fechas con datos faltantes (desde archivo fijo)...")
-    for _, row in tqdm(faltantes_total.iterrows(), total=len(faltantes_total), desc="Consultando clima"):
-        coords = SENSORES_COORDS.get(row['Sensor'])
-        if coords:
-            clima = consultar_clima(row['Fecha'], coords['lat'], coords['lon'])
-        else:
-            clima = {"precipitacion_mm": None, "viento_max_kmh": None, "temperatura_max": None}
-        clima['Fecha'] = row['Fecha']
-        clima['Sensor'] = row['Sensor']
-        climas.append(clima)
-        time.sleep(0.1) # Pausa para evitar rate limits
-
-    df_clima = pd.DataFrame(climas)
+    # Pasos: un avance por sensor consultado, más interpolación y escritura del Excel
+    total_pasos = len(fechas_faltantes) + 2
+    progreso(0, total_pasos, "Consultando clima")
+    print(f"Consultando clima para {len(faltantes_total)} fechas con datos faltantes (desde el almacén)...")
+    df_clima = consultar_clima_lote(
+        faltantes_total,
+        progreso=lambda listos, total, mensaje: progreso(listos, total_pasos, mensaje),
+    )
 
+    progreso(total_pasos - 2, total_pasos, "Interpolando valores")
     faltantes_total['Fecha'] = pd.to_datetime(faltantes_total['Fecha'])
     df_clima['Fecha'] = pd.to_datetime(df_clima['Fecha'])
 
@@ -317,25 +411,15 @@ def datos_climaticos_page():
     resultado_df.reset_index(inplace=True)
 
     datos_para_tabla = resultado_df.to_dict(orient='records')
-    last_processed_excel_data = datos_para_tabla # Guardar para futuras cargas
 
-    output_excel_path_fijo = os.path.join(upload_folder, 'faltantes_resultado.xlsx')
+    progreso(total_pasos - 1, total_pasos, "Guardando archivo Excel")
+    output_excel_path_fijo = os.path.join(upload_folder, archivo)
     
     try:
         with pd.ExcelWriter(output_excel_path_fijo, engine='xlsxwriter') as writer:
             df_fijo.to_excel(writer, sheet_name='Original', index=False)
 
-            df_completado_filas = df_fijo.copy()
-            if not resultado_df.empty:
-                for _, row in resultado_df.iterrows():
-                    fecha = row['Fecha']
-                    sensor = row['Sensor']
-                    valor_precipitacion = row['precipitacion_mm']
-                    if pd.notna(valor_precipitacion) and \
-                       fecha in df_completado_filas['Fecha'].values and \
-                       sensor in df_completado_filas.columns:
-                        df_completado_filas.loc[df_completado_filas['Fecha'] == fecha, sensor] = valor_precipitacion
-
+            df_completado_filas = completar_filas_con_clima(df_fijo, resultado_df)
             df_completado_filas.to_excel(writer, sheet_name='Completado_Filas', index=False)
             resultado_df.to_excel(writer, sheet_name='Detalle_Clima_Relleno', index=False)
 
@@ -344,14 +428,239 @@ def datos_climaticos_page():
         print(f"Error al guardar el archivo Excel de resultados en datos_climaticos_page: {e}")
         traceback.print_exc()
 
-    return render_template('resultado.html', datos=datos_para_tabla)
+    estadisticas = {'cache_clima': cache_clima.estadisticas(), 'cliente_clima': cliente_clima.estadisticas()}
+    print(f"Caché de clima (acumulado del proceso): {estadisticas['cache_clima']}")
+    print(f"Cliente de clima (acumulado del proceso): {estadisticas['cliente_clima']}")
+    progreso(total_pasos, total_pasos, "Completado", detalles=estadisticas)
+    return datos_para_tabla
+
+
+def procesar_clima_compartido(clave, desde, hasta, upload_folder, progreso=None, trabajo_id=None):
+    """
+    procesar_datos_climaticos con el resultado guardado bajo clave en el almacén compartido:
+    si otro worker ya lo está calculando, se espera a su resultado en lugar de repetirlo.
+    El Excel se escribe en clima_faltantes_<trabajo_id>.xlsx y su nombre se guarda bajo
+    reporte:<clave> para descargarlo desde cualquier worker.
+    """
+    archivo = f"clima_faltantes_{trabajo_id}.xlsx"
+
+    def calcular():
+        datos = procesar_datos_climaticos(desde, hasta, upload_folder, progreso, archivo)
+        almacen_resultados.guardar(f"reporte:{clave}", archivo, max_versiones=1)
+        recortar_reportes_clima(upload_folder)
+        return datos
+
+    return almacen_resultados.obtener_o_calcular(clave, calcular)
+
+
+def clave_clima(desde=None, hasta=None):
+    """Clave del resultado de clima para un rango; cambia cuando cambian las lecturas guardadas."""
+    # La primera vez el almacén se inicializa con el archivo fijo de data/
+    almacen_lecturas.importar_si_vacio(EXCEL_CLIMA_FIJO, SENSORES_CLIMA, dayfirst=True)
+    return f"clima:{almacen_lecturas.version()}:{desde}:{hasta}"
+
+
+def enviar_trabajo_clima(desde=None, hasta=None, clave=None):
+    """
+    Encola el procesamiento de clima para un rango de fechas. Mientras el almacén no cambie,
+    las peticiones para el mismo rango comparten trabajo.
+    """
+    upload_folder = os.path.abspath(app.config.get('UPLOAD_FOLDER', 'uploads'))
+    os.makedirs(upload_folder, exist_ok=True)
+    clave = clave or clave_clima(desde, hasta)
+    return gestor_trabajos.enviar(clave, procesar_clima_compartido, clave, desde, hasta, upload_folder)
+
+
+def obtener_trabajo(trabajo_id):
+    """
+    Estado del trabajo como dict: de la tabla local o, si lo creó otro worker, del almacén
+    compartido. None si no existe.
+    """
+    trabajo = gestor_trabajos.obtener(trabajo_id)
+    if trabajo is not None:
+        return trabajo.a_dict()
+    entrada = almacen_trabajos.obtener(f"trabajo:{trabajo_id}")
+    return entrada.valor if entrada is not None else None
+
+
+def registros_json(datos):
+    """Convierte los registros de la tabla de clima a valores serializables en JSON."""
+    registros = []
+    for fila in datos:
+        registro = {}
+        for clave, valor in fila.items():
+            if isinstance(valor, (pd.Timestamp, datetime)):
+                valor = valor.strftime('%Y-%m-%d')
+            elif valor is not None and pd.isna(valor):
+                valor = None
+            registro[clave] = valor
+        registros.append(registro)
+    return registros
+
+
+def pagina_resultado(ultimo=False, trabajo=None, clave=None):
+    """
+    resultado.html sin filas: la tabla se carga por páginas desde /api/datos-climaticos para la
+    entrada que se muestra (clave y versión), de modo que las páginas siguientes no dependen de
+    escrituras posteriores en el almacén. clave es la del resultado del rango o, con ultimo, la de
+    la última tabla calculada.
+    """
+    entrada = None
+    if trabajo is None:
+        entrada = almacen_resultados.ultimo('clima:') if ultimo else almacen_resultados.obtener(clave)
+    url_datos = None
+    if entrada is not None:
+        url_datos = url_for('api_datos_climaticos', clave=entrada.clave, version=entrada.version)
+        clave = entrada.clave
+    url_descarga = url_for('descargar_faltantes', clave=clave)
+    return render_template('resultado.html', url_datos=url_datos, url_descarga=url_descarga, trabajo=trabajo)
+
+
+@app.route('/datos-climaticos')
+def datos_climaticos_page():
+    try:
+        desde, hasta = rango_fechas_solicitado(request.args)
+    except ValueError:
+        return "Error: Las fechas deben tener el formato AAAA-MM-DD.", 400
+
+    if almacen_lecturas.vacio() and not os.path.exists(EXCEL_CLIMA_FIJO):
+        print(f"Error: Archivo Excel no encontrado en {EXCEL_CLIMA_FIJO} y el almacén de lecturas está vacío.")
+        # Si el archivo fijo no existe, intentamos mostrar la última tabla procesada
+        datos_previos = ultimos_datos_clima()
+        if datos_previos:
+            print("INFO: Usando los últimos datos procesados para la tabla.")
+            return pagina_resultado(ultimo=True)
+        else:
+            return "Error: El archivo Excel de precipitaciones no se encontró en el servidor y no hay datos previos para mostrar.", 500
+
+    # Si algún worker ya calculó este rango, se muestra sin encolar nada
+    clave = clave_clima(desde, hasta)
+    entrada = almacen_resultados.obtener(clave)
+    if entrada is not None:
+        return pagina_resultado(clave=clave)
+
+    trabajo = enviar_trabajo_clima(desde, hasta, clave)
+
+    if trabajo.estado == COMPLETADO:
+        return pagina_resultado(clave=clave)
+
+    if trabajo.estado == ERROR:
+        # Si hubo un error al procesar el archivo fijo, aún podemos usar los datos procesados anteriormente
+        datos_previos = ultimos_datos_clima()
+        if datos_previos:
+            print("INFO: Usando los últimos datos procesados para la tabla debido a error en archivo fijo.")
+            return pagina_resultado(ultimo=True)
+        else:
+            return "Error: El archivo Excel de precipitaciones no se pudo leer y no hay datos previos para mostrar.", 500
+
+    # El trabajo sigue en curso: la página consulta el progreso y se recarga al terminar
+    return pagina_resultado(trabajo=trabajo.a_dict(), clave=clave)
+
+
+@app.route('/api/datos-climaticos')
+def api_datos_climaticos():
+    """
+    Una página de la tabla de clima con clave/version (las que pone pagina_resultado en la página),
+    o del rango desde/hasta, o la última calculada con ultimo=1.
+    Parámetros: pagina, por_pagina, orden ('columna' o '-columna'), sensor, fecha_desde, fecha_hasta.
+    """
+    try:
+        desde, hasta = rango_fechas_solicitado(request.args)
+    except ValueError:
+        return jsonify({"error": "Las fechas deben tener el formato AAAA-MM-DD."}), 400
+    try:
+        parametros = leer_parametros(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    clave = request.args.get('clave')
+    if clave:
+        if not clave.startswith('clima:'):
+            return jsonify({"error": "Clave no válida."}), 400
+        tabla = tabla_guardada(almacen_resultados, clave, request.args.get('version', type=int))
+    elif request.args.get('ultimo'):
+        ultima = almacen_resultados.ultima_version('clima:')
+        tabla = tabla_guardada(almacen_resultados, *ultima) if ultima is not None else None
+    else:
+        tabla = tabla_guardada(almacen_resultados, clave_clima(desde, hasta))
+    if tabla is None:
+        return jsonify({"error": "La tabla de clima de este rango todavía no se ha calculado."}), 404
+    return jsonify(paginar(tabla, **parametros))
+
+
+@app.route('/datos-climaticos/trabajos', methods=['POST'])
+def crear_trabajo_clima():
+    """
+    Encola el relleno climático. Si se envía un Excel, sus lecturas se guardan en el almacén
+    y se procesa su rango de fechas; si no, el rango desde/hasta indicado (o todo el almacén).
+    """
+    try:
+        desde, hasta = rango_fechas_solicitado(request.values)
+    except ValueError:
+        return jsonify({"error": "Las fechas deben tener el formato AAAA-MM-DD."}), 400
+
+    file = request.files.get('file')
+    if file and file.filename:
+        if not file.filename.lower().endswith('.xlsx'):
+            return jsonify({"error": "Tipo de archivo no permitido."}), 400
+        excel_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file.filename))
+        file.save(excel_path)
+        try:
+            df = leer_excel(excel_path, dayfirst=True)
+        except ValueError as e:
+            print(f"Fechas no válidas en {excel_path}: {e}")
+            return jsonify({"error": "La columna 'Fecha' tiene valores que no son fechas."}), 400
+        if 'Fecha' not in df.columns or df['Fecha'].isna().all():
+            return jsonify({"error": "El archivo debe tener una columna 'Fecha' con fechas válidas."}), 400
+        almacen_lecturas.escribir(df, [s for s in SENSORES_CLIMA if s in df.columns])
+        desde, hasta = df['Fecha'].min(), df['Fecha'].max()
+    elif almacen_lecturas.vacio() and not os.path.exists(EXCEL_CLIMA_FIJO):
+        return jsonify({"error": "No se envió archivo y no hay lecturas guardadas."}), 400
+
+    trabajo = enviar_trabajo_clima(desde, hasta)
+    return jsonify(trabajo.a_dict()), 202
+
+
+@app.route('/datos-climaticos/trabajos/<trabajo_id>')
+def estado_trabajo_clima(trabajo_id):
+    trabajo = obtener_trabajo(trabajo_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo no encontrado."}), 404
+    return jsonify(trabajo)
+
+
+@app.route('/datos-climaticos/trabajos/<trabajo_id>/resultado')
+def resultado_trabajo_clima(trabajo_id):
+    trabajo = obtener_trabajo(trabajo_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo no encontrado."}), 404
+    if trabajo['estado'] == ERROR:
+        return jsonify({"error": trabajo['error']}), 500
+    if trabajo['estado'] != COMPLETADO:
+        return jsonify(trabajo), 409
+    # El resultado se guarda bajo la clave del trabajo, así que cualquier worker lo puede servir
+    entrada = almacen_resultados.obtener(trabajo['clave'])
+    if entrada is None:
+        return jsonify({"error": "El resultado del trabajo ya no está disponible."}), 410
+    return jsonify({"trabajo": trabajo, "datos": registros_json(entrada.valor),
+                    "url_descarga": url_for('descargar_faltantes', clave=trabajo['clave'])})
+
+
+@app.route('/api/llm/estadisticas')
+def estadisticas_llm():
+    """Aciertos de caché y latencias de la pasarela del modelo en este worker."""
+    from llm import pasarela_llm
+    return jsonify(pasarela_llm.estadisticas())
 
 
 @app.route('/descargar_faltantes')
 def descargar_faltantes():
+    """Excel del resultado de clima con la clave indicada o, sin clave, del último calculado."""
+    clave = request.args.get('clave')
+    entrada = almacen_resultados.obtener(f"reporte:{clave}") if clave else almacen_resultados.ultimo('reporte:clima:')
     upload_folder = os.path.abspath(app.config.get('UPLOAD_FOLDER', 'uploads'))
-    file_path = os.path.join(upload_folder, 'faltantes_resultado.xlsx')
-    if os.path.exists(file_path):
+    file_path = os.path.join(upload_folder, entrada.valor) if entrada is not None else None
+    if file_path and os.path.exists(file_path):
         return send_file(file_path, as_attachment=True, download_name="faltantes_clima.xlsx")
     else:
         return 'Archivo no encontrado. Por favor, genera el reporte primero.', 404
@@ -365,50 +674,110 @@ def descargar_procesado(filename):
     else:
         return 'Archivo no encontrado.', 404
 
-@app.route('/ask-clima-bot', methods=['POST'])
-def ask_clima_bot():
-    user_query = request.json.get('query')
-    if not user_query:
-        return jsonify({"response": "Por favor, ingresa una pregunta."}), 400
+TIPOS_GRAFICO = ('serie', 'faltantes', 'histograma')
 
-    global global_climate_data_df
-    global global_sensor_analysis_results
 
-    project_hypothesis = "El desarrollo e implementación de un sistema unificado para el monitoreo de sensores y la integración de datos climáticos reducirá el tiempo de detección de anomalías y datos faltantes en los sensores, y mejorará la capacidad de los usuarios para tomar decisiones informadas sobre el mantenimiento preventivo y correctivo, al proporcionar un acceso rápido y contextualizado a la información climática relevante."
+@app.route('/api/lecturas', methods=['POST'])
+def ingresar_lecturas():
+    """
+    Lote de lecturas de la pasarela de telemetría (ver tiempo_real.leer_lote). Se evalúan al
+    llegar y la respuesta trae los eventos generados (anomalías e intervalos sin datos).
+    Las lecturas atrasadas o repetidas (de fecha igual o anterior a la última de su estación) se
+    descartan: no se evalúan ni se guardan.
+    """
+    try:
+        lecturas = leer_lote(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if len(lecturas) > MAX_LECTURAS_POR_LOTE:
+        return jsonify({"error": f"Se admiten como máximo {MAX_LECTURAS_POR_LOTE} lecturas por petición."}), 413
+
+    eventos, aceptadas = detector_en_linea.procesar(lecturas)
+    if GUARDAR_LECTURAS_EN_LINEA:
+        # Un fallo al guardar no impide avisar de los eventos
+        try:
+            almacen_lecturas.escribir_lecturas(aceptadas)
+        except Exception as e:
+            print(f"Error al guardar las lecturas en línea en el almacén: {e}")
+    return jsonify({"procesadas": len(aceptadas), "descartadas": len(lecturas) - len(aceptadas), "eventos": eventos})
 
-    resumen_generado_por_sistema_parts = []
-    resumen_generado_por_sistema_parts.append(f"Contexto del Proyecto (Hipótesis General): {project_hypothesis}")
 
-    if global_climate_data_df is not None and not global_climate_data_df.empty:
-        data_string_clima = global_climate_data_df.to_string(index=False, max_rows=50, max_colwidth=50)
-        resumen_generado_por_sistema_parts.append(f"Datos climáticos históricos disponibles (Fechas sin datos con clima registrado):\n{data_string_clima}")
-    else:
-        resumen_generado_por_sistema_parts.append("No hay datos climáticos históricos cargados para consultar.")
-
-    if global_sensor_analysis_results:
-        sensor_details_list = []
-        for estacion, data in global_sensor_analysis_results.items():
-            anomalies_info = f"Anomalías detectadas: {len(data['fechas_anomalias'])}."
-            if data['fechas_anomalias']:
-                anomalies_sample = data['fechas_anomalias'][:3]
-                anomalies_info += f" Ejemplos: {', '.join([f'{a['Fecha_str']} (Var: {a['variacion']:.2f}%)' for a in anomalies_sample])}"
-                if len(data['fechas_anomalias']) > 3:
-                    anomalies_info += "..."
-
-            sensor_details_list.append(
-                f"--- Estación {estacion} ---\n"
-                f"  - Registros totales: {data['total']}\n"
-                f"  - Datos faltantes: {data['faltantes']} ({data['porcentaje']:.2f}%)\n"
-                f"  - Estado del sensor: {data['estado']}\n"
-                f"  - Fechas con datos faltantes: {', '.join(data['fechas_faltantes']) if data['fechas_faltantes'] else 'Ninguna'}\n"
-                f"  - {anomalies_info}\n"
-                f"  - Recomendaciones actuales del sistema: {', '.join(data['recomendaciones']) if data['recomendaciones'] else 'Ninguna'}"
-            )
-        resumen_generado_por_sistema_parts.append(f"Resultados del análisis de sensores:\n" + "\n\n".join(sensor_details_list))
+@app.route('/api/lecturas/eventos')
+def eventos_lecturas():
+    """Eventos posteriores al id `desde` (para consultar periódicamente), como mucho `limite`."""
+    try:
+        desde = int(request.args.get('desde', 0))
+        limite = max(1, min(int(request.args.get('limite', 1000)), 10000))
+    except ValueError:
+        return jsonify({"error": "desde y limite deben ser números enteros."}), 400
+    eventos = detector_en_linea.eventos_desde(desde, limite)
+    return jsonify({"eventos": eventos, "ultimo": eventos[-1]['id'] if eventos else desde})
+
+
+@app.route('/api/lecturas/estado')
+def estado_lecturas():
+    """Estadísticas en línea por estación (ventana, EWMA, última lectura) en este worker."""
+    estado = detector_en_linea.estado()
+    estado['guardadas'] = {'activo': GUARDAR_LECTURAS_EN_LINEA,
+                           'version': almacen_lecturas.version_en_linea() if GUARDAR_LECTURAS_EN_LINEA else None}
+    return jsonify(estado)
+
+
+@app.route('/api/estaciones/<estacion>/grafico')
+def grafico_estacion(estacion):
+    """
+    Datos de gráfico de una estación, leídos del almacén y reducidos en el servidor:
+    tipo=serie (lecturas, LTTB o min-max a `puntos`), faltantes (% mensual) o histograma (`bins`).
+    Acepta desde/hasta (AAAA-MM-DD).
+    """
+    tipo = request.args.get('tipo', 'serie')
+    metodo = request.args.get('metodo', 'lttb')
+    try:
+        puntos = max(3, min(int(request.args.get('puntos', 500)), MAX_PUNTOS_GRAFICO))
+        bins = max(1, min(int(request.args.get('bins', 20)), MAX_BINS_GRAFICO))
+        desde, hasta = rango_fechas_solicitado(request.args)
+    except ValueError:
+        return jsonify({"error": "Parámetros no válidos."}), 400
+    if tipo not in TIPOS_GRAFICO or metodo not in METODOS:
+        return jsonify({"error": f"tipo debe ser {', '.join(TIPOS_GRAFICO)} y metodo {', '.join(METODOS)}."}), 400
+    if estacion not in almacen_lecturas.estaciones():
+        return jsonify({"error": "No hay lecturas guardadas para esa estación."}), 404
+
+    # Los datos solo cambian al escribir en el almacén: su versión forma parte del ETag
+    clave = f"{almacen_lecturas.version()}|{estacion}|{tipo}|{metodo}|{puntos}|{bins}|{desde}|{hasta}"
+    etag = hashlib.sha1(clave.encode()).hexdigest()
+    if etag in request.if_none_match:
+        return Response(status=304)
+
+    if tipo == 'faltantes':
+        resumen = almacen_lecturas.resumen_mensual([estacion], desde, hasta)
+        datos = reducir_serie(resumen['mes'], resumen['faltantes'] / resumen['total'] * 100, puntos, metodo)
     else:
-        resumen_generado_por_sistema_parts.append("No hay resultados de análisis de sensores cargados. Por favor, sube un archivo Excel en la página principal.")
+        lecturas = almacen_lecturas.consultar([estacion], desde, hasta)
+        if tipo == 'serie':
+            datos = reducir_serie(lecturas['Fecha'], lecturas[estacion], puntos, metodo)
+        else:
+            datos = histograma(lecturas[estacion], bins)
 
-    resumen_generado_por_sistema_context = "\n\n".join(resumen_generado_por_sistema_parts)
+    respuesta = jsonify({'estacion': estacion, 'tipo': tipo, **datos})
+    respuesta.set_etag(etag)
+    respuesta.cache_control.no_cache = True
+    return respuesta
+
+
+MODELO_BOT = 'gemini-2.0-flash'
+CONFIG_BOT = {"temperature": 0.2, "maxOutputTokens": 800}
+
+
+def prompt_bot(user_query):
+    """Prompt del asistente para una pregunta, con el contexto acotado del último análisis."""
+    project_hypothesis = "El desarrollo e implementación de un sistema unificado para el monitoreo de sensores y la integración de datos climáticos reducirá el tiempo de detección de anomalías y datos faltantes en los sensores, y mejorará la capacidad de los usuarios para tomar decisiones informadas sobre el mantenimiento preventivo y correctivo, al proporcionar un acceso rápido y contextualizado a la información climática relevante."
+
+    # Resumen acotado del último análisis y la última tabla de clima (cualquier worker), calculado
+    # una vez por versión de ambos; ver contexto_bot.py
+    resumen_generado_por_sistema_context = (
+        f"Contexto del Proyecto (Hipótesis General): {project_hypothesis}\n\n{contexto_actual()}"
+    )
 
     prompt = f"""Eres un ingeniero en mantenimiento predictivo especializado en sistemas de sensores ambientales.
     Tu objetivo es analizar los datos y el contexto proporcionados para responder a las preguntas del usuario de manera profesional y técnica.
@@ -433,30 +802,30 @@ def ask_clima_bot():
 
     Prioriza la información numérica o fáctica si es relevante.
     """
+    return prompt
+
+
+@app.route('/ask-clima-bot', methods=['POST'])
+def ask_clima_bot():
+    # requests y la pasarela del modelo se importan al primer uso, no al arrancar
+    import requests
+    from llm import pasarela_llm
+
+    user_query = request.json.get('query')
+    if not user_query:
+        return jsonify({"response": "Por favor, ingresa una pregunta."}), 400
+    prompt = prompt_bot(user_query)
 
     api_key = os.environ.get("GEMINI_API_KEY", "")
     if not api_key:
         print("Error: La clave API de Gemini (GEMINI_API_KEY) no está configurada en el servidor.")
         return jsonify({"response": "Error interno: La clave API del bot no está configurada."}), 500
 
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-
-    payload = {
-        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
-        "generationConfig": {
-            "temperature": 0.2,
-            "maxOutputTokens": 800
-        }
-    }
-
     try:
-        response = requests.post(api_url, headers={'Content-Type': 'application/json'}, json=payload)
-        response.raise_for_status()
-        result = response.json()
-
-        bot_response = "Lo siento, no pude generar una respuesta en este momento."
-        if result and result.get('candidates') and result['candidates'][0].get('content') and result['candidates'][0]['content'].get('parts'):
-            bot_response = result['candidates'][0]['content']['parts'][0]['text']
+        # Un prompt idéntico a uno anterior (mismos datos y pregunta) se responde desde la caché
+        bot_response = pasarela_llm.generar(prompt, MODELO_BOT, CONFIG_BOT, api_key=api_key)
+        if bot_response is None:
+            bot_response = "Lo siento, no pude generar una respuesta en este momento."
 
         return jsonify({"response": bot_response})
     except requests.exceptions.RequestException as e:
@@ -467,5 +836,55 @@ def ask_clima_bot():
         return jsonify({"response": "Lo siento, ocurrió un error interno al procesar tu solicitud."}), 500
 
 
-port = int(os.environ.get("PORT", 5000))
-app.run(host="0.0.0.0", port=port, debug=True)
+def evento_sse(datos, evento=None):
+    """Un evento de server-sent events con datos en JSON."""
+    cabecera = f"event: {evento}\n" if evento else ""
+    return f"{cabecera}data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+@app.route('/ask-clima-bot/stream', methods=['POST'])
+def ask_clima_bot_stream():
+    """
+    Como /ask-clima-bot, pero la respuesta llega como server-sent events a medida que el modelo
+    la genera: eventos 'data' con {"texto": parte}, y al final 'fin' o 'error' con {"response": mensaje}.
+    """
+    import requests
+    from llm import pasarela_llm
+
+    user_query = (request.get_json(silent=True) or {}).get('query')
+    if not user_query:
+        return jsonify({"response": "Por favor, ingresa una pregunta."}), 400
+    api_key = os.environ.get("GEMINI_API_KEY", "")
+    if not api_key:
+        print("Error: La clave API de Gemini (GEMINI_API_KEY) no está configurada en el servidor.")
+        return jsonify({"response": "Error interno: La clave API del bot no está configurada."}), 500
+    prompt = prompt_bot(user_query)
+
+    def eventos():
+        enviado = False
+        try:
+            for texto in pasarela_llm.generar_flujo(prompt, MODELO_BOT, CONFIG_BOT, api_key=api_key):
+                enviado = True
+                yield evento_sse({"texto": texto})
+            if not enviado:
+                yield evento_sse({"texto": "Lo siento, no pude generar una respuesta en este momento."})
+            yield evento_sse({}, 'fin')
+        except requests.exceptions.RequestException as e:
+            print(f"Error al llamar a la API de Gemini: {e}")
+            yield evento_sse({"response": "Lo siento, hubo un error de conexión al intentar comunicarme con el bot."}, 'error')
+        except Exception as e:
+            print(f"Error inesperado en la función ask_clima_bot_stream: {e}")
+            yield evento_sse({"response": "Lo siento, ocurrió un error interno al procesar tu solicitud."}, 'error')
+
+    # Sin búfer en proxies (nginx) para que cada parte llegue en cuanto se genera
+    return Response(stream_with_context(eventos()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+if __name__ == '__main__':
+    # Servidor de desarrollo (un proceso, con recarga); en producción usar main.py o wsgi.py
+    port = int(os.environ.get("PORT", 5000))
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Solo en el proceso que atiende peticiones, no en el que vigila la recarga
+        calentar_en_segundo_plano()
+    app.run(host="0.0.0.0", port=port, debug=True)
@@ -0,0 +1,152 @@
+"""
+Detección de anomalías por estación (como antes) frente al motor vectorizado (anomalias.py).
+
+Genera lecturas diarias sintéticas de --estaciones estaciones durante --anios años (estacionalidad
+anual, ruido, faltantes y picos insertados) y mide:
+  - antes: detectar_anomalias_y_tendencias como estaba en app.py (pct_change y .apply por fila,
+    una estación cada vez) y la media ± 2σ global de streamlit.py, sensor por sensor
+  - referencia pandas: rolling por estación para zscore y mad, con la misma ventana
+  - motor: cada método de anomalias.METODOS sobre todas las estaciones a la vez
+Para cada método se indica cuántas lecturas marca, cuántos de los picos insertados encuentra y
+el tamaño de los índices devueltos.
+
+Uso (desde SISTEMA_MANTENIMIENTO):
+    python benchmarks/bench_anomalias.py [--estaciones 50] [--anios 12] [--ventana 30] [--repeticiones 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import anomalias
+
+
+def datos_sinteticos(estaciones, anios, semilla=0):
+    """DataFrame con Fecha y una columna por estación, y la matriz booleana de picos insertados."""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range('2010-01-01', periods=int(anios * 365.25), freq='D')
+    dia = fechas.dayofyear.to_numpy()[:, None]
+    fase = rng.uniform(0, 2 * np.pi, estaciones)
+    valores = 20 + 8 * np.sin(2 * np.pi * dia / 365.25 + fase) + rng.normal(0, 2, (len(fechas), estaciones))
+    picos = rng.random(valores.shape) < 0.001
+    valores[picos] += rng.choice([-1, 1], picos.sum()) * rng.uniform(15, 30, picos.sum())
+    valores[rng.random(valores.shape) < 0.05] = np.nan
+    picos &= ~np.isnan(valores)
+    columnas = [f"P{100 + i}" for i in range(estaciones)]
+    df = pd.DataFrame(valores, columns=columnas)
+    df.insert(0, 'Fecha', fechas)
+    return df, columnas, picos
+
+
+def variacion_anterior(df, estacion, umbral_porcentaje=50):
+    """detectar_anomalias_y_tendencias como estaba en app.py."""
+    df_tmp = df[['Fecha', estacion]].dropna().copy()
+    df_tmp.sort_values('Fecha', inplace=True)
+    if not df_tmp.empty and len(df_tmp) > 1:
+        df_tmp['variacion'] = df_tmp[estacion].pct_change() * 100
+        df_tmp['tipo'] = df_tmp['variacion'].apply(lambda x: 'anomalía' if pd.notna(x) and abs(x) > umbral_porcentaje else 'normal')
+        df_tmp['Fecha_str'] = df_tmp['Fecha'].dt.strftime('%Y-%m-%d')
+        return df_tmp[df_tmp['tipo'] == 'anomalía'][['Fecha_str', 'variacion']].to_dict(orient='records')
+    return []
+
+
+def sigma_global_anterior(df, sensor):
+    """tabla_anomalias como estaba en streamlit.py."""
+    media = df[sensor].mean()
+    std = df[sensor].std()
+    anomalia = (df[sensor] > media + 2*std) | (df[sensor] < media - 2*std)
+    return df.loc[anomalia, ["Fecha", sensor]].reset_index(drop=True)
+
+
+def zscore_pandas(df, estaciones, ventana):
+    resultado = {}
+    for estacion in estaciones:
+        rolling = df[estacion].rolling(ventana, min_periods=ventana // 2)
+        z = (df[estacion] - rolling.mean().shift(1)) / rolling.std().shift(1)
+        resultado[estacion] = np.flatnonzero(z.abs() > anomalias.UMBRALES['zscore'])
+    return resultado
+
+
+def mad_pandas(df, estaciones, ventana):
+    resultado = {}
+    for estacion in estaciones:
+        serie = df[estacion]
+        rolling = serie.rolling(ventana, min_periods=ventana // 2)
+        mediana = rolling.median().shift(1)
+        mad = rolling.apply(lambda w: np.nanmedian(np.abs(w - np.nanmedian(w))), raw=True).shift(1)
+        z = anomalias.ESCALA_MAD * (serie - mediana) / mad
+        resultado[estacion] = np.flatnonzero(z.abs() > anomalias.UMBRALES['mad'])
+    return resultado
+
+
+def medir(funcion, repeticiones):
+    mejor, resultado = float('inf'), None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--estaciones', type=int, default=50)
+    parser.add_argument('--anios', type=float, default=12)
+    parser.add_argument('--ventana', type=int, default=anomalias.VENTANA)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    df, estaciones, picos = datos_sinteticos(args.estaciones, args.anios)
+    print(f"{args.estaciones} estaciones x {len(df)} días ({args.anios:g} años), "
+          f"{picos.sum()} picos insertados, ventana {args.ventana}\n")
+    print(f"{'':<34} {'tiempo':>9} {'marcadas':>9} {'picos hallados':>15} {'índices':>10}")
+
+    def fila(nombre, segundos, marcadas=None, hallados=None, tamano=None):
+        print(f"{nombre:<34} {segundos * 1000:>7.1f}ms {'' if marcadas is None else marcadas:>9} "
+              f"{'' if hallados is None else f'{hallados}/{picos.sum()}':>15} "
+              f"{'' if tamano is None else f'{tamano / 1024:.1f} KiB':>10}")
+
+    def resumen(indices):
+        """Marcadas, picos encontrados y bytes de los índices {estacion: filas}."""
+        marcadas = sum(len(filas) for filas in indices.values())
+        hallados = sum(int(picos[filas, i].sum()) for i, filas in enumerate(indices.values()))
+        tamano = sum(np.asarray(filas).nbytes for filas in indices.values())
+        return marcadas, hallados, tamano
+
+    segundos, resultado = medir(lambda: [variacion_anterior(df, e) for e in estaciones], args.repeticiones)
+    fila('antes: variación % (por estación)', segundos, sum(len(r) for r in resultado))
+    segundos, resultado = medir(lambda: [sigma_global_anterior(df, e) for e in estaciones], args.repeticiones)
+    fila('antes: media ± 2σ global', segundos, sum(len(r) for r in resultado))
+    segundos, resultado = medir(lambda: zscore_pandas(df, estaciones, args.ventana), args.repeticiones)
+    fila('pandas rolling: zscore', segundos, *resumen(resultado))
+    # rolling.apply llama a Python por ventana: una sola repetición basta
+    segundos, resultado = medir(lambda: mad_pandas(df, estaciones, args.ventana), 1)
+    fila('pandas rolling: mad', segundos, *resumen(resultado))
+    print()
+
+    for metodo in anomalias.METODOS:
+        segundos, (_, _, indices) = medir(
+            lambda: anomalias.detectar(df, estaciones, metodo, ventana=args.ventana), args.repeticiones)
+        fila(f"motor: {metodo}", segundos, *resumen(indices))
+
+    # Por bloques, como AcumuladorEstaciones con un CSV grande: mismo resultado que de una vez
+    valores = df[estaciones].to_numpy(dtype=float)
+    fechas = df['Fecha'].to_numpy()
+    for metodo in ('zscore', 'mad'):
+        completo, _ = anomalias.puntuar(valores, fechas, metodo, args.ventana)
+        partes, estado = [], None
+        for bloque in np.array_split(np.arange(len(df)), 10):
+            puntaje, estado = anomalias.puntuar(valores[bloque], fechas[bloque], metodo, args.ventana, estado)
+            partes.append(puntaje)
+        iguales = np.allclose(completo, np.vstack(partes), equal_nan=True)
+        print(f"\n{metodo} en 10 bloques igual que de una vez: {'sí' if iguales else 'NO'}", end='')
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Tiempo de arranque: importación de los módulos de la aplicación medida con `python -X importtime`
+y tiempo hasta la primera respuesta de un servidor recién lanzado.
+
+Para cada modo se lanza el servidor, se mide cuánto tarda en responder a / y, con --subir, cuánto
+tarda después la primera carga de un archivo (incluye el pronóstico; con MOTOR_PRONOSTICO=prophet
+se nota si el precalentamiento terminó antes de la petición).
+
+La mejora de arranque es pequeña (import app pasó de ~608 a ~570 ms): lo que se difiere son
+requests, el cliente de clima y Prophet. pandas se lleva ~400 ms del total y se sigue importando
+al arrancar porque app.py y todos los módulos de análisis lo usan desde el nivel de módulo;
+diferirlo solo movería ese coste a la primera petición, y con gunicorn --preload ya se paga una
+sola vez en el maestro.
+
+Uso (desde SISTEMA_MANTENIMIENTO):
+    python benchmarks/bench_arranque.py [--modulos app wsgi] [--modos desarrollo produccion]
+                                        [--subir data/archivo.xlsx] [--espera-subida 0]
+"""
+import argparse
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMANDOS = {
+    'desarrollo': [sys.executable, 'app.py'],
+    'produccion': [sys.executable, 'main.py'],
+}
+LINEA_IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def medir_importacion(modulo, top):
+    """Importa modulo en un intérprete nuevo y muestra el total y sus dependencias directas más lentas."""
+    salida = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {modulo}'], cwd=BASE,
+                            capture_output=True, text=True)
+    if salida.returncode != 0:
+        print(f"{modulo}: no se pudo importar\n{salida.stderr.strip().splitlines()[-1]}")
+        return
+    # importtime escribe cada módulo después de sus dependencias: las de sangría 2 que preceden a
+    # la línea del módulo (sangría 0) son sus importaciones directas
+    total, directas, pendientes = 0, [], []
+    for linea in salida.stderr.splitlines():
+        encontrada = LINEA_IMPORTTIME.match(linea)
+        if not encontrada:
+            continue
+        acumulado, sangria, nombre = int(encontrada.group(2)), len(encontrada.group(3)), encontrada.group(4)
+        if sangria == 0:
+            if nombre == modulo:
+                total, directas = acumulado, pendientes
+            pendientes = []
+        elif sangria == 2:
+            pendientes.append((acumulado, nombre))
+    print(f"import {modulo}: {total / 1000:.0f} ms")
+    for acumulado, nombre in sorted(directas, reverse=True)[:top]:
+        print(f"    {nombre:<28} {acumulado / 1000:>8.1f} ms")
+    print()
+
+
+def medir_primera_respuesta(modo, puerto, archivo, espera_subida, limite=180):
+    entorno = dict(os.environ, PORT=str(puerto))
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(COMANDOS[modo], cwd=BASE, env=entorno, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{puerto}/"
+    try:
+        while True:
+            try:
+                if requests.get(url, timeout=5).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.perf_counter() - inicio > limite or proceso.poll() is not None:
+                print(f"{modo}: el servidor no respondió")
+                return
+            time.sleep(0.05)
+        primera = time.perf_counter() - inicio
+        linea = f"{modo:<11} primera respuesta en / {primera:>7.2f} s"
+        if archivo:
+            time.sleep(espera_subida)
+            antes = time.perf_counter()
+            with open(archivo, 'rb') as f:
+                respuesta = requests.post(url, files={'file': (os.path.basename(archivo), f)}, timeout=600)
+            linea += f"   primera carga de archivo {time.perf_counter() - antes:>7.2f} s ({respuesta.status_code})"
+        print(linea)
+    finally:
+        os.killpg(proceso.pid, signal.SIGTERM)
+        proceso.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modulos', nargs='*', default=['app', 'wsgi'])
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('--modos', nargs='*', choices=list(COMANDOS), default=list(COMANDOS))
+    parser.add_argument('--subir', help="archivo a subir tras la primera respuesta")
+    parser.add_argument('--espera-subida', type=float, default=0,
+                        help="segundos entre la primera respuesta y la carga del archivo")
+    parser.add_argument('--puerto', type=int, default=5060)
+    args = parser.parse_args()
+
+    for modulo in args.modulos:
+        medir_importacion(modulo, args.top)
+    for modo in args.modos:
+        medir_primera_respuesta(modo, args.puerto, args.subir and os.path.abspath(args.subir), args.espera_subida)
+
+
+if __name__ == '__main__':
+    main()
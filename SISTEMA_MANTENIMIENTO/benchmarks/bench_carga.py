@@ -0,0 +1,109 @@
+"""
+Prueba de carga: peticiones por segundo en / y /descargar_faltantes con el servidor de
+desarrollo (python app.py, como lo lanzaba main.py antes) y con el lanzador de producción
+(python main.py: gunicorn con preload o waitress).
+
+Cada modo se arranca en un subproceso, se espera a que acepte conexiones y se le envían
+peticiones desde varios hilos durante unos segundos. /descargar_faltantes devuelve 404 si aún
+no se generó el reporte; se cuenta igual, pero conviene generarlo antes (/datos-climaticos).
+
+Uso (desde SISTEMA_MANTENIMIENTO):
+    python benchmarks/bench_carga.py [--modos desarrollo produccion] [--clientes 16] [--segundos 10]
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import requests
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTAS = ['/', '/descargar_faltantes']
+COMANDOS = {
+    'desarrollo': [sys.executable, 'app.py'],
+    'produccion': [sys.executable, 'main.py'],
+}
+
+
+def esperar_servidor(url, espera=120):
+    limite = time.time() + espera
+    while time.time() < limite:
+        try:
+            requests.get(url, timeout=2)
+            return True
+        except requests.RequestException:
+            time.sleep(0.5)
+    return False
+
+
+def generar_carga(url, clientes, segundos):
+    """Devuelve (peticiones/s, latencias en s, conteo de códigos de estado)."""
+    latencias = []
+    codigos = Counter()
+    lock = threading.Lock()
+    fin = time.perf_counter() + segundos
+
+    def cliente():
+        sesion = requests.Session()
+        propias, estados = [], Counter()
+        while time.perf_counter() < fin:
+            inicio = time.perf_counter()
+            try:
+                estados[sesion.get(url, timeout=60).status_code] += 1
+            except requests.RequestException:
+                estados['error'] += 1
+                continue
+            propias.append(time.perf_counter() - inicio)
+        with lock:
+            latencias.extend(propias)
+            codigos.update(estados)
+
+    hilos = [threading.Thread(target=cliente) for _ in range(clientes)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return sum(codigos.values()) / (time.perf_counter() - inicio), np.array(latencias), codigos
+
+
+def medir_modo(modo, puerto, clientes, segundos):
+    entorno = dict(os.environ, PORT=str(puerto))
+    proceso = subprocess.Popen(COMANDOS[modo], cwd=BASE, env=entorno, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{puerto}"
+    try:
+        if not esperar_servidor(base_url + '/'):
+            print(f"{modo}: el servidor no respondió")
+            return
+        for ruta in RUTAS:
+            rps, latencias, codigos = generar_carga(base_url + ruta, clientes, segundos)
+            p50, p95 = (np.percentile(latencias, [50, 95]) * 1000) if len(latencias) else (float('nan'),) * 2
+            estados = ', '.join(f"{c}: {n}" for c, n in sorted(codigos.items(), key=str))
+            print(f"{modo:<11} {ruta:<22} {rps:>8.1f} req/s   p50 {p50:>7.1f} ms   p95 {p95:>7.1f} ms   ({estados})")
+    finally:
+        # El servidor de desarrollo lanza un proceso hijo para la recarga: se termina el grupo
+        os.killpg(proceso.pid, signal.SIGTERM)
+        proceso.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modos', nargs='+', choices=list(COMANDOS), default=list(COMANDOS))
+    parser.add_argument('--clientes', type=int, default=16)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--puerto', type=int, default=5050)
+    args = parser.parse_args()
+
+    print(f"{args.clientes} clientes concurrentes, {args.segundos:g} s por ruta\n")
+    for modo in args.modos:
+        medir_modo(modo, args.puerto, args.clientes, args.segundos)
+
+
+if __name__ == '__main__':
+    main()
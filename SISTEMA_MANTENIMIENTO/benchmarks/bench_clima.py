@@ -0,0 +1,120 @@
+"""
+Cliente de clima (cliente_clima.py) contra un servidor local que imita la API de archivo de Open-Meteo.
+
+El servidor responde a cada petición con --latencia segundos de retraso y valores diarios para el
+rango pedido; una fracción --tasa-429 de las peticiones recibe 429 con "Retry-After: 3600".
+Se mide, para --peticiones rangos:
+  - antes: requests.get secuencial, una conexión nueva por petición y sin reintentos
+  - cliente: ClienteClima.mapear con sesión compartida, --workers peticiones en vuelo y reintentos
+Para el cliente se muestran sus estadísticas (peticiones/s, reintentos, segundos de espera) y se
+comprueba que la espera pedida con Retry-After se acota a --max-espera segundos.
+
+Uso (desde SISTEMA_MANTENIMIENTO):
+    python benchmarks/bench_clima.py [--peticiones 40] [--latencia 0.05] [--tasa-429 0.1] [--workers 4]
+"""
+import argparse
+import http.server
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import requests
+
+from cliente_clima import ClienteClima
+
+
+class ServidorFalso(http.server.BaseHTTPRequestHandler):
+    latencia = 0.0
+    tasa_429 = 0.0
+    azar = random.Random(0)
+    lock = threading.Lock()
+
+    def do_GET(self):
+        time.sleep(self.latencia)
+        with self.lock:
+            limitar = self.azar.random() < self.tasa_429
+        if limitar:
+            self.send_response(429)
+            self.send_header('Retry-After', '3600')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        consulta = parse_qs(urlparse(self.path).query)
+        fechas = pd.date_range(consulta['start_date'][0], consulta['end_date'][0])
+        cuerpo = json.dumps({'daily': {
+            'time': [f.strftime('%Y-%m-%d') for f in fechas],
+            'precipitation_sum': [1.5] * len(fechas),
+        }}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor():
+    servidor = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ServidorFalso)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/v1/archive"
+
+
+def parametros(i):
+    inicio = pd.Timestamp('2000-01-01') + pd.Timedelta(days=30 * i)
+    return {'latitude': -0.6, 'longitude': -78.2, 'daily': 'precipitation_sum',
+            'start_date': inicio.strftime('%Y-%m-%d'),
+            'end_date': (inicio + pd.Timedelta(days=29)).strftime('%Y-%m-%d')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--peticiones', type=int, default=40)
+    parser.add_argument('--latencia', type=float, default=0.05)
+    parser.add_argument('--tasa-429', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-espera', type=float, default=0.2)
+    args = parser.parse_args()
+
+    ServidorFalso.latencia = args.latencia
+    servidor, url = iniciar_servidor()
+    print(f"{args.peticiones} rangos de 30 días, latencia {args.latencia * 1000:.0f} ms, "
+          f"{args.tasa_429:.0%} de respuestas 429 con Retry-After: 3600\n")
+
+    # Antes: sin reintentos, así que se mide sin 429 para que todas las peticiones terminen
+    inicio = time.perf_counter()
+    for i in range(args.peticiones):
+        requests.get(url, params=parametros(i), timeout=30).json()
+    segundos = time.perf_counter() - inicio
+    print(f"{'antes (secuencial, sin 429)':<30} {segundos:>6.2f} s   {args.peticiones / segundos:>7.1f} peticiones/s")
+
+    ServidorFalso.tasa_429 = args.tasa_429
+    cliente = ClienteClima(max_workers=args.workers, peticiones_por_segundo=0,
+                           backoff=0.01, max_espera=args.max_espera)
+    inicio = time.perf_counter()
+    respuestas = cliente.mapear(lambda i: cliente.get_json(url, params=parametros(i)), range(args.peticiones))
+    segundos = time.perf_counter() - inicio
+    stats = cliente.estadisticas()
+    print(f"{'cliente (con 429)':<30} {segundos:>6.2f} s   {args.peticiones / segundos:>7.1f} peticiones/s")
+    print(f"\nestadísticas del cliente: {stats['peticiones']} peticiones HTTP, {stats['exitos']} éxitos, "
+          f"{stats['errores']} errores, {stats['reintentos']} reintentos, "
+          f"{stats['segundos_espera']:.2f} s de espera, {stats['peticiones_por_segundo']:.1f} peticiones/s")
+    completas = sum(len(r['daily']['time']) == 30 for r in respuestas)
+    print(f"respuestas completas: {completas}/{args.peticiones}")
+    acotada = stats['segundos_espera'] <= stats['reintentos'] * args.max_espera + 1e-9
+    print(f"espera por reintento acotada a {args.max_espera} s (el servidor pedía 3600 s): {'sí' if acotada else 'NO'}")
+
+    cliente.cerrar()
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
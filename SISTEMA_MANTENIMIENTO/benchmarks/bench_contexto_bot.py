@@ -0,0 +1,186 @@
+"""
+Tamaño del prompt y latencia de /ask-clima-bot antes y después del contexto acotado (contexto_bot.py).
+
+Genera un análisis sintético (estaciones con lecturas diarias, rachas de faltantes y anomalías) y
+su tabla de clima, los guarda en un almacén de resultados temporal y los envía a un LLM local de
+prueba cuya latencia crece con los tokens de entrada (--ms-por-token), como el prellenado de un
+modelo real.
+  - antes:   el contexto de antes (todas las fechas faltantes y la tabla de clima en texto)
+  - después: contexto_actual(), la primera pregunta (se construye) y las siguientes (del almacén)
+  - además una pregunta completa por /ask-clima-bot con el cliente de pruebas de Flask.
+
+Uso (desde SISTEMA_MANTENIMIENTO):
+    python benchmarks/bench_contexto_bot.py [--estaciones 10] [--anios 20] [--ms-por-token 0.2]
+                                            [--presupuesto 1500] [--repeticiones 5]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+PUERTO_LLM = 5071
+CARPETA = tempfile.mkdtemp(prefix='bench_contexto_')
+os.environ['ALMACEN_RESULTADOS_PATH'] = os.path.join(CARPETA, 'resultados.sqlite')
+os.environ['GEMINI_API_URL'] = f"http://127.0.0.1:{PUERTO_LLM}/generar"
+os.environ['CACHE_LLM_PATH'] = os.path.join(CARPETA, 'llm.sqlite')
+os.environ.setdefault('GEMINI_API_KEY', 'prueba')
+
+import requests
+
+import contexto_bot
+from app import app
+from analisis import analizar_estaciones
+from almacen_resultados import almacen_resultados
+
+
+class LLMDePrueba(BaseHTTPRequestHandler):
+    """Responde como la API de Gemini tras esperar ms_por_token por cada token del prompt."""
+    ms_por_token = 0.2
+    ultimo_prompt = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        texto = cuerpo['contents'][0]['parts'][0]['text']
+        LLMDePrueba.ultimo_prompt = len(texto)
+        time.sleep(contexto_bot.estimar_tokens(texto) * self.ms_por_token / 1000)
+        respuesta = json.dumps({'candidates': [{'content': {'parts': [{'text': 'Respuesta de prueba.'}]}}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(respuesta)))
+        self.end_headers()
+        self.wfile.write(respuesta)
+
+
+def datos_sinteticos(estaciones, anios, semilla=0):
+    """Resultados con la forma de construir_resultados (sin pronóstico) y registros de clima."""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range('2000-01-01', periods=anios * 365, freq='D')
+    resultados, registros = {}, []
+    for i in range(estaciones):
+        estacion = f"P{40 + i}"
+        valores = rng.gamma(2, 5, len(fechas))
+        # Rachas de faltantes de 1 a 30 días
+        for inicio in rng.choice(len(fechas), anios * 6, replace=False):
+            valores[inicio:inicio + rng.integers(1, 30)] = np.nan
+        df = pd.DataFrame({'Fecha': fechas, estacion: valores})
+        faltantes = df.loc[df[estacion].isna(), 'Fecha']
+        analisis = analizar_estaciones(df, [estacion], metodo='variacion')[estacion]
+        resultados[estacion] = {
+            'total': analisis['total'],
+            'faltantes': analisis['faltantes'],
+            'porcentaje': analisis['porcentaje'],
+            'fechas_faltantes': analisis['fechas_faltantes'],
+            'fechas_mantenimiento': [],
+            'fechas_anomalias': analisis['fechas_anomalias'],
+            'total_anomalias': analisis['total_anomalias'],
+            'estado': 'riesgo',
+            'reporte_mensual': analisis['reporte_mensual'].to_dict(orient='records'),
+            'recomendaciones': ["🟠 Estado de riesgo: Se recomienda mantenimiento preventivo inmediato."],
+        }
+        registros.extend({'Fecha': f, 'Sensor': estacion, 'precipitacion_mm': rng.gamma(2, 5),
+                          'viento_max_kmh': rng.uniform(5, 60), 'temperatura_max': rng.uniform(10, 30)}
+                         for f in faltantes)
+    return resultados, registros
+
+
+def contexto_anterior(resultados, registros):
+    """El contexto como se armaba antes en ask_clima_bot, en cada pregunta."""
+    partes = []
+    datos_clima = pd.DataFrame(registros)
+    partes.append("Datos climáticos históricos disponibles (Fechas sin datos con clima registrado):\n"
+                  + datos_clima.to_string(index=False, max_rows=50, max_colwidth=50))
+    detalles = []
+    for estacion, data in resultados.items():
+        ejemplos = ', '.join(f"{a['Fecha_str']} (Var: {a['variacion']:.2f}%)" for a in data['fechas_anomalias'][:3])
+        detalles.append(
+            f"--- Estación {estacion} ---\n"
+            f"  - Registros totales: {data['total']}\n"
+            f"  - Datos faltantes: {data['faltantes']} ({data['porcentaje']:.2f}%)\n"
+            f"  - Estado del sensor: {data['estado']}\n"
+            f"  - Fechas con datos faltantes: {', '.join(data['fechas_faltantes'])}\n"
+            f"  - Anomalías detectadas: {len(data['fechas_anomalias'])}. Ejemplos: {ejemplos}...\n"
+            f"  - Recomendaciones actuales del sistema: {', '.join(data['recomendaciones'])}"
+        )
+    partes.append("Resultados del análisis de sensores:\n" + "\n\n".join(detalles))
+    return "\n\n".join(partes)
+
+
+def preguntar(contexto):
+    """Envía el prompt al LLM de prueba como lo hace ask_clima_bot y devuelve los segundos."""
+    prompt = f"Eres un ingeniero en mantenimiento predictivo.\n\n{contexto}\n\nPregunta del usuario: ¿Qué estación revisar?"
+    inicio = time.perf_counter()
+    requests.post(os.environ['GEMINI_API_URL'], json={'contents': [{'role': 'user', 'parts': [{'text': prompt}]}]},
+                  timeout=600).raise_for_status()
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--estaciones', type=int, default=10)
+    parser.add_argument('--anios', type=int, default=20)
+    parser.add_argument('--ms-por-token', type=float, default=0.2)
+    parser.add_argument('--presupuesto', type=int, default=contexto_bot.PRESUPUESTO_TOKENS)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    LLMDePrueba.ms_por_token = args.ms_por_token
+    servidor = ThreadingHTTPServer(('127.0.0.1', PUERTO_LLM), LLMDePrueba)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    resultados, registros = datos_sinteticos(args.estaciones, args.anios)
+    almacen_resultados.guardar('analisis:bench', (resultados, None))
+    almacen_resultados.guardar('clima:bench', registros)
+    faltantes = sum(d['faltantes'] for d in resultados.values())
+    print(f"{args.estaciones} estaciones x {args.anios} años: {faltantes} fechas faltantes, "
+          f"{len(registros)} filas de clima; LLM de prueba a {args.ms_por_token} ms/token\n")
+    print(f"{'':<28} {'caracteres':>10} {'tokens':>8} {'contexto':>10} {'total':>10}")
+
+    def fila(nombre, contexto, armado, llamada):
+        print(f"{nombre:<28} {len(contexto):>10} {contexto_bot.estimar_tokens(contexto):>8} "
+              f"{armado * 1000:>8.1f}ms {(armado + llamada) * 1000:>8.1f}ms")
+
+    # Antes: el contexto completo se arma en cada pregunta
+    tiempos = []
+    for _ in range(args.repeticiones):
+        inicio = time.perf_counter()
+        contexto = contexto_anterior(resultados, registros)
+        armado = time.perf_counter() - inicio
+        tiempos.append((armado, preguntar(contexto)))
+    fila('antes', contexto, *min(tiempos, key=sum))
+
+    # Después: la primera pregunta resume y guarda; las siguientes leen el texto del almacén
+    inicio = time.perf_counter()
+    contexto = contexto_bot.contexto_actual(args.presupuesto)
+    armado = time.perf_counter() - inicio
+    fila('después (primera pregunta)', contexto, armado, preguntar(contexto))
+    tiempos = []
+    for _ in range(args.repeticiones):
+        inicio = time.perf_counter()
+        contexto = contexto_bot.contexto_actual(args.presupuesto)
+        armado = time.perf_counter() - inicio
+        tiempos.append((armado, preguntar(contexto)))
+    fila('después (siguientes)', contexto, *min(tiempos, key=sum))
+
+    # Extremo a extremo por la ruta de Flask (con el presupuesto por defecto)
+    cliente = app.test_client()
+    inicio = time.perf_counter()
+    respuesta = cliente.post('/ask-clima-bot', json={'query': '¿Qué estación revisar?'})
+    print(f"\n/ask-clima-bot: {respuesta.status_code} en {(time.perf_counter() - inicio) * 1000:.1f} ms, "
+          f"prompt de {LLMDePrueba.ultimo_prompt} caracteres")
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Mide la lectura de los Excel de data/ antes y después de la capa de ingesta.
+
+Para cada archivo y hoja compara:
+  - pd.read_excel con openpyxl (lo que hacían app.py, faltantes.py y streamlit.py en cada petición),
+  - pd.read_excel con calamine, si python-calamine está instalado,
+  - ingesta.leer_excel en frío (parseo + escritura del snapshot) y en caliente (lectura del snapshot).
+
+Con --csv-filas N genera además, en la misma carpeta temporal, un CSV sintético de N filas
+(Fecha + tres estaciones) y mide ingesta.leer_por_bloques sobre él (la ruta de subida de archivos
+grandes): tiempo, bloques leídos y pico de memoria frente al tamaño del archivo.
+
+Los snapshots se escriben en una carpeta temporal, no en cache/.
+
+Uso (desde SISTEMA_MANTENIMIENTO):
+    python benchmarks/bench_ingesta.py [--repeticiones 5] [--csv-filas 1500000]
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import ingesta
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos) * 1000
+
+
+def medir_csv(carpeta, filas):
+    """Escribe un CSV sintético de filas lecturas horarias y lo lee por bloques."""
+    ruta = os.path.join(carpeta, 'lecturas.csv')
+    azar = np.random.default_rng(0)
+    fechas = pd.date_range('1900-01-01', periods=filas, freq='h')
+    pd.DataFrame({'Fecha': fechas, **{e: azar.gamma(2, 3, filas).round(1) for e in ('P42', 'P43', 'P55')}}
+                 ).to_csv(ruta, index=False)
+    tamano = os.path.getsize(ruta) / 1024 / 1024
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    bloques = leidas = 0
+    for bloque in ingesta.leer_por_bloques(ruta):
+        bloques += 1
+        leidas += len(bloque)
+    segundos = time.perf_counter() - inicio
+    pico = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    print(f"CSV sintético: {leidas:,} filas ({tamano:.1f} MB) en {bloques} bloques de hasta "
+          f"{ingesta.FILAS_POR_BLOQUE:,} filas: {segundos:.2f} s, pico de memoria {pico:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--csv-filas', type=int, default=0, help="filas del CSV sintético (0 = no se mide)")
+    args = parser.parse_args()
+
+    calamine = ingesta._disponible('python_calamine')
+    print(f"Motor de ingesta: {ingesta.MOTOR_EXCEL} | snapshot: {ingesta.FORMATO_SNAPSHOT}"
+          f" | calamine {'disponible' if calamine else 'no instalado'}\n")
+
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    carpeta = tempfile.mkdtemp(prefix='bench_ingesta_')
+    ingesta.CARPETA_SNAPSHOTS = carpeta
+    try:
+        for ruta in sorted(glob.glob(os.path.join(base, 'data', '*.xlsx'))):
+            print(os.path.basename(ruta))
+            for hoja in pd.ExcelFile(ruta, engine='openpyxl').sheet_names:
+                t_openpyxl = medir(lambda: pd.read_excel(ruta, sheet_name=hoja, engine='openpyxl'),
+                                   args.repeticiones)
+                linea = f"  {hoja:<22} openpyxl {t_openpyxl:8.1f} ms"
+                if calamine:
+                    t_calamine = medir(lambda: pd.read_excel(ruta, sheet_name=hoja, engine='calamine'),
+                                       args.repeticiones)
+                    linea += f" | calamine {t_calamine:8.1f} ms"
+
+                def en_frio():
+                    shutil.rmtree(carpeta, ignore_errors=True)
+                    ingesta.leer_excel(ruta, hoja=hoja)
+
+                t_frio = medir(en_frio, args.repeticiones)
+                ingesta.leer_excel(ruta, hoja=hoja)
+                t_caliente = medir(lambda: ingesta.leer_excel(ruta, hoja=hoja), args.repeticiones)
+                linea += (f" | ingesta en frío {t_frio:8.1f} ms | snapshot {t_caliente:6.1f} ms"
+                          f" | x{t_openpyxl / t_caliente:,.0f}")
+                print(linea)
+            print()
+        if args.csv_filas:
+            medir_csv(carpeta, args.csv_filas)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Pasarela del modelo (llm.py) contra un modelo local de prueba.
+
+El servidor de prueba responde como la API de Gemini tras --latencia segundos y cuenta las
+llamadas que recibe. Se mide:
+  - preguntas repetidas: solo la primera llega al modelo, el resto sale de la caché
+  - preguntas idénticas simultáneas: esperan a una sola llamada
+  - preguntas distintas simultáneas: se reparten en el pool de conexiones
+  - reinicio: una pasarela nueva sobre el mismo archivo responde desde la caché persistente
+  - timeout: un modelo que no responde corta en el tiempo configurado
+  - reintento: un 503 se reintenta y la petición termina bien
+  - flujo: tiempo hasta la primera parte con generar_flujo frente a esperar la respuesta completa
+
+Uso (desde SISTEMA_MANTENIMIENTO):
+    python benchmarks/bench_llm.py [--latencia 0.5] [--repeticiones 10] [--concurrentes 16] [--partes 20]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from llm import PasarelaLLM
+
+PUERTO = 5072
+
+
+class ModeloDePrueba(BaseHTTPRequestHandler):
+    """
+    Modelo falso: /lento no responde a tiempo, /inestable devuelve 503 una vez de cada dos y
+    streamGenerateContent envía la respuesta en partes por SSE repartidas en la latencia.
+    """
+    protocol_version = 'HTTP/1.1'
+    latencia = 0.5
+    partes = 20
+    llamadas = 0
+    _lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with ModeloDePrueba._lock:
+            ModeloDePrueba.llamadas += 1
+            numero = ModeloDePrueba.llamadas
+        if self.path.startswith('/lento'):
+            time.sleep(self.latencia * 10)
+        elif self.path.startswith('/inestable') and numero % 2:
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        elif ':streamGenerateContent' in self.path:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            # Como la API real: cada evento en un trozo de la codificación chunked
+            for i in range(self.partes):
+                time.sleep(self.latencia / self.partes)
+                evento = {'candidates': [{'content': {'parts': [{'text': f"parte {i} "}]}}]}
+                datos = f"data: {json.dumps(evento)}\n\n".encode()
+                self.wfile.write(f"{len(datos):x}\r\n".encode() + datos + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        else:
+            time.sleep(self.latencia)
+        texto = f"Respuesta a {len(cuerpo['contents'][0]['parts'][0]['text'])} caracteres"
+        respuesta = json.dumps({'candidates': [{'content': {'parts': [{'text': texto}]}}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(respuesta)))
+        self.end_headers()
+        self.wfile.write(respuesta)
+
+
+def medir(nombre, funcion):
+    ModeloDePrueba.llamadas = 0
+    inicio = time.perf_counter()
+    funcion()
+    print(f"{nombre:<42} {time.perf_counter() - inicio:>7.2f} s   llamadas al modelo: {ModeloDePrueba.llamadas}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latencia', type=float, default=0.5)
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--concurrentes', type=int, default=16)
+    parser.add_argument('--partes', type=int, default=20)
+    args = parser.parse_args()
+
+    ModeloDePrueba.latencia = args.latencia
+    ModeloDePrueba.partes = args.partes
+    servidor = ThreadingHTTPServer(('127.0.0.1', PUERTO), ModeloDePrueba)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{PUERTO}"
+    ruta = os.path.join(tempfile.mkdtemp(prefix='bench_llm_'), 'llm.sqlite')
+    pasarela = PasarelaLLM(url=f"{base}/{{modelo}}:generateContent", ruta=ruta, conexiones=args.concurrentes,
+                           url_flujo=f"{base}/{{modelo}}:streamGenerateContent?alt=sse")
+    print(f"Modelo de prueba con {args.latencia} s por respuesta\n")
+
+    medir(f"{args.repeticiones} preguntas repetidas",
+          lambda: [pasarela.generar("¿Qué estación revisar?", 'modelo') for _ in range(args.repeticiones)])
+
+    with ThreadPoolExecutor(max_workers=args.concurrentes) as pool:
+        medir(f"{args.concurrentes} preguntas idénticas simultáneas",
+              lambda: list(pool.map(lambda _: pasarela.generar("Resumen del rango", 'modelo'),
+                                    range(args.concurrentes))))
+        medir(f"{args.concurrentes} preguntas distintas simultáneas",
+              lambda: list(pool.map(lambda i: pasarela.generar(f"Pregunta {i}", 'modelo'),
+                                    range(args.concurrentes))))
+    # Misma pregunta con otra configuración de generación: es otra entrada de la caché
+    medir("misma pregunta, otra temperatura",
+          lambda: pasarela.generar("¿Qué estación revisar?", 'modelo', {'temperature': 0.9}))
+
+    reiniciada = PasarelaLLM(url=pasarela.url, ruta=ruta)
+    medir("pasarela nueva (reinicio), pregunta previa",
+          lambda: reiniciada.generar("¿Qué estación revisar?", 'modelo'))
+
+    lenta = PasarelaLLM(url=f"{base}/lento", ruta=ruta, timeout=args.latencia * 2, reintentos=0)
+
+    errores = []
+
+    def con_timeout():
+        try:
+            lenta.generar("Pregunta sin respuesta", 'modelo')
+        except requests.exceptions.Timeout as e:
+            errores.append(e)
+    medir("modelo que no responde", con_timeout)
+    print(f"    {'corta por timeout' if errores else 'no cortó'} ({lenta.timeout[1]:.1f} s)")
+
+    inestable = PasarelaLLM(url=f"{base}/inestable", ruta=ruta)
+    medir("modelo que responde 503 una vez", lambda: inestable.generar("Pregunta con reintento", 'modelo'))
+
+    print()
+    ModeloDePrueba.llamadas = 0
+    inicio = time.perf_counter()
+    pasarela.generar("Pregunta completa", 'modelo')
+    print(f"{'respuesta completa':<42} {time.perf_counter() - inicio:>7.2f} s hasta ver la respuesta")
+    inicio = time.perf_counter()
+    primera = None
+    for _ in pasarela.generar_flujo("Pregunta en flujo", 'modelo'):
+        primera = primera or time.perf_counter() - inicio
+    print(f"{'flujo':<42} {primera:>7.2f} s hasta la primera parte, "
+          f"{time.perf_counter() - inicio:.2f} s en total")
+    inicio = time.perf_counter()
+    partes = list(pasarela.generar_flujo("Pregunta en flujo", 'modelo'))
+    print(f"{'flujo repetido (caché)':<42} {time.perf_counter() - inicio:>7.2f} s, {len(partes)} parte(s)")
+
+    print("\nEstadísticas de la pasarela principal:")
+    for clave, valor in pasarela.estadisticas().items():
+        print(f"    {clave:<24} {valor if not isinstance(valor, float) else round(valor, 3)}")
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
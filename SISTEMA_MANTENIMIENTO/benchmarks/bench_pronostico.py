@@ -0,0 +1,86 @@
+"""
+Compara los motores de pronóstico sobre los Excel de data/.
+
+Mide la latencia de ajuste de cada motor por estación (sin caché) y la concordancia de
+alertas en el horizonte pronosticado: mes a mes se compara si yhat supera el umbral.
+La comparación se hace sobre el horizonte y no contra la fecha de hoy, porque los datos
+históricos terminan antes de hoy y el filtro de fechas futuras dejaría las alertas vacías.
+
+Uso (desde SISTEMA_MANTENIMIENTO):
+    python benchmarks/bench_pronostico.py [--umbral 0.01] [--meses 12] [--repeticiones 3]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from pronostico import MOTORES, obtener_pronosticador
+
+
+def preparar_serie_faltantes(df, estacion):
+    """Serie mensual (ds, y) con la proporción de datos faltantes de una estación."""
+    df_tmp = df[['Fecha', estacion]].copy()
+    df_tmp['faltante'] = df_tmp[estacion].isna().astype(int)
+    df_tmp['mes'] = df_tmp['Fecha'].dt.to_period('M').dt.to_timestamp()
+    total_por_mes = df_tmp.groupby('mes').size()
+    faltantes_por_mes = df_tmp.groupby('mes')['faltante'].sum()
+    proporcion = (faltantes_por_mes / total_por_mes).reset_index()
+    proporcion.columns = ['ds', 'y']
+    return proporcion
+
+
+def medir(pronosticador, serie, meses, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        forecast = pronosticador.ajustar_predecir(serie, meses)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), forecast
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--umbral', type=float, default=0.01)
+    parser.add_argument('--meses', type=int, default=12)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    import prophet  # noqa: F401
+    print(f"Importación de prophet: {time.perf_counter() - inicio:.2f} s\n")
+
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for ruta in sorted(glob.glob(os.path.join(base, 'data', '*.xlsx'))):
+        df = pd.read_excel(ruta, engine='openpyxl')
+        if 'Fecha' not in df.columns:
+            continue
+        df.columns = df.columns.str.strip()
+        df['Fecha'] = pd.to_datetime(df['Fecha'])
+        estaciones = [c for c in df.columns if str(c).startswith('P') and str(c)[1:].isdigit()]
+        print(os.path.basename(ruta))
+        for estacion in estaciones:
+            serie = preparar_serie_faltantes(df, estacion)
+            if len(serie) < 3:
+                continue
+            resultados = {}
+            for nombre in MOTORES:
+                segundos, forecast = medir(obtener_pronosticador(nombre), serie, args.meses, args.repeticiones)
+                horizonte = forecast.tail(args.meses)['yhat'].to_numpy()
+                resultados[nombre] = (segundos, horizonte)
+
+            (t_arm, y_arm), (t_pro, y_pro) = resultados['armonico'], resultados['prophet']
+            concordancia = np.mean((y_arm > args.umbral) == (y_pro > args.umbral)) * 100
+            mae = np.mean(np.abs(y_arm - y_pro))
+            print(f"  {estacion}: armonico {t_arm * 1000:8.2f} ms | prophet {t_pro * 1000:8.2f} ms"
+                  f" | x{t_pro / t_arm:,.0f} | concordancia de alertas {concordancia:5.1f}% | MAE yhat {mae:.3f}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
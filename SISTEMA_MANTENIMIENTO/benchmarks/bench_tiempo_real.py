@@ -0,0 +1,133 @@
+"""
+Detector en línea (tiempo_real.py): lecturas por segundo y coincidencia con el análisis por lotes.
+
+Genera lecturas diarias sintéticas de --estaciones estaciones durante --anios años (con picos,
+valores nulos y días sin lectura) y las envía en orden de fecha, en lotes de --lote lecturas:
+  - detector: DetectorEnLinea.procesar sobre lecturas ya convertidas
+  - lectura + detector: leer_lote sobre el JSON ya decodificado (como llega a /api/lecturas)
+  - POST /api/lecturas con el cliente de pruebas de Flask, sin y con escritura en el almacén
+Después compara las anomalías en línea con las del análisis por lotes (anomalias.detectar con
+los métodos variacion y zscore) y los intervalos sin datos avisados con los días eliminados.
+
+Uso (desde SISTEMA_MANTENIMIENTO):
+    python benchmarks/bench_tiempo_real.py [--estaciones 50] [--anios 10] [--lote 1000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+CARPETA = tempfile.mkdtemp(prefix='bench_tiempo_real_')
+os.environ['ALMACEN_LECTURAS_PATH'] = os.path.join(CARPETA, 'lecturas.sqlite')
+os.environ.setdefault('MOTOR_PRONOSTICO', 'armonico')
+
+import anomalias
+import app as aplicacion
+from tiempo_real import DetectorEnLinea, leer_lote
+
+
+def datos_sinteticos(estaciones, anios, semilla=0):
+    """Lecturas [(estacion, segundos, valor)] en orden de fecha y el DataFrame ancho equivalente."""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range('2010-01-01', periods=int(anios * 365.25), freq='D')
+    dia = fechas.dayofyear.to_numpy()[:, None]
+    valores = 20 + 8 * np.sin(2 * np.pi * dia / 365.25 + rng.uniform(0, 2 * np.pi, estaciones))
+    valores = valores + rng.normal(0, 2, (len(fechas), estaciones))
+    picos = rng.random(valores.shape) < 0.001
+    valores[picos] += rng.choice([-1, 1], picos.sum()) * rng.uniform(15, 30, picos.sum())
+    valores[rng.random(valores.shape) < 0.03] = np.nan
+    # Días en que la estación no envió nada (sin fila, no un nulo)
+    ausentes = rng.random(valores.shape) < 0.002
+    ausentes[0] = False
+    columnas = [f"P{100 + i}" for i in range(estaciones)]
+    segundos = (fechas.to_numpy().astype('datetime64[s]').astype(np.int64)).astype(float)
+
+    filas, columna = np.nonzero(~ausentes)
+    orden = np.lexsort((columna, filas))
+    filas, columna = filas[orden], columna[orden]
+    lecturas = [(columnas[c], s, None if np.isnan(v) else v)
+                for c, s, v in zip(columna.tolist(), segundos[filas].tolist(), valores[filas, columna].tolist())]
+    df = pd.DataFrame(np.where(ausentes, np.nan, valores), columns=columnas)
+    df.insert(0, 'Fecha', fechas)
+    return lecturas, df, columnas, ausentes
+
+
+def por_lotes(lista, tamano):
+    return [lista[i:i + tamano] for i in range(0, len(lista), tamano)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--estaciones', type=int, default=50)
+    parser.add_argument('--anios', type=float, default=10)
+    parser.add_argument('--lote', type=int, default=1000)
+    args = parser.parse_args()
+
+    lecturas, df, estaciones, ausentes = datos_sinteticos(args.estaciones, args.anios)
+    lotes = por_lotes(lecturas, args.lote)
+    print(f"{args.estaciones} estaciones x {len(df)} días: {len(lecturas)} lecturas en lotes de {args.lote}\n")
+
+    def fila(nombre, segundos):
+        print(f"{nombre:<36} {segundos:>7.2f} s   {len(lecturas) / segundos:>10,.0f} lecturas/s")
+
+    detector = DetectorEnLinea()
+    eventos = []
+    inicio = time.perf_counter()
+    for lote in lotes:
+        eventos.extend(detector.procesar(lote)[0])
+    fila('detector', time.perf_counter() - inicio)
+
+    cuerpos = [[{'estacion': e, 'fecha': s, 'valor': v} for e, s, v in lote] for lote in lotes]
+    otro = DetectorEnLinea()
+    inicio = time.perf_counter()
+    for cuerpo in cuerpos:
+        otro.procesar(leer_lote(cuerpo))
+    fila('lectura + detector', time.perf_counter() - inicio)
+
+    cliente = aplicacion.app.test_client()
+    for guardar in (False, True):
+        aplicacion.GUARDAR_LECTURAS_EN_LINEA = guardar
+        aplicacion.detector_en_linea = DetectorEnLinea()
+        inicio = time.perf_counter()
+        for cuerpo in cuerpos:
+            respuesta = cliente.post('/api/lecturas', json={'lecturas': cuerpo})
+            assert respuesta.status_code == 200, respuesta.get_json()
+        fila(f"POST /api/lecturas ({'con' if guardar else 'sin'} almacén)", time.perf_counter() - inicio)
+
+    # Coincidencia con el análisis por lotes
+    print()
+    anomalias_en_linea = {}
+    for evento in eventos:
+        if evento['tipo'] == 'anomalia':
+            for criterio in evento['criterios']:
+                anomalias_en_linea.setdefault(criterio, set()).add((evento['estacion'], evento['fecha'][:10]))
+
+    fechas_lote, _, por_estacion = anomalias.detectar(df, estaciones, 'variacion')
+    variacion = {(e, f) for e in estaciones for f in anomalias.formatear_fechas(fechas_lote[por_estacion[e]])}
+    # El análisis por lotes compara con las filas anteriores del archivo; en línea no hay fila para
+    # los días sin lectura, así que se comparan las lecturas recibidas
+    fechas = df['Fecha'].to_numpy()
+    zscore = set()
+    for i, estacion in enumerate(estaciones):
+        filas = np.flatnonzero(~ausentes[:, i])
+        _, _, por_estacion = anomalias.detectar(df.iloc[filas][['Fecha', estacion]], [estacion], 'zscore')
+        zscore |= {(estacion, f) for f in anomalias.formatear_fechas(fechas[filas][por_estacion[estacion]])}
+    for nombre, lotes_, linea in (('variación %', variacion, anomalias_en_linea.get('variacion', set())),
+                                  ('puntaje z', zscore, anomalias_en_linea.get('zscore', set()))):
+        print(f"{nombre:<12} por lotes {len(lotes_):>6}   en línea {len(linea):>6}   iguales: "
+              f"{'sí' if lotes_ == linea else f'no ({len(lotes_ ^ linea)} diferencias)'}")
+
+    huecos = sum(evento['lecturas'] for evento in eventos if evento.get('motivo') == 'sin_lectura')
+    nulos = sum(1 for evento in eventos if evento.get('motivo') == 'nulo')
+    print(f"días sin lectura: {int(ausentes.sum())} eliminados, {huecos} avisados; "
+          f"valores nulos: {sum(v is None for _, _, v in lecturas)} enviados, {nulos} avisados")
+
+
+if __name__ == '__main__':
+    main()
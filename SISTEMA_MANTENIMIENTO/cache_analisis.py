@@ -0,0 +1,113 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pandas as pd
+
+# --- Estado persistente del análisis de estaciones ---
+# Guarda el acumulador (agregados mensuales, conteos, último valor por estación) de cada archivo
+# analizado junto con la última fecha vista, el número de filas y una huella de esas filas.
+# Si se vuelve a subir el mismo libro con filas nuevas al final, el análisis parte del estado
+# guardado y solo procesa las filas posteriores a esa fecha.
+
+RUTA_CACHE_ANALISIS = os.environ.get('CACHE_ANALISIS_PATH', os.path.join('cache', 'analisis.sqlite'))
+MAX_ENTRADAS = int(os.environ.get('CACHE_ANALISIS_MAX_ENTRADAS', 50))
+# Candidatos que se comparan por firma al buscar un prefijo ya analizado
+MAX_CANDIDATOS = 5
+
+
+class CacheAnalisis:
+    """Estados de AcumuladorEstaciones en SQLite, con expulsión LRU."""
+
+    def __init__(self, ruta=RUTA_CACHE_ANALISIS, max_entradas=MAX_ENTRADAS):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._inicializada = False
+
+    def _conectar(self):
+        if not self._inicializada:
+            carpeta = os.path.dirname(self.ruta)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+        conn = sqlite3.connect(self.ruta, timeout=30)
+        if not self._inicializada:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS estados ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, firma TEXT, ultima_fecha TEXT, filas INTEGER,"
+                " huella TEXT, estado BLOB, creado REAL, ultimo_uso REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_estados_firma ON estados (firma, ultimo_uso)")
+            conn.commit()
+            self._inicializada = True
+        return conn
+
+    def buscar(self, firma, limite=MAX_CANDIDATOS):
+        """Devuelve [(id, ultima_fecha, filas, huella)] de los estados con esa firma, más recientes primero."""
+        with closing(self._conectar()) as conn:
+            filas = conn.execute(
+                "SELECT id, ultima_fecha, filas, huella FROM estados WHERE firma = ?"
+                " ORDER BY ultimo_uso DESC LIMIT ?",
+                (firma, limite),
+            ).fetchall()
+        return [(id_, pd.Timestamp(fecha), n, huella) for id_, fecha, n, huella in filas]
+
+    def cargar(self, id_):
+        """Devuelve el acumulador guardado o None."""
+        with closing(self._conectar()) as conn:
+            fila = conn.execute("SELECT estado FROM estados WHERE id = ?", (id_,)).fetchone()
+            if fila is not None:
+                conn.execute("UPDATE estados SET ultimo_uso = ? WHERE id = ?", (time.time(), id_))
+                conn.commit()
+        with self._lock:
+            if fila is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            return pickle.loads(fila[0])
+        except Exception as e:
+            print(f"Estado de análisis ilegible, se recalcula: {e}")
+            return None
+
+    def guardar(self, firma, acumulador, huella):
+        if acumulador.ultima_fecha is None:
+            return
+        ahora = time.time()
+        estado = pickle.dumps(acumulador, protocol=pickle.HIGHEST_PROTOCOL)
+        with closing(self._conectar()) as conn:
+            # Un mismo contenido se guarda una sola vez
+            conn.execute("DELETE FROM estados WHERE firma = ? AND huella = ?", (firma, huella))
+            conn.execute(
+                "INSERT INTO estados (firma, ultima_fecha, filas, huella, estado, creado, ultimo_uso)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (firma, acumulador.ultima_fecha.isoformat(), acumulador.total, huella, estado, ahora, ahora),
+            )
+            conn.execute(
+                "DELETE FROM estados WHERE id NOT IN"
+                " (SELECT id FROM estados ORDER BY ultimo_uso DESC LIMIT ?)",
+                (self.max_entradas,),
+            )
+            conn.commit()
+
+    def limpiar(self):
+        with closing(self._conectar()) as conn:
+            conn.execute("DELETE FROM estados")
+            conn.commit()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def estadisticas(self):
+        with closing(self._conectar()) as conn:
+            entradas = conn.execute("SELECT COUNT(*) FROM estados").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entradas': entradas}
+
+
+cache_analisis = CacheAnalisis()
@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pandas as pd
+
+# --- Caché persistente de datos climáticos históricos ---
+# Los valores del archivo de Open-Meteo para fechas pasadas no cambian, así que se guardan
+# en SQLite con clave (lat, lon, fecha, variables) y se reutilizan entre ejecuciones y procesos.
+# Los días que la API devuelve sin ningún valor también se guardan (todos los valores nulos)
+# para no volver a pedirlos en cada ejecución, pero caducan antes: suelen ser fechas recientes
+# que el archivo aún no ha consolidado.
+
+RUTA_CACHE_CLIMA = os.environ.get('CACHE_CLIMA_PATH', os.path.join('cache', 'clima.sqlite'))
+MAX_REGISTROS = int(os.environ.get('CACHE_CLIMA_MAX_REGISTROS', 500000))
+MAX_EDAD_DIAS = float(os.environ.get('CACHE_CLIMA_MAX_EDAD_DIAS', 365))
+MAX_EDAD_VACIOS_DIAS = float(os.environ.get('CACHE_CLIMA_MAX_EDAD_VACIOS_DIAS', 7))
+
+
+class CacheClima:
+    """Caché read-through/write-through de valores climáticos diarios sobre SQLite."""
+
+    def __init__(self, ruta=RUTA_CACHE_CLIMA, max_registros=MAX_REGISTROS, max_edad_dias=MAX_EDAD_DIAS,
+                 max_edad_vacios_dias=MAX_EDAD_VACIOS_DIAS):
+        self.ruta = ruta
+        self.max_registros = max_registros
+        self.max_edad_dias = max_edad_dias
+        self.max_edad_vacios_dias = max_edad_vacios_dias
+        self.hits = 0
+        self.misses = 0
+        # Aciertos que corresponden a días guardados sin valores
+        self.vacios = 0
+        self._lock = threading.Lock()
+        self._inicializada = False
+
+    def _conectar(self):
+        if not self._inicializada:
+            carpeta = os.path.dirname(self.ruta)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+        conn = sqlite3.connect(self.ruta, timeout=30)
+        if not self._inicializada:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS clima ("
+                " lat REAL, lon REAL, fecha TEXT, variables TEXT, valores TEXT, creado REAL,"
+                " PRIMARY KEY (lat, lon, fecha, variables))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_clima_creado ON clima (creado)")
+            conn.commit()
+            self._inicializada = True
+        return conn
+
+    @staticmethod
+    def _clave(lat, lon, variables):
+        return round(float(lat), 6), round(float(lon), 6), ','.join(variables)
+
+    def leer(self, lat, lon, fechas, variables):
+        """Devuelve un DataFrame indexado por fecha con los valores en caché para esas fechas."""
+        lat, lon, clave_vars = self._clave(lat, lon, variables)
+        fechas_str = sorted({f.strftime('%Y-%m-%d') for f in fechas})
+        filas = {}
+        vacios = 0
+        limite = time.time() - self.max_edad_dias * 86400 if self.max_edad_dias else 0
+        limite_vacios = time.time() - self.max_edad_vacios_dias * 86400 if self.max_edad_vacios_dias else 0
+        with closing(self._conectar()) as conn:
+            # SQLite limita el número de parámetros por consulta
+            for i in range(0, len(fechas_str), 500):
+                bloque = fechas_str[i:i + 500]
+                marcas = ','.join('?' * len(bloque))
+                cursor = conn.execute(
+                    f"SELECT fecha, valores, creado FROM clima WHERE lat = ? AND lon = ? AND variables = ?"
+                    f" AND creado >= ? AND fecha IN ({marcas})",
+                    [lat, lon, clave_vars, limite, *bloque],
+                )
+                for fecha, valores, creado in cursor:
+                    valores = json.loads(valores)
+                    if all(v is None for v in valores.values()):
+                        if creado < limite_vacios:
+                            continue
+                        vacios += 1
+                    filas[fecha] = valores
+        with self._lock:
+            self.hits += len(filas)
+            self.misses += len(fechas_str) - len(filas)
+            self.vacios += vacios
+        df = pd.DataFrame.from_dict(filas, orient='index', columns=list(variables), dtype=float)
+        df.index = pd.to_datetime(df.index)
+        df.index.name = 'Fecha'
+        return df.sort_index()
+
+    def escribir(self, lat, lon, diario, variables):
+        """Guarda los valores diarios de un DataFrame indexado por fecha."""
+        lat, lon, clave_vars = self._clave(lat, lon, variables)
+        # Los días sin ningún valor se guardan con todos los valores nulos (ver MAX_EDAD_VACIOS_DIAS)
+        diario = diario.reindex(columns=list(variables))
+        if diario.empty:
+            return
+        ahora = time.time()
+        registros = [
+            (lat, lon, fecha.strftime('%Y-%m-%d'), clave_vars,
+             json.dumps({col: (None if pd.isna(valor) else float(valor)) for col, valor in fila.items()}),
+             ahora)
+            for fecha, fila in diario.iterrows()
+        ]
+        with closing(self._conectar()) as conn:
+            conn.executemany("INSERT OR REPLACE INTO clima VALUES (?, ?, ?, ?, ?, ?)", registros)
+            conn.commit()
+        self.purgar()
+
+    def obtener(self, lat, lon, fechas, variables, cargar):
+        """
+        Lectura read-through: devuelve los valores para las fechas pedidas, llamando a
+        cargar(fechas_faltantes) solo para las que no están en caché y guardando el resultado.
+        """
+        fechas = pd.DatetimeIndex(pd.to_datetime(fechas)).normalize().unique()
+        en_cache = self.leer(lat, lon, fechas, variables)
+        faltantes = fechas.difference(en_cache.index)
+        partes = [en_cache]
+        if len(faltantes):
+            nuevos = cargar(faltantes)
+            if nuevos is not None and not nuevos.empty:
+                self.escribir(lat, lon, nuevos, variables)
+                partes.append(nuevos.reindex(columns=list(variables)))
+        partes = [p for p in partes if not p.empty]
+        if not partes:
+            return pd.DataFrame(columns=list(variables), index=pd.DatetimeIndex([], name='Fecha'), dtype=float)
+        diario = pd.concat(partes)
+        return diario[~diario.index.duplicated()].sort_index()
+
+    def purgar(self):
+        """Elimina registros más antiguos que max_edad_dias y, si se supera max_registros, los más viejos."""
+        with closing(self._conectar()) as conn:
+            if self.max_edad_dias:
+                conn.execute("DELETE FROM clima WHERE creado < ?", (time.time() - self.max_edad_dias * 86400,))
+            if self.max_registros:
+                total = conn.execute("SELECT COUNT(*) FROM clima").fetchone()[0]
+                exceso = total - self.max_registros
+                if exceso > 0:
+                    conn.execute(
+                        "DELETE FROM clima WHERE rowid IN (SELECT rowid FROM clima ORDER BY creado LIMIT ?)",
+                        (exceso,),
+                    )
+            conn.commit()
+
+    def limpiar(self):
+        """Vacía la caché y reinicia los contadores."""
+        with closing(self._conectar()) as conn:
+            conn.execute("DELETE FROM clima")
+            conn.commit()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.vacios = 0
+
+    def estadisticas(self):
+        with closing(self._conectar()) as conn:
+            registros = conn.execute("SELECT COUNT(*) FROM clima").fetchone()[0]
+        consultas = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'vacios': self.vacios,
+            'tasa_aciertos': self.hits / consultas if consultas else 0.0,
+            'registros': registros,
+        }
+
+
+# Instancia compartida por app.py y faltantes.py
+cache_clima = CacheClima()
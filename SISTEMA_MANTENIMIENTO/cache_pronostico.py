@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pandas as pd
+
+# --- Caché persistente de pronósticos por estación ---
+# La clave es una huella de la serie mensual de faltantes más los parámetros del modelo y el
+# horizonte; si el mismo Excel se vuelve a subir, las estaciones sin cambios no se reajustan.
+# Se guarda el pronóstico completo (ds, yhat) y el filtro por fecha/umbral se aplica al leer.
+
+RUTA_CACHE_PRONOSTICO = os.environ.get('CACHE_PRONOSTICO_PATH', os.path.join('cache', 'pronosticos.sqlite'))
+MAX_ENTRADAS = int(os.environ.get('CACHE_PRONOSTICO_MAX_ENTRADAS', 500))
+
+
+def huella_serie(serie, parametros, meses_a_predecir):
+    """Hash de la serie (ds, y) junto con los parámetros del modelo y el horizonte."""
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(serie[['ds', 'y']], index=False).values.tobytes())
+    h.update(json.dumps(parametros, sort_keys=True, default=str).encode())
+    h.update(str(meses_a_predecir).encode())
+    return h.hexdigest()
+
+
+class CachePronostico:
+    """Caché LRU en disco de pronósticos, sobre SQLite."""
+
+    def __init__(self, ruta=RUTA_CACHE_PRONOSTICO, max_entradas=MAX_ENTRADAS):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._inicializada = False
+
+    def _conectar(self):
+        if not self._inicializada:
+            carpeta = os.path.dirname(self.ruta)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+        conn = sqlite3.connect(self.ruta, timeout=30)
+        if not self._inicializada:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pronosticos ("
+                " clave TEXT PRIMARY KEY, pronostico TEXT, creado REAL, ultimo_uso REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_pronosticos_uso ON pronosticos (ultimo_uso)")
+            conn.commit()
+            self._inicializada = True
+        return conn
+
+    def leer(self, clave):
+        """Devuelve el pronóstico (DataFrame ds, yhat) guardado o None."""
+        with closing(self._conectar()) as conn:
+            fila = conn.execute("SELECT pronostico FROM pronosticos WHERE clave = ?", (clave,)).fetchone()
+            if fila is not None:
+                conn.execute("UPDATE pronosticos SET ultimo_uso = ? WHERE clave = ?", (time.time(), clave))
+                conn.commit()
+        with self._lock:
+            if fila is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        datos = json.loads(fila[0])
+        return pd.DataFrame({'ds': pd.to_datetime(datos['ds']), 'yhat': datos['yhat']})
+
+    def escribir(self, clave, pronostico):
+        datos = json.dumps({
+            'ds': pronostico['ds'].dt.strftime('%Y-%m-%d').tolist(),
+            'yhat': [float(v) for v in pronostico['yhat']],
+        })
+        ahora = time.time()
+        with closing(self._conectar()) as conn:
+            conn.execute("INSERT OR REPLACE INTO pronosticos VALUES (?, ?, ?, ?)", (clave, datos, ahora, ahora))
+            # Expulsa las entradas usadas hace más tiempo
+            conn.execute(
+                "DELETE FROM pronosticos WHERE clave NOT IN"
+                " (SELECT clave FROM pronosticos ORDER BY ultimo_uso DESC LIMIT ?)",
+                (self.max_entradas,),
+            )
+            conn.commit()
+
+    def limpiar(self):
+        with closing(self._conectar()) as conn:
+            conn.execute("DELETE FROM pronosticos")
+            conn.commit()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def estadisticas(self):
+        with closing(self._conectar()) as conn:
+            entradas = conn.execute("SELECT COUNT(*) FROM pronosticos").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entradas': entradas}
+
+
+cache_pronostico = CachePronostico()
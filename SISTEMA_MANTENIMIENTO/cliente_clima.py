@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- Cliente HTTP para la API de clima ---
+# Sesión con conexiones reutilizables, concurrencia acotada, límite de peticiones por host,
+# reintentos con espera exponencial ante 429/5xx y timeouts. La espera entre reintentos (también la
+# que pide el servidor con Retry-After) se acota a MAX_ESPERA_REINTENTO segundos.
+
+MAX_WORKERS = int(os.environ.get('CLIMA_MAX_WORKERS', 4))
+PETICIONES_POR_SEGUNDO = float(os.environ.get('CLIMA_PETICIONES_POR_SEGUNDO', 10))
+TIMEOUT = float(os.environ.get('CLIMA_TIMEOUT', 30))
+REINTENTOS = int(os.environ.get('CLIMA_REINTENTOS', 3))
+MAX_ESPERA_REINTENTO = float(os.environ.get('CLIMA_MAX_ESPERA_REINTENTO', 30))
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+
+class LimitadorTasa:
+    """Reparte turnos por host para no superar un número de peticiones por segundo."""
+
+    def __init__(self, peticiones_por_segundo):
+        self.intervalo = 1.0 / peticiones_por_segundo if peticiones_por_segundo else 0.0
+        self._siguiente = {}
+        self._lock = threading.Lock()
+
+    def esperar(self, host):
+        if not self.intervalo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente.get(host, 0.0))
+            self._siguiente[host] = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+class ClienteClima:
+    """Cliente HTTP concurrente con sesión compartida y estadísticas de rendimiento."""
+
+    def __init__(self, max_workers=MAX_WORKERS, peticiones_por_segundo=PETICIONES_POR_SEGUNDO,
+                 timeout=TIMEOUT, reintentos=REINTENTOS, backoff=0.5, max_espera=MAX_ESPERA_REINTENTO):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.max_espera = max_espera
+        self.limitador = LimitadorTasa(peticiones_por_segundo)
+        # Acota las peticiones en vuelo aunque se llame a mapear() de forma anidada
+        self._en_vuelo = threading.BoundedSemaphore(max_workers)
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adaptador)
+        self.session.mount('https://', adaptador)
+        self._lock = threading.Lock()
+        self.reiniciar_estadisticas()
+
+    def reiniciar_estadisticas(self):
+        with self._lock:
+            self._stats = {'peticiones': 0, 'exitos': 0, 'errores': 0, 'reintentos': 0, 'segundos_espera': 0.0}
+            self._inicio = None
+            self._fin = None
+
+    def _registrar(self, campo, inicio=None):
+        with self._lock:
+            self._stats[campo] += 1
+            if inicio is not None:
+                self._stats['peticiones'] += 1
+                self._inicio = inicio if self._inicio is None else min(self._inicio, inicio)
+                self._fin = time.monotonic()
+
+    def _espera_reintento(self, intento, respuesta=None):
+        espera = self.backoff * (2 ** intento)
+        if respuesta is not None:
+            retry_after = respuesta.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                espera = float(retry_after)
+        return min(espera, self.max_espera)
+
+    def _esperar_reintento(self, intento, respuesta=None):
+        self._registrar('reintentos')
+        espera = self._espera_reintento(intento, respuesta)
+        with self._lock:
+            self._stats['segundos_espera'] += espera
+        time.sleep(espera)
+
+    def get_json(self, url, params=None):
+        """GET con límite de tasa, timeout y reintentos; devuelve el JSON de la respuesta."""
+        host = urlparse(url).netloc
+        for intento in range(self.reintentos + 1):
+            self.limitador.esperar(host)
+            inicio = time.monotonic()
+            try:
+                with self._en_vuelo:
+                    r = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._registrar('errores', inicio)
+                if intento == self.reintentos:
+                    raise
+                self._esperar_reintento(intento)
+                continue
+            if r.status_code in ESTADOS_REINTENTABLES and intento < self.reintentos:
+                self._registrar('errores', inicio)
+                self._esperar_reintento(intento, r)
+                continue
+            if r.ok:
+                self._registrar('exitos', inicio)
+            else:
+                self._registrar('errores', inicio)
+            r.raise_for_status()
+            return r.json()
+
+    def mapear(self, funcion, elementos):
+        """Aplica funcion a cada elemento en paralelo y devuelve los resultados en orden."""
+        elementos = list(elementos)
+        if len(elementos) <= 1 or self.max_workers <= 1:
+            return [funcion(e) for e in elementos]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(elementos))) as pool:
+            return list(pool.map(funcion, elementos))
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            duracion = (self._fin - self._inicio) if self._inicio is not None else 0.0
+        stats['segundos'] = duracion
+        stats['peticiones_por_segundo'] = stats['peticiones'] / duracion if duracion > 0 else 0.0
+        return stats
+
+    def cerrar(self):
+        self.session.close()
@@ -0,0 +1,161 @@
+import os
+import threading
+
+import pandas as pd
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = lambda x, **kwargs: x
+from cache_clima import cache_clima
+from cliente_clima import ClienteClima
+
+# --- Consulta de datos climáticos (Open-Meteo) compartida por app.py y faltantes.py ---
+
+TIMEZONE = 'America/Guayaquil'
+ARCHIVE_URL = os.environ.get("OPEN_METEO_ARCHIVE_URL", "https://archive-api.open-meteo.com/v1/archive")
+SENSORES_COORDS = {
+    'P42': {'lat': -0.6022867145410288, 'lon': -78.1986689291808},
+    'P43': {'lat': -0.5934839659614135, 'lon': -78.20825370752031},
+    'P55': {'lat': -0.5731364867736277, 'lon': -78.138},
+}
+
+# Variable diaria de Open-Meteo -> columna usada en las tablas del sistema
+VARIABLES_DIARIAS = {
+    'precipitation_sum': 'precipitacion_mm',
+    'windspeed_10m_max': 'viento_max_kmh',
+    'temperature_2m_max': 'temperatura_max',
+}
+COLUMNAS_CLIMA = list(VARIABLES_DIARIAS.values())
+
+# Fechas separadas por huecos de hasta este número de días se piden en una sola consulta.
+# Descargar algunos días de más es mucho más barato que hacer otra petición HTTP.
+MAX_HUECO_DIAS = 400
+
+# Cliente compartido: sesión con keep-alive, límite de tasa y reintentos
+cliente_clima = ClienteClima()
+
+
+def consultar_clima_rango(inicio, fin, lat, lon):
+    """Consulta el clima diario entre dos fechas y devuelve un DataFrame indexado por fecha."""
+    inicio_str = inicio.strftime('%Y-%m-%d')
+    fin_str = fin.strftime('%Y-%m-%d')
+    params = {
+        'latitude': lat,
+        'longitude': lon,
+        'start_date': inicio_str,
+        'end_date': fin_str,
+        'daily': ','.join(VARIABLES_DIARIAS),
+        'timezone': TIMEZONE,
+    }
+    try:
+        data = cliente_clima.get_json(ARCHIVE_URL, params=params)
+        if 'daily' in data and data['daily']:
+            diario = pd.DataFrame(data['daily'])
+            diario['time'] = pd.to_datetime(diario['time'])
+            diario = diario.set_index('time').rename(columns=VARIABLES_DIARIAS)
+            diario.index.name = 'Fecha'
+            return diario.reindex(columns=COLUMNAS_CLIMA)
+        print(f"Advertencia: Datos incompletos para {inicio_str} - {fin_str}.")
+    except Exception as e:
+        print(f"Error consultando clima para {inicio_str} - {fin_str}: {e}")
+    return pd.DataFrame(columns=COLUMNAS_CLIMA, index=pd.DatetimeIndex([], name='Fecha'))
+
+
+def agrupar_rangos(fechas, max_hueco_dias=MAX_HUECO_DIAS):
+    """
+    Agrupa fechas en rangos (inicio, fin) cortando donde el hueco supera max_hueco_dias.
+    Con max_hueco_dias=None se devuelve un único rango entre la fecha mínima y la máxima.
+    """
+    fechas = pd.Series(pd.to_datetime(fechas)).dt.normalize().drop_duplicates().sort_values()
+    if fechas.empty:
+        return []
+    if max_hueco_dias is None:
+        return [(fechas.iloc[0], fechas.iloc[-1])]
+    corte = fechas.diff() > pd.Timedelta(days=max_hueco_dias)
+    grupos = fechas.groupby(corte.cumsum().to_numpy())
+    return list(zip(grupos.min(), grupos.max()))
+
+
+def clima_diario(fechas, lat, lon, max_hueco_dias=MAX_HUECO_DIAS, cache=cache_clima, desc="Consultando clima"):
+    """
+    Valores climáticos diarios para las fechas pedidas, indexados por fecha.
+
+    Las fechas que ya están en la caché no se consultan; el resto se agrupa en rangos
+    y se hace una petición por rango.
+    """
+    def cargar(pendientes):
+        rangos = agrupar_rangos(pendientes, max_hueco_dias)
+        diarios = cliente_clima.mapear(lambda rango: consultar_clima_rango(rango[0], rango[1], lat, lon),
+                                       tqdm(rangos, desc=desc))
+        diarios = [d for d in diarios if not d.empty]
+        if not diarios:
+            return None
+        diario = pd.concat(diarios)
+        return diario[~diario.index.duplicated()]
+
+    if cache is None:
+        diario = cargar(pd.DatetimeIndex(pd.to_datetime(fechas)).normalize())
+        return diario if diario is not None else pd.DataFrame(columns=COLUMNAS_CLIMA, dtype=float)
+    return cache.obtener(lat, lon, fechas, COLUMNAS_CLIMA, cargar)
+
+
+def consultar_clima_lote(faltantes, max_hueco_dias=MAX_HUECO_DIAS, cache=cache_clima, progreso=None):
+    """
+    Consulta el clima para un DataFrame con columnas Fecha y Sensor.
+
+    Las fechas de cada sensor se agrupan en rangos y se hace una petición por rango;
+    los valores diarios se recortan localmente para cada fecha faltante.
+    Si se pasa progreso, se llama como progreso(sensores_listos, total_sensores, mensaje).
+    """
+    grupos = list(faltantes.groupby('Sensor', sort=False))
+    listos = []
+    lock = threading.Lock()
+
+    def procesar_sensor(item):
+        sensor, grupo = item
+        fechas = pd.to_datetime(grupo['Fecha'])
+        clima = pd.DataFrame(index=fechas.index, columns=COLUMNAS_CLIMA, dtype=float)
+        coords = SENSORES_COORDS.get(sensor)
+        if coords:
+            diario = clima_diario(fechas, coords['lat'], coords['lon'], max_hueco_dias, cache,
+                                  desc=f"Consultando clima {sensor}")
+            if not diario.empty:
+                valores = diario.reindex(fechas.dt.normalize())
+                clima[COLUMNAS_CLIMA] = valores.to_numpy(dtype=float)
+        clima.insert(0, 'Sensor', sensor)
+        clima.insert(0, 'Fecha', fechas)
+        if progreso is not None:
+            with lock:
+                listos.append(sensor)
+                progreso(len(listos), len(grupos), f"Clima consultado para {sensor}")
+        return clima
+
+    # Los sensores se consultan en paralelo; el cliente acota las peticiones en vuelo
+    partes = cliente_clima.mapear(procesar_sensor, grupos)
+    if not partes:
+        return pd.DataFrame(columns=['Fecha', 'Sensor'] + COLUMNAS_CLIMA)
+    return pd.concat(partes).sort_index().reset_index(drop=True)
+
+
+def completar_filas_con_clima(df, resultado, columna='precipitacion_mm'):
+    """
+    Devuelve una copia de df donde, para cada (Fecha, Sensor) de resultado con valor en
+    columna, la celda del sensor en esa fecha toma dicho valor.
+
+    Los resultados se pivotan a formato ancho (Fecha x Sensor) y se aplican con un único
+    update alineado por Fecha, en lugar de recorrer fila a fila.
+    """
+    completado = df.copy()
+    if resultado.empty:
+        return completado
+    valores = resultado.dropna(subset=[columna])
+    valores = valores[valores['Sensor'].isin(completado.columns)]
+    if valores.empty:
+        return completado
+    ancho = (valores.drop_duplicates(subset=['Fecha', 'Sensor'], keep='last')
+             .pivot(index='Fecha', columns='Sensor', values=columna))
+    # Cada fila del original toma el valor de su fecha, aunque la fecha esté repetida
+    relleno = ancho.reindex(pd.to_datetime(completado['Fecha']).to_numpy())
+    relleno.index = completado.index
+    completado.update(relleno)
+    return completado
@@ -0,0 +1,168 @@
+import math
+import os
+
+import pandas as pd
+
+from almacen_resultados import almacen_resultados
+
+# --- Contexto acotado para el asistente (/ask-clima-bot) ---
+# Antes el prompt se armaba en cada pregunta con todas las fechas faltantes de cada estación y
+# la tabla de clima completa, así que crecía con el historial cargado (y con él la latencia y el
+# costo del LLM). Aquí el último análisis y la última tabla de clima se resumen:
+#   - fechas faltantes como rangos de fechas consecutivas,
+#   - las anomalías de mayor variación,
+#   - los meses con más faltantes,
+#   - el clima por sensor (promedios, extremos y días de más lluvia).
+# El resumen se recorta hasta caber en un presupuesto de tokens y se guarda en el almacén
+# compartido bajo las versiones del análisis y de la tabla de clima: se calcula una vez por
+# carga y las preguntas siguientes (en cualquier worker) reutilizan el texto.
+
+PRESUPUESTO_TOKENS = int(os.environ.get('BOT_PRESUPUESTO_TOKENS', 1500))
+# Estimación aproximada para texto en español (sin tokenizador del modelo)
+CARACTERES_POR_TOKEN = 4
+# Elementos por lista en cada nivel de detalle; se baja de nivel hasta que el contexto cabe
+NIVELES_DETALLE = (10, 5, 3, 1)
+
+
+def estimar_tokens(texto):
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def rangos_fechas(fechas):
+    """
+    Agrupa fechas en rangos consecutivos [(inicio, fin, cantidad)]. Si todas caen el día 1 se
+    consideran mensuales; si no, consecutivas son las separadas por el paso más frecuente en días.
+    """
+    fechas = pd.to_datetime(pd.Series(fechas), errors='coerce').dropna().drop_duplicates().sort_values()
+    if fechas.empty:
+        return []
+    if (fechas.dt.day == 1).all():
+        posicion = fechas.dt.year * 12 + fechas.dt.month
+    else:
+        posicion = (fechas - pd.Timestamp('1970-01-01')).dt.days
+    saltos = posicion.diff()
+    paso = saltos.mode().iloc[0] if len(fechas) > 1 else 1
+    grupo = (saltos != paso).cumsum()
+    rangos = fechas.groupby(grupo.to_numpy()).agg(['first', 'last', 'count'])
+    return list(rangos.itertuples(index=False, name=None))
+
+
+def texto_rango(inicio, fin, cantidad):
+    if cantidad == 1:
+        return inicio.strftime('%Y-%m-%d')
+    return f"{inicio:%Y-%m-%d} a {fin:%Y-%m-%d} ({cantidad})"
+
+
+def lista_acotada(elementos, n, separador='; '):
+    """Los primeros n elementos unidos, indicando cuántos se omitieron."""
+    texto = separador.join(elementos[:n])
+    if len(elementos) > n:
+        texto += f"{separador}y {len(elementos) - n} más"
+    return texto
+
+
+def resumen_estacion(estacion, datos, n):
+    lineas = [
+        f"--- Estación {estacion} ---",
+        f"  - Registros: {datos['total']}; faltantes: {datos['faltantes']} ({datos['porcentaje']:.2f}%); "
+        f"estado: {datos['estado']}",
+    ]
+
+    rangos = rangos_fechas(datos.get('fechas_faltantes', []))
+    if rangos:
+        # Los rangos más largos primero: son los que más explican los faltantes
+        rangos = sorted(rangos, key=lambda r: -r[2])
+        lineas.append(f"  - Fechas faltantes en {len(rangos)} rangos: "
+                      f"{lista_acotada([texto_rango(*r) for r in rangos], n)}")
+    else:
+        lineas.append("  - Fechas faltantes: ninguna")
+
+    anomalias = datos.get('fechas_anomalias', [])
+    total_anomalias = datos.get('total_anomalias', len(anomalias))
+    if anomalias:
+        mayores = sorted(anomalias, key=lambda a: -abs(a['variacion']))[:n]
+        ejemplos = ', '.join(f"{a['Fecha_str']} ({a['variacion']:+.1f}%)" for a in mayores)
+        lineas.append(f"  - Anomalías: {total_anomalias}; mayores variaciones: {ejemplos}")
+    else:
+        lineas.append("  - Anomalías: ninguna")
+
+    meses = [m for m in datos.get('reporte_mensual', []) if m.get('faltantes')]
+    if meses:
+        peores = sorted(meses, key=lambda m: -m['porcentaje_faltantes'])
+        textos = [f"{pd.Timestamp(m['mes']):%Y-%m} ({m['porcentaje_faltantes']:.0f}%)" for m in peores]
+        lineas.append(f"  - Meses con más faltantes ({len(meses)} con faltantes): {lista_acotada(textos, n, ', ')}")
+
+    if datos.get('fechas_mantenimiento'):
+        lineas.append(f"  - Próximo mantenimiento predictivo: {datos['fechas_mantenimiento'][0]}")
+    if datos.get('recomendaciones'):
+        lineas.append(f"  - Recomendación principal: {datos['recomendaciones'][0]}")
+    return "\n".join(lineas)
+
+
+def resumen_clima(registros, n):
+    df = pd.DataFrame(registros)
+    if df.empty or 'Sensor' not in df.columns:
+        return "No hay datos climáticos históricos cargados para consultar."
+    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    for columna in ('precipitacion_mm', 'viento_max_kmh', 'temperatura_max'):
+        df[columna] = pd.to_numeric(df.get(columna), errors='coerce')
+
+    lineas = [f"Datos climáticos de las fechas sin datos ({len(df)} fechas completadas):"]
+    for sensor, grupo in df.groupby('Sensor'):
+        partes = [f"  - {sensor}: {len(grupo)} fechas ({grupo['Fecha'].min():%Y-%m-%d} a {grupo['Fecha'].max():%Y-%m-%d})"]
+        if grupo['precipitacion_mm'].notna().any():
+            maxima = grupo.loc[grupo['precipitacion_mm'].idxmax()]
+            partes.append(f"precipitación media {grupo['precipitacion_mm'].mean():.1f} mm "
+                          f"(máx {maxima['precipitacion_mm']:.1f} el {maxima['Fecha']:%Y-%m-%d})")
+        if grupo['temperatura_max'].notna().any():
+            partes.append(f"temp. máx media {grupo['temperatura_max'].mean():.1f} °C")
+        if grupo['viento_max_kmh'].notna().any():
+            partes.append(f"viento máx {grupo['viento_max_kmh'].max():.1f} km/h")
+        lineas.append("; ".join(partes))
+
+    lluviosos = df.dropna(subset=['precipitacion_mm']).nlargest(n, 'precipitacion_mm')
+    if not lluviosos.empty:
+        dias = ', '.join(f"{f['Fecha']:%Y-%m-%d} {f['Sensor']} ({f['precipitacion_mm']:.1f} mm)"
+                         for _, f in lluviosos.iterrows())
+        lineas.append(f"  - Días de mayor precipitación: {dias}")
+    return "\n".join(lineas)
+
+
+def construir_contexto(analisis, registros_clima, presupuesto=PRESUPUESTO_TOKENS):
+    """
+    Texto con el resumen del análisis de sensores y del clima que cabe en presupuesto tokens
+    (estimados): se prueba con listas cada vez más cortas y, si aún no cabe, se recorta.
+    """
+    for n in NIVELES_DETALLE:
+        partes = [resumen_clima(registros_clima, n)]
+        if analisis:
+            estaciones = "\n\n".join(resumen_estacion(e, datos, n) for e, datos in analisis.items())
+            partes.append(f"Resultados del análisis de sensores:\n{estaciones}")
+        else:
+            partes.append("No hay resultados de análisis de sensores cargados. "
+                          "Por favor, sube un archivo Excel en la página principal.")
+        contexto = "\n\n".join(partes)
+        if estimar_tokens(contexto) <= presupuesto:
+            return contexto
+    aviso = "\n[Contexto recortado por tamaño]"
+    return contexto[:presupuesto * CARACTERES_POR_TOKEN - len(aviso)] + aviso
+
+
+def contexto_actual(presupuesto=PRESUPUESTO_TOKENS):
+    """
+    Contexto del último análisis y la última tabla de clima usados en cualquier worker. Se
+    construye una vez por combinación de versiones y presupuesto; luego se lee del almacén.
+    """
+    analisis = almacen_resultados.ultima_version('analisis:')
+    clima = almacen_resultados.ultima_version('clima:')
+    clave = f"contexto:{analisis}:{clima}:{presupuesto}"
+
+    def construir():
+        entrada_analisis = analisis and almacen_resultados.obtener(*analisis)
+        entrada_clima = clima and almacen_resultados.obtener(*clima)
+        # El análisis se guarda como (resultados, error)
+        resultados = entrada_analisis.valor[0] if entrada_analisis else {}
+        registros = entrada_clima.valor if entrada_clima else []
+        return construir_contexto(resultados, registros, presupuesto)
+
+    return almacen_resultados.obtener_o_calcular(clave, construir)
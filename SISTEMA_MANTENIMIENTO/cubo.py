@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# --- Cubo de agregados por estación y mes ---
+# Se construye una vez por archivo: por cada mes y estación guarda el número de filas, lecturas
+# válidas, faltantes, suma, mínimo, máximo y la fecha de cada extremo. Las secciones del dashboard
+# (sumas y promedios mensuales, estacionalidad, máximos y mínimos, proporciones) y los prompts de
+# IA se responden recortando el cubo a un rango, sin volver a recorrer las lecturas: los meses
+# completos del rango salen del cubo y solo los de los extremos se recalculan con sus lecturas.
+# Los promedios se derivan de suma / lecturas, así que combinar meses da el mismo resultado que
+# promediar las lecturas originales.
+
+MEDIDAS = ['total', 'lecturas', 'faltantes', 'suma', 'minimo', 'maximo', 'fecha_minimo', 'fecha_maximo']
+
+
+def construir_cubo(df, estaciones):
+    """
+    Devuelve un DataFrame indexado por mes (primer día) con columnas (medida, estacion),
+    medida en MEDIDAS.
+    """
+    mes = df['Fecha'].dt.to_period('M').dt.to_timestamp()
+    grupos = df[estaciones].groupby(mes)
+    total = mes.groupby(mes).size()
+    lecturas = grupos.count()
+    partes = {
+        'total': pd.DataFrame({e: total for e in estaciones}),
+        'lecturas': lecturas,
+        'faltantes': lecturas.rsub(total, axis=0),
+        'suma': grupos.sum(),
+        'minimo': grupos.min(),
+        'maximo': grupos.max(),
+    }
+    # Fecha del extremo de cada mes; los meses sin lecturas quedan en NaT
+    for medida, funcion in (('fecha_minimo', 'idxmin'), ('fecha_maximo', 'idxmax')):
+        fechas = {}
+        for estacion in estaciones:
+            validas = df[estacion].notna()
+            indices = df.loc[validas, estacion].groupby(mes[validas]).agg(funcion)
+            fechas[estacion] = df['Fecha'].reindex(indices.to_numpy()).set_axis(indices.index)
+        partes[medida] = pd.DataFrame(fechas).reindex(total.index)
+    cubo = pd.concat(partes, axis=1, names=['medida', 'estacion'])
+    cubo.index.name = 'mes'
+    return cubo
+
+
+def rebanar(cubo, desde=None, hasta=None):
+    """Meses del cubo en [desde, hasta] (inclusive, por mes); None = sin límite."""
+    desde = pd.Timestamp(desde).to_period('M').to_timestamp() if desde is not None else None
+    hasta = pd.Timestamp(hasta).to_period('M').to_timestamp() if hasta is not None else None
+    return cubo.loc[desde:hasta]
+
+
+def rebanar_dias(cubo, df, estaciones, desde, hasta):
+    """
+    Cubo del rango de días [desde, hasta]; df son las lecturas ya filtradas a ese rango. Los meses
+    interiores salen de cubo y el primero y el último, que pueden quedar a medias, se recalculan
+    solo con sus lecturas.
+    """
+    primero = pd.Timestamp(desde).to_period('M').to_timestamp()
+    ultimo = pd.Timestamp(hasta).to_period('M').to_timestamp()
+    bordes = df[(df['Fecha'] < primero + pd.offsets.MonthBegin(1)) | (df['Fecha'] >= ultimo)]
+    interior = rebanar(cubo, desde, hasta).drop(index=[primero, ultimo], errors='ignore')
+    if bordes.empty:
+        return interior
+    return pd.concat([interior, construir_cubo(bordes, estaciones)]).sort_index()
+
+
+def serie_mensual(cubo, medida):
+    """Tabla mes x estación de una medida; 'promedio' se calcula como suma / lecturas."""
+    if medida == 'promedio':
+        return cubo['suma'] / cubo['lecturas'].replace(0, np.nan)
+    return cubo[medida]
+
+
+def estacionalidad(cubo):
+    """Promedio de cada estación por mes del año (1-12) sobre todos los años del cubo."""
+    mes_del_anio = cubo.index.month
+    suma = cubo['suma'].groupby(mes_del_anio).sum()
+    lecturas = cubo['lecturas'].groupby(mes_del_anio).sum()
+    resultado = suma / lecturas.replace(0, np.nan)
+    resultado.index.name = 'Mes'
+    return resultado
+
+
+def resumen_periodo(cubo):
+    """
+    Por estación, para todo el cubo (o el recorte recibido): total, lecturas, faltantes, suma,
+    promedio, minimo, maximo y las fechas de los extremos (primera aparición).
+    """
+    suma = cubo['suma'].sum()
+    lecturas = cubo['lecturas'].sum()
+    filas = {
+        'total': cubo['total'].sum(),
+        'lecturas': lecturas,
+        'faltantes': cubo['faltantes'].sum(),
+        'suma': suma,
+        'promedio': suma / lecturas.replace(0, np.nan),
+        'minimo': cubo['minimo'].min(),
+        'maximo': cubo['maximo'].max(),
+    }
+    fechas = {'fecha_minimo': {}, 'fecha_maximo': {}}
+    for estacion in cubo['suma'].columns:
+        for medida, extremo, funcion in (('fecha_minimo', 'minimo', 'idxmin'), ('fecha_maximo', 'maximo', 'idxmax')):
+            valores = cubo[extremo][estacion].dropna()
+            fechas[medida][estacion] = (cubo[medida][estacion].loc[getattr(valores, funcion)()]
+                                        if not valores.empty else pd.NaT)
+    resultado = pd.DataFrame(filas)
+    for medida, valores in fechas.items():
+        resultado[medida] = pd.Series(valores)
+    return resultado
@@ -1,50 +1,39 @@
 import traceback
+import uuid
 import pandas as pd
-import requests
-from flask import Flask, render_template, send_file
-from tqdm import tqdm
+from flask import Flask, render_template, request, send_file, jsonify, url_for
 import os
+from almacen import almacen_lecturas, formato_ancho
+from almacen_resultados import almacen_resultados
+from paginacion import leer_parametros, tabla_guardada, paginar
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# Cada petición escribe su propio Excel (varios workers pueden atender a la vez); se conservan los más recientes
+MAX_REPORTES = int(os.environ.get('MAX_REPORTES_FALTANTES', 20))
 
-TIMEZONE = 'America/Guayaquil'
-SENSORES_COORDS = {
-    'P42': {'lat': -0.6022867145410288, 'lon': -78.1986689291808},
-    'P43': {'lat': -0.5934839659614135, 'lon': -78.20825370752031},
-    'P55': {'lat': -0.5731364867736277, 'lon': -78.138},
-}
-
-
-def consultar_clima(fecha, lat, lon):
-    fecha_str = fecha.strftime('%Y-%m-%d')
-    url = (
-        f"https://archive-api.open-meteo.com/v1/archive"
-        f"?latitude={lat}&longitude={lon}"
-        f"&start_date={fecha_str}&end_date={fecha_str}"
-        f"&daily=precipitation_sum,windspeed_10m_max,temperature_2m_max"
-        f"&timezone={TIMEZONE}"
-    )
-    try:
-        r = requests.get(url)
-        r.raise_for_status()
-        data = r.json()
-        if 'daily' in data and data['daily']:
-            return {
-                "precipitacion_mm": data['daily']['precipitation_sum'][0],
-                "viento_max_kmh": data['daily']['windspeed_10m_max'][0],
-                "temperatura_max": data['daily']['temperature_2m_max'][0]
-            }
-        else:
-            print(f"Advertencia: Datos incompletos para {fecha_str}.")
-            return {"precipitacion_mm": None, "viento_max_kmh": None, "temperatura_max": None}
-    except Exception as e:
-        print(f"Error consultando clima para {fecha_str}: {e}")
-        return {"precipitacion_mm": None, "viento_max_kmh": None, "temperatura_max": None}
+
+def clave_resultado():
+    """Clave en el almacén de resultados de la tabla del rango pedido (desde/hasta)."""
+    return f"faltantes:{almacen_lecturas.version()}:{request.args.get('desde')}:{request.args.get('hasta')}"
+
+
+def recortar_reportes(upload_folder, conservar=MAX_REPORTES):
+    """Borra los Excel de faltantes_*.xlsx más antiguos, dejando los conservar más recientes."""
+    rutas = [os.path.join(upload_folder, nombre) for nombre in os.listdir(upload_folder)
+             if nombre.startswith('faltantes_') and nombre.endswith('.xlsx')]
+    for ruta in sorted(rutas, key=os.path.getmtime, reverse=True)[conservar:]:
+        try:
+            os.remove(ruta)
+        except OSError as e:
+            print(f"No se pudo borrar el reporte {ruta}: {e}")
 
 
 @app.route('/')
 def datos_climaticos_page():
+    # requests y el cliente de clima se importan al primer uso, no al arrancar
+    from clima import consultar_clima_lote, completar_filas_con_clima
+
     upload_folder = os.path.abspath(app.config.get('UPLOAD_FOLDER', 'uploads'))
     if not os.path.exists(upload_folder):
         os.makedirs(upload_folder)
@@ -53,32 +42,37 @@ def datos_climaticos_page():
         print(f"Carpeta existe: {upload_folder}")
 
     excel_path = 'data/Precipitacion_Mensual__P42_P43_P5522062025222139.xlsx'
-    if not os.path.exists(excel_path):
+    sensores = ['P42', 'P43', 'P55']
+    if almacen_lecturas.vacio() and not os.path.exists(excel_path):
         print(f"Error: Archivo Excel no encontrado en {excel_path}")
         return "Error: El archivo Excel de precipitaciones no se encontró en el servidor. Asegúrate de que esté en la carpeta 'data/'.", 500
 
     try:
-        df = pd.read_excel(excel_path)
-        df['Fecha'] = pd.to_datetime(df['Fecha'], dayfirst=True)
-        print(f"Archivo Excel leído correctamente. Shape: {df.shape}")
+        # Las lecturas se consultan del almacén; la primera vez se importa el archivo fijo
+        almacen_lecturas.importar_si_vacio(excel_path, sensores, dayfirst=True)
+        guardadas = almacen_lecturas.estaciones()
+        partes = almacen_lecturas.consultar_por_estacion([s for s in sensores if s in guardadas],
+                                                         request.args.get('desde'), request.args.get('hasta'))
+        df = formato_ancho(partes)
+        print(f"Lecturas consultadas del almacén. Shape: {df.shape}")
     except Exception as e:
-        print(f"Error al leer el archivo Excel para datos climáticos: {e}")
+        print(f"Error al leer las lecturas para datos climáticos: {e}")
         traceback.print_exc()
-        return "Error al procesar el archivo Excel para datos climáticos. Asegúrate de que sea un formato válido.", 500
+        return "Error al procesar las lecturas para datos climáticos.", 500
 
-    sensores = ['P42', 'P43', 'P55']
     fechas_faltantes = []
 
     for sensor in sensores:
-        if sensor in df.columns:
-            faltantes = df[df[sensor].isna()][['Fecha']].copy()
+        if sensor in partes:
+            # Solo los faltantes guardados del sensor, no las fechas en que no tiene fila
+            faltantes = partes[sensor][partes[sensor][sensor].isna()][['Fecha']].copy()
             faltantes['Sensor'] = sensor
             fechas_faltantes.append(faltantes)
         else:
             print(f"Advertencia: El sensor '{sensor}' no se encontró en las columnas del Excel.")
 
     if not fechas_faltantes:
-        return render_template('resultado.html', datos=[])
+        return render_template('resultado.html', url_datos=None, url_descarga=url_for('descargar_faltantes'))
 
     faltantes_total = pd.concat(fechas_faltantes).reset_index(drop=True)
     print(f"Fechas faltantes total: {faltantes_total.shape}")
@@ -86,19 +80,8 @@ def datos_climaticos_page():
     # Eliminar duplicados para evitar consultas repetidas
     faltantes_total = faltantes_total.drop_duplicates(subset=['Fecha', 'Sensor']).reset_index(drop=True)
 
-    climas = []
     print(f"Consultando clima para {len(faltantes_total)} fechas con datos faltantes...")
-    for _, row in tqdm(faltantes_total.iterrows(), total=len(faltantes_total), desc="Consultando clima"):
-        coords = SENSORES_COORDS.get(row['Sensor'])
-        if coords:
-            clima = consultar_clima(row['Fecha'], coords['lat'], coords['lon'])
-        else:
-            clima = {"precipitacion_mm": None, "viento_max_kmh": None, "temperatura_max": None}
-        clima['Fecha'] = row['Fecha']
-        clima['Sensor'] = row['Sensor']
-        climas.append(clima)
-
-    df_clima = pd.DataFrame(climas)
+    df_clima = consultar_clima_lote(faltantes_total)
 
     # Asegurar tipo datetime para merge e interpolación
     faltantes_total['Fecha'] = pd.to_datetime(faltantes_total['Fecha'])
@@ -116,7 +99,9 @@ def datos_climaticos_page():
 
     resultado.reset_index(inplace=True)
 
-    output_excel_path = os.path.join(upload_folder, 'faltantes_resultado.xlsx')
+    clave = clave_resultado()
+    archivo = f"faltantes_{uuid.uuid4().hex}.xlsx"
+    output_excel_path = os.path.join(upload_folder, archivo)
 
     try:
         with pd.ExcelWriter(output_excel_path, engine='xlsxwriter') as writer:
@@ -124,30 +109,54 @@ def datos_climaticos_page():
             resultado.to_excel(writer, sheet_name='Completados', index=False)
 
             # Crear df_completado: DataFrame original con valores faltantes completados
-            df_completado = df.copy()
-            for _, row in resultado.iterrows():
-                fecha = row['Fecha']
-                sensor = row['Sensor']
-                valor = row['precipitacion_mm']
-                if pd.notna(valor):
-                    df_completado.loc[df_completado['Fecha'] == fecha, sensor] = valor
-
+            df_completado = completar_filas_con_clima(df, resultado)
             df_completado.to_excel(writer, sheet_name='Completado_Filas', index=False)
 
         print(f"Archivo Excel guardado correctamente en {output_excel_path}")
+        # El nombre se guarda una vez escrito el archivo: la descarga nunca ve un Excel a medias
+        almacen_resultados.guardar(f"reporte:{clave}", archivo, max_versiones=1)
+        recortar_reportes(upload_folder)
     except Exception as e:
         print("Error al guardar el archivo Excel de resultados:", e)
         traceback.print_exc()
 
-    datos = resultado.to_dict(orient='records')
-    return render_template('resultado.html', datos=datos)
+    # La página no lleva las filas: las pide por páginas a /api/datos para esta entrada concreta,
+    # aunque después se escriban lecturas nuevas en el almacén
+    version = almacen_resultados.guardar(clave, resultado.to_dict(orient='records'), max_versiones=1)
+    url_datos = url_for('api_datos', clave=clave, version=version)
+    url_descarga = url_for('descargar_faltantes', clave=clave)
+    return render_template('resultado.html', url_datos=url_datos, url_descarga=url_descarga)
+
+
+@app.route('/api/datos')
+def api_datos():
+    """Una página de la tabla con clave/version (o la última calculada para desde/hasta); ver paginacion.py."""
+    try:
+        parametros = leer_parametros(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    clave = request.args.get('clave')
+    if clave and not clave.startswith('faltantes:'):
+        return jsonify({"error": "Clave no válida."}), 400
+    tabla = tabla_guardada(almacen_resultados, clave or clave_resultado(), request.args.get('version', type=int))
+    if tabla is None:
+        return jsonify({"error": "La tabla de este rango todavía no se ha calculado."}), 404
+    return jsonify(paginar(tabla, **parametros))
 
 
 @app.route('/descargar_faltantes')
 def descargar_faltantes():
+    """Excel del resultado con la clave indicada o, sin clave, del último calculado."""
+    clave = request.args.get('clave')
+    if clave and not clave.startswith('faltantes:'):
+        return 'Clave no válida.', 400
+    if clave:
+        entrada = almacen_resultados.obtener(f"reporte:{clave}")
+    else:
+        entrada = almacen_resultados.ultimo('reporte:faltantes:')
     upload_folder = os.path.abspath(app.config.get('UPLOAD_FOLDER', 'uploads'))
-    file_path = os.path.join(upload_folder, 'faltantes_resultado.xlsx')
-    if os.path.exists(file_path):
+    file_path = os.path.join(upload_folder, entrada.valor) if entrada is not None else None
+    if file_path and os.path.exists(file_path):
         return send_file(file_path, as_attachment=True, download_name="faltantes_clima.xlsx")
     else:
         return 'Archivo no encontrado. Por favor, genera el reporte primero.', 404
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# --- Datos de gráficos reducidos en el servidor ---
+# Una serie de años de lecturas tiene cientos de miles de puntos, pero un gráfico de 1000 px no
+# puede mostrar más de unos pocos miles. Estas funciones devuelven solo lo que se ve:
+#   - LTTB (Largest-Triangle-Three-Buckets): conserva la forma de la serie eligiendo en cada
+#     tramo el punto que forma el triángulo más grande con sus vecinos.
+#   - min-max: el mínimo y el máximo de cada tramo; no pierde picos (útil para precipitación).
+#   - histogramas ya agrupados en intervalos.
+
+METODOS = ('lttb', 'minmax')
+
+
+def lttb(x, y, puntos):
+    """Índices de los puntos elegidos por LTTB (incluye el primero y el último)."""
+    n = len(x)
+    if puntos >= n or puntos < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # puntos - 2 tramos entre el primer y el último punto
+    bordes = np.linspace(1, n - 1, puntos - 1).astype(int)
+    indices = np.empty(puntos, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    anterior = 0
+    for i in range(puntos - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        if i + 2 < len(bordes):
+            siguiente = slice(bordes[i + 1], bordes[i + 2])
+            promedio_x, promedio_y = x[siguiente].mean(), y[siguiente].mean()
+        else:
+            promedio_x, promedio_y = x[n - 1], y[n - 1]
+        areas = np.abs((x[anterior] - promedio_x) * (y[inicio:fin] - y[anterior])
+                       - (x[anterior] - x[inicio:fin]) * (promedio_y - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        indices[i + 1] = anterior
+    return indices
+
+
+def min_max(y, puntos):
+    """Índices del mínimo y el máximo de cada tramo (puntos / 2 tramos), en orden."""
+    n = len(y)
+    if puntos >= n or puntos < 2:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    bordes = np.linspace(0, n, puntos // 2 + 1).astype(int)
+    indices = []
+    for inicio, fin in zip(bordes[:-1], bordes[1:]):
+        if fin > inicio:
+            tramo = y[inicio:fin]
+            indices.extend((inicio + int(np.argmin(tramo)), inicio + int(np.argmax(tramo))))
+    return np.unique(indices)
+
+
+def reducir_serie(fechas, valores, puntos=500, metodo='lttb'):
+    """
+    Serie (fechas, valores) reducida a unos `puntos` con LTTB o min-max; los nulos se omiten.
+    Devuelve {'fechas': [...], 'valores': [...], 'puntos_originales': n, 'metodo': metodo}.
+    """
+    if metodo not in METODOS:
+        raise ValueError(f"Método de reducción desconocido: {metodo}. Opciones: {', '.join(METODOS)}")
+    fechas = pd.to_datetime(pd.Series(fechas)).to_numpy()
+    valores = pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=float)
+    validos = ~np.isnan(valores) & ~np.isnat(fechas)
+    fechas, valores = fechas[validos], valores[validos]
+    if metodo == 'lttb':
+        indices = lttb(fechas.astype('datetime64[ns]').astype(np.int64), valores, puntos)
+    else:
+        indices = min_max(valores, puntos)
+    return {
+        'fechas': np.datetime_as_string(fechas[indices], unit='s').tolist(),
+        'valores': valores[indices].tolist(),
+        'puntos_originales': int(len(valores)),
+        'metodo': metodo,
+    }
+
+
+def histograma(valores, bins=20, rango=None):
+    """Conteos por intervalo de los valores no nulos: {'bordes': [...], 'conteos': [...], 'total': n}."""
+    valores = pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=float)
+    valores = valores[~np.isnan(valores)]
+    if len(valores) == 0:
+        return {'bordes': [], 'conteos': [], 'total': 0}
+    conteos, bordes = np.histogram(valores, bins=bins, range=rango)
+    return {'bordes': bordes.tolist(), 'conteos': conteos.tolist(), 'total': int(len(valores))}
@@ -0,0 +1,200 @@
+import hashlib
+import io
+import os
+import threading
+import uuid
+
+import pandas as pd
+
+# --- Ingesta de archivos Excel ---
+# Cada hoja se parsea una sola vez: el resultado normalizado (nombres de columnas sin espacios,
+# Fecha como datetime) se guarda como snapshot en disco bajo el hash del contenido del archivo,
+# y app.py, faltantes.py y streamlit.py lo reutilizan en lugar de volver a leer con openpyxl.
+# Se usa calamine si está instalado (mucho más rápido que openpyxl) y Parquet si hay un motor
+# disponible; si no, el snapshot se guarda con pickle.
+
+CARPETA_SNAPSHOTS = os.environ.get('INGESTA_CACHE_PATH', os.path.join('cache', 'ingesta'))
+MAX_SNAPSHOTS = int(os.environ.get('INGESTA_MAX_SNAPSHOTS', 200))
+# Las fechas que no se pueden interpretar lanzan ValueError (errores='raise', por defecto) o se
+# convierten en NaT avisando de cuántas son (errores='coerce', como hace streamlit.py).
+# Cambiar si cambia la normalización, para no reutilizar snapshots antiguos
+VERSION_SNAPSHOT = 1
+
+_lock = threading.Lock()
+
+
+def _disponible(modulo):
+    try:
+        __import__(modulo)
+        return True
+    except ImportError:
+        return False
+
+
+# calamine está soportado por pandas desde la versión 2.2
+MOTOR_EXCEL = os.environ.get('INGESTA_MOTOR_EXCEL') or (
+    'calamine' if _disponible('python_calamine') and tuple(map(int, pd.__version__.split('.')[:2])) >= (2, 2)
+    else 'openpyxl'
+)
+FORMATO_SNAPSHOT = 'parquet' if _disponible('pyarrow') or _disponible('fastparquet') else 'pickle'
+
+
+def hash_archivo(ruta, bloque=1024 * 1024):
+    """SHA-256 del contenido de un archivo."""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for parte in iter(lambda: f.read(bloque), b''):
+            h.update(parte)
+    return h.hexdigest()
+
+
+def hash_contenido(fuente):
+    """SHA-256 de una ruta o de un archivo subido (objeto con getvalue() o read())."""
+    if isinstance(fuente, (str, os.PathLike)):
+        return hash_archivo(fuente)
+    return hashlib.sha256(_leer_bytes(fuente)).hexdigest()
+
+
+def _leer_bytes(fuente):
+    if hasattr(fuente, 'getvalue'):
+        return fuente.getvalue()
+    posicion = fuente.tell()
+    datos = fuente.read()
+    fuente.seek(posicion)
+    return datos
+
+
+def normalizar(df, dayfirst=False, errores='raise'):
+    """Quita espacios de los nombres de columnas y convierte Fecha a datetime."""
+    df.columns = [c.strip() if isinstance(c, str) else c for c in df.columns]
+    if 'Fecha' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['Fecha']):
+        originales = df['Fecha']
+        df['Fecha'] = pd.to_datetime(originales, dayfirst=dayfirst, errors=errores)
+        invalidas = int((originales.notna() & df['Fecha'].isna()).sum())
+        if invalidas:
+            print(f"Advertencia: {invalidas} fechas no válidas se dejaron vacías (NaT).")
+    return df
+
+
+def _ruta_snapshot(huella, hoja, dayfirst, errores):
+    clave = f"{huella}|{hoja}|{int(dayfirst)}|{errores}|{VERSION_SNAPSHOT}"
+    nombre = hashlib.sha256(clave.encode()).hexdigest()
+    extension = 'parquet' if FORMATO_SNAPSHOT == 'parquet' else 'pkl'
+    return os.path.join(CARPETA_SNAPSHOTS, f"{nombre}.{extension}")
+
+
+def _leer_snapshot(ruta):
+    if not os.path.exists(ruta):
+        return None
+    try:
+        if FORMATO_SNAPSHOT == 'parquet':
+            return pd.read_parquet(ruta)
+        return pd.read_pickle(ruta)
+    except Exception as e:
+        print(f"Snapshot de ingesta ilegible, se vuelve a parsear: {e}")
+        return None
+
+
+def _escribir_snapshot(ruta, df):
+    os.makedirs(CARPETA_SNAPSHOTS, exist_ok=True)
+    temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+    try:
+        if FORMATO_SNAPSHOT == 'parquet':
+            # Parquet exige nombres de columnas de texto
+            df.rename(columns=str).to_parquet(temporal, index=False)
+        else:
+            df.to_pickle(temporal)
+        os.replace(temporal, ruta)
+    except Exception as e:
+        print(f"No se pudo guardar el snapshot de ingesta: {e}")
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        return
+    _purgar()
+
+
+def _purgar():
+    """Conserva solo los MAX_SNAPSHOTS snapshots usados más recientemente."""
+    with _lock:
+        try:
+            archivos = [os.path.join(CARPETA_SNAPSHOTS, f) for f in os.listdir(CARPETA_SNAPSHOTS)
+                        if not f.endswith('.tmp')]
+        except FileNotFoundError:
+            return
+        if len(archivos) <= MAX_SNAPSHOTS:
+            return
+        archivos.sort(key=os.path.getmtime)
+        for ruta in archivos[:len(archivos) - MAX_SNAPSHOTS]:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+def leer_hojas(fuente, hojas, dayfirst=False, huella=None, errores='raise'):
+    """
+    Devuelve {hoja: DataFrame normalizado} para las hojas pedidas de un Excel (ruta o archivo subido).
+    Las hojas que ya tienen snapshot no se parsean; las demás se leen en una sola apertura del libro.
+    """
+    huella = huella or hash_contenido(fuente)
+    rutas = {hoja: _ruta_snapshot(huella, hoja, dayfirst, errores) for hoja in hojas}
+    resultado = {}
+    for hoja, ruta in rutas.items():
+        df = _leer_snapshot(ruta)
+        if df is not None:
+            try:
+                os.utime(ruta)
+            except OSError:
+                pass
+            resultado[hoja] = df
+
+    pendientes = [hoja for hoja in hojas if hoja not in resultado]
+    if pendientes:
+        origen = fuente if isinstance(fuente, (str, os.PathLike)) else io.BytesIO(_leer_bytes(fuente))
+        leidas = pd.read_excel(origen, sheet_name=pendientes, engine=MOTOR_EXCEL)
+        for hoja in pendientes:
+            df = normalizar(leidas[hoja], dayfirst, errores)
+            _escribir_snapshot(rutas[hoja], df)
+            resultado[hoja] = df
+    return {hoja: resultado[hoja] for hoja in hojas}
+
+
+def leer_excel(fuente, hoja=0, dayfirst=False, huella=None, errores='raise'):
+    """Lee una hoja de un Excel a través de la caché de snapshots."""
+    return leer_hojas(fuente, [hoja], dayfirst, huella, errores)[hoja]
+
+
+# --- Lectura por bloques de archivos grandes (CSV / Parquet) ---
+
+FILAS_POR_BLOQUE = int(os.environ.get('INGESTA_FILAS_POR_BLOQUE', 200_000))
+# Parquet solo se acepta si pyarrow está instalado (requirements.txt lo incluye)
+EXTENSIONES_POR_BLOQUES = {'csv', 'parquet'} if _disponible('pyarrow') else {'csv'}
+
+
+def _separador_csv(ruta):
+    """Detecta ',' o ';' (exportaciones de Excel en configuración regional española) en la cabecera."""
+    with open(ruta, 'r', encoding='utf-8-sig', errors='replace') as f:
+        cabecera = f.readline()
+    return ';' if cabecera.count(';') > cabecera.count(',') else ','
+
+
+def leer_por_bloques(ruta, filas_por_bloque=FILAS_POR_BLOQUE, dayfirst=False, errores='raise'):
+    """
+    Genera DataFrames normalizados de a lo sumo filas_por_bloque filas de un CSV o Parquet,
+    sin cargar el archivo completo en memoria.
+    """
+    extension = str(ruta).rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        with pd.read_csv(ruta, chunksize=filas_por_bloque, sep=_separador_csv(ruta)) as lector:
+            for bloque in lector:
+                yield normalizar(bloque, dayfirst, errores)
+    elif extension == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Para leer archivos Parquet es necesario instalar pyarrow.")
+        archivo = pq.ParquetFile(ruta)
+        for lote in archivo.iter_batches(batch_size=filas_por_bloque):
+            yield normalizar(lote.to_pandas(), dayfirst, errores)
+    else:
+        raise ValueError(f"Formato no soportado para lectura por bloques: .{extension}")
@@ -0,0 +1,339 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- Pasarela de llamadas al modelo de lenguaje ---
+# La usan el asistente de app.py (/ask-clima-bot) y las conclusiones de streamlit.py. Antes cada
+# pregunta o clic en "Generar Conclusión" llamaba al modelo aunque el prompt fuera idéntico a
+# uno anterior (mismo archivo, sección y rango). Aquí:
+#   - las respuestas se guardan en SQLite con clave (modelo, hash del prompt, configuración),
+#   - las peticiones idénticas simultáneas esperan a una sola llamada al modelo,
+#   - las conexiones HTTP se reutilizan (sesión con pool) y toda llamada tiene timeout,
+#   - los reintentos ante 429/5xx esperan lo que pide Retry-After solo si no supera
+#     MAX_ESPERA_REINTENTO segundos; si el servidor pide más, se desiste en lugar de bloquear el hilo,
+#   - se cuentan aciertos de caché, llamadas agrupadas, errores y latencias.
+# generar_flujo devuelve la respuesta por partes a medida que el modelo la genera
+# (streamGenerateContent con SSE), para mostrarla sin esperar al final.
+# GEMINI_API_URL y GEMINI_API_STREAM_URL permiten apuntar a un servidor local de pruebas;
+# {modelo} se reemplaza por el modelo pedido.
+
+GEMINI_API_URL = os.environ.get(
+    'GEMINI_API_URL',
+    'https://generativelanguage.googleapis.com/v1beta/models/{modelo}:generateContent',
+)
+GEMINI_API_STREAM_URL = os.environ.get(
+    'GEMINI_API_STREAM_URL',
+    'https://generativelanguage.googleapis.com/v1beta/models/{modelo}:streamGenerateContent?alt=sse',
+)
+RUTA_CACHE_LLM = os.environ.get('CACHE_LLM_PATH', os.path.join('cache', 'llm.sqlite'))
+MAX_RESPUESTAS = int(os.environ.get('CACHE_LLM_MAX_RESPUESTAS', 5000))
+MAX_EDAD_DIAS = float(os.environ.get('CACHE_LLM_MAX_EDAD_DIAS', 30))
+TIMEOUT_CONEXION = float(os.environ.get('LLM_TIMEOUT_CONEXION', 5))
+TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 60))
+REINTENTOS = int(os.environ.get('LLM_REINTENTOS', 2))
+MAX_ESPERA_REINTENTO = float(os.environ.get('LLM_MAX_ESPERA_REINTENTO', 30))
+CONEXIONES = int(os.environ.get('LLM_CONEXIONES', 8))
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+# Latencias que se conservan para los percentiles
+MAX_MUESTRAS = 1000
+
+
+class _Pendiente:
+    """Llamada en curso: las peticiones idénticas esperan su resultado."""
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.respuesta = None
+        self.error = None
+
+
+class PasarelaLLM:
+    """Cliente del modelo con caché persistente, agrupación de peticiones idénticas y métricas."""
+
+    def __init__(self, url=GEMINI_API_URL, ruta=RUTA_CACHE_LLM, max_respuestas=MAX_RESPUESTAS,
+                 max_edad_dias=MAX_EDAD_DIAS, timeout=TIMEOUT, reintentos=REINTENTOS,
+                 conexiones=CONEXIONES, backoff=0.5, url_flujo=GEMINI_API_STREAM_URL,
+                 max_espera=MAX_ESPERA_REINTENTO):
+        self.url = url
+        self.url_flujo = url_flujo
+        self.ruta = ruta
+        self.max_respuestas = max_respuestas
+        self.max_edad_dias = max_edad_dias
+        self.timeout = (TIMEOUT_CONEXION, timeout)
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.max_espera = max_espera
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=conexiones, pool_maxsize=conexiones)
+        self.session.mount('http://', adaptador)
+        self.session.mount('https://', adaptador)
+        self._en_curso = {}
+        self._lock = threading.Lock()
+        self._inicializada = False
+        self.reiniciar_estadisticas()
+
+    def _conectar(self):
+        if not self._inicializada:
+            carpeta = os.path.dirname(self.ruta)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+        conn = sqlite3.connect(self.ruta, timeout=30)
+        if not self._inicializada:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS respuestas ("
+                " clave TEXT PRIMARY KEY, modelo TEXT, respuesta TEXT, creado REAL, ultimo_uso REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_respuestas_uso ON respuestas (ultimo_uso)")
+            conn.commit()
+            self._inicializada = True
+        return conn
+
+    @staticmethod
+    def clave(modelo, prompt, config):
+        """Hash de (modelo, hash del prompt, configuración de generación)."""
+        huella_prompt = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        return hashlib.sha256(
+            json.dumps([modelo, huella_prompt, config or {}], sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    def _leer(self, clave):
+        limite = time.time() - self.max_edad_dias * 86400 if self.max_edad_dias else 0
+        with closing(self._conectar()) as conn:
+            fila = conn.execute("SELECT respuesta FROM respuestas WHERE clave = ? AND creado >= ?",
+                                (clave, limite)).fetchone()
+            if fila is not None:
+                conn.execute("UPDATE respuestas SET ultimo_uso = ? WHERE clave = ?", (time.time(), clave))
+                conn.commit()
+        return fila[0] if fila is not None else None
+
+    def _escribir(self, clave, modelo, respuesta):
+        ahora = time.time()
+        with closing(self._conectar()) as conn:
+            conn.execute("INSERT OR REPLACE INTO respuestas VALUES (?, ?, ?, ?, ?)",
+                         (clave, modelo, respuesta, ahora, ahora))
+            conn.execute(
+                "DELETE FROM respuestas WHERE rowid NOT IN"
+                " (SELECT rowid FROM respuestas ORDER BY ultimo_uso DESC LIMIT ?)",
+                (self.max_respuestas,),
+            )
+            conn.commit()
+
+    @staticmethod
+    def _texto(resultado):
+        """Texto del primer candidato de una respuesta de generateContent, o None."""
+        candidatos = resultado.get('candidates') or [{}]
+        partes = candidatos[0].get('content', {}).get('parts') or [{}]
+        return partes[0].get('text')
+
+    def _espera_reintento(self, intento, respuesta):
+        """Segundos a esperar antes de reintentar, o None si Retry-After pide más de max_espera."""
+        retry_after = respuesta.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            espera = float(retry_after)
+            return espera if espera <= self.max_espera else None
+        return min(self.backoff * (2 ** intento), self.max_espera)
+
+    def _post(self, url, modelo, prompt, config, api_key, stream=False):
+        """
+        POST al modelo con timeout y reintentos ante 429/5xx. Con stream, la respuesta se devuelve
+        sin leer el cuerpo (solo se reintenta antes de recibir el primer byte). Si el servidor pide
+        esperar más de max_espera segundos, se lanza el HTTPError sin reintentar.
+        """
+        url = url.format(modelo=modelo)
+        payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if config:
+            payload["generationConfig"] = config
+        cabeceras = {'Content-Type': 'application/json'}
+        if api_key:
+            cabeceras['x-goog-api-key'] = api_key
+        for intento in range(self.reintentos + 1):
+            inicio = time.perf_counter()
+            try:
+                r = self.session.post(url, headers=cabeceras, json=payload, timeout=self.timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._registrar('errores')
+                if intento == self.reintentos:
+                    raise
+                time.sleep(self.backoff * (2 ** intento))
+                continue
+            if not stream:
+                self._registrar_latencia('latencias_modelo', time.perf_counter() - inicio)
+            if r.status_code in ESTADOS_REINTENTABLES and intento < self.reintentos:
+                espera = self._espera_reintento(intento, r)
+                if espera is not None:
+                    self._registrar('errores')
+                    r.close()
+                    time.sleep(espera)
+                    continue
+            if not r.ok:
+                self._registrar('errores')
+                r.close()
+            r.raise_for_status()
+            return r
+
+    def _llamar(self, modelo, prompt, config, api_key):
+        """generateContent completo; devuelve el texto o None."""
+        return self._texto(self._post(self.url, modelo, prompt, config, api_key).json())
+
+    def _llamar_flujo(self, modelo, prompt, config, api_key):
+        """streamGenerateContent con SSE: genera el texto de cada evento a medida que llega."""
+        with self._post(self.url_flujo, modelo, prompt, config, api_key, stream=True) as r:
+            # chunk_size=None entrega cada trozo en cuanto llega, sin esperar a llenar un búfer
+            for linea in r.iter_lines(chunk_size=None, decode_unicode=True):
+                if linea and linea.startswith('data:'):
+                    texto = self._texto(json.loads(linea[5:]))
+                    if texto:
+                        yield texto
+
+    def generar(self, prompt, modelo, config=None, api_key=None):
+        """
+        Respuesta del modelo para prompt: de la caché si ya se pidió con el mismo modelo y
+        configuración; si hay una llamada idéntica en curso, se espera a ella. Las respuestas
+        vacías (None) no se guardan.
+        """
+        inicio = time.perf_counter()
+        clave = self.clave(modelo, prompt, config)
+        respuesta = self._leer(clave)
+        if respuesta is not None:
+            self._registrar('hits')
+            self._registrar_latencia('latencias', time.perf_counter() - inicio)
+            return respuesta
+
+        with self._lock:
+            pendiente = self._en_curso.get(clave)
+            propia = pendiente is None
+            if propia:
+                pendiente = self._en_curso[clave] = _Pendiente()
+                self._stats['misses'] += 1
+            else:
+                self._stats['agrupadas'] += 1
+
+        if propia:
+            try:
+                pendiente.respuesta = self._llamar(modelo, prompt, config, api_key)
+                if pendiente.respuesta is not None:
+                    self._escribir(clave, modelo, pendiente.respuesta)
+            except Exception as e:
+                pendiente.error = e
+            finally:
+                with self._lock:
+                    del self._en_curso[clave]
+                pendiente.listo.set()
+        else:
+            pendiente.listo.wait()
+
+        self._registrar_latencia('latencias', time.perf_counter() - inicio)
+        if pendiente.error is not None:
+            raise pendiente.error
+        return pendiente.respuesta
+
+    def generar_flujo(self, prompt, modelo, config=None, api_key=None):
+        """
+        Como generar, pero devuelve la respuesta por partes a medida que llega. Una respuesta en
+        caché (o de una petición idéntica en curso) se entrega en una sola parte. La respuesta
+        completa se guarda al terminar; si el flujo se corta no se guarda nada.
+        """
+        inicio = time.perf_counter()
+        clave = self.clave(modelo, prompt, config)
+        respuesta = self._leer(clave)
+        if respuesta is not None:
+            self._registrar('hits')
+            self._registrar_latencia('primer_token', time.perf_counter() - inicio)
+            yield respuesta
+            return
+
+        with self._lock:
+            pendiente = self._en_curso.get(clave)
+            propia = pendiente is None
+            if propia:
+                pendiente = self._en_curso[clave] = _Pendiente()
+                self._stats['misses'] += 1
+            else:
+                self._stats['agrupadas'] += 1
+
+        if not propia:
+            pendiente.listo.wait()
+            if pendiente.error is not None:
+                raise pendiente.error
+            if pendiente.respuesta is not None:
+                self._registrar_latencia('primer_token', time.perf_counter() - inicio)
+                yield pendiente.respuesta
+            return
+
+        partes = []
+        try:
+            for texto in self._llamar_flujo(modelo, prompt, config, api_key):
+                if not partes:
+                    self._registrar_latencia('primer_token', time.perf_counter() - inicio)
+                partes.append(texto)
+                yield texto
+            pendiente.respuesta = ''.join(partes) or None
+            self._registrar_latencia('latencias_modelo', time.perf_counter() - inicio)
+            if pendiente.respuesta is not None:
+                self._escribir(clave, modelo, pendiente.respuesta)
+        except GeneratorExit:
+            # El cliente dejó de leer: quien espere la misma respuesta hará su propia llamada
+            pendiente.error = requests.exceptions.ConnectionError("El flujo se interrumpió.")
+            raise
+        except Exception as e:
+            pendiente.error = e
+            raise
+        finally:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+            pendiente.listo.set()
+            self._registrar_latencia('latencias', time.perf_counter() - inicio)
+
+    def reiniciar_estadisticas(self):
+        with self._lock:
+            self._stats = {'hits': 0, 'misses': 0, 'agrupadas': 0, 'errores': 0}
+            self._latencias = {'latencias': [], 'latencias_modelo': [], 'primer_token': []}
+
+    def _registrar(self, campo):
+        with self._lock:
+            self._stats[campo] += 1
+
+    def _registrar_latencia(self, serie, segundos):
+        with self._lock:
+            muestras = self._latencias[serie]
+            muestras.append(segundos)
+            if len(muestras) > MAX_MUESTRAS:
+                del muestras[0]
+
+    def estadisticas(self):
+        """
+        Contadores, tasa de aciertos y latencias (ms) de las peticiones, de las llamadas al modelo
+        y hasta la primera parte de los flujos.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            latencias = {serie: sorted(m) for serie, m in self._latencias.items()}
+        peticiones = stats['hits'] + stats['misses'] + stats['agrupadas']
+        stats['peticiones'] = peticiones
+        stats['tasa_aciertos'] = (stats['hits'] + stats['agrupadas']) / peticiones if peticiones else 0.0
+        for serie, muestras in latencias.items():
+            for nombre, q in (('p50', 0.5), ('p95', 0.95)):
+                stats[f"{serie}_{nombre}_ms"] = (muestras[min(len(muestras) - 1, int(q * len(muestras)))] * 1000
+                                                 if muestras else None)
+        return stats
+
+    def limpiar(self):
+        """Vacía la caché y reinicia los contadores."""
+        with closing(self._conectar()) as conn:
+            conn.execute("DELETE FROM respuestas")
+            conn.commit()
+        self.reiniciar_estadisticas()
+
+    def cerrar(self):
+        self.session.close()
+
+
+pasarela_llm = PasarelaLLM()
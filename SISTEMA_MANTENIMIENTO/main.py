@@ -1,12 +1,88 @@
-import subprocess
+import os
 
-if __name__ == '__main__':
-    # Ejecuta app.py en un proceso separado
-    p1 = subprocess.Popen(['python', 'app.py'])
+# --- Lanzador de producción ---
+# Sirve wsgi.application (mantenimiento en / y datos faltantes en /faltantes) desde un pool de
+# procesos. En Linux/macOS usa gunicorn con preload: las dependencias pesadas se importan una
+# vez en el maestro y los workers las comparten al hacer fork. En Windows (sin fork) usa
+# waitress, un solo proceso con varios hilos.
+#
+# Variables de entorno:
+#   PORT          puerto (5000)
+#   WEB_WORKERS   procesos de gunicorn (núcleos de CPU)
+#   WEB_THREADS   hilos por proceso (4; con waitress, WEB_WORKERS * WEB_THREADS)
+#   WEB_TIMEOUT   segundos antes de reiniciar un worker bloqueado (300)
+#   WEB_SERVIDOR  'gunicorn', 'waitress' o 'auto' (auto)
+# Cada worker precalienta el motor de pronóstico en segundo plano (ver pronostico.calentar) y
+# usa por defecto núcleos / WEB_WORKERS procesos para ajustar (ver PRONOSTICO_WORKERS).
+
+HOST = os.environ.get('HOST', '0.0.0.0')
+PUERTO = int(os.environ.get('PORT', 5000))
+WORKERS = int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1))
+THREADS = int(os.environ.get('WEB_THREADS', 4))
+TIMEOUT = int(os.environ.get('WEB_TIMEOUT', 300))
+SERVIDOR = os.environ.get('WEB_SERVIDOR', 'auto')
+
+
+def calentar_worker(servidor, worker):
+    # Se ejecuta en cada worker tras el fork: los hilos del maestro no sobreviven al fork
+    from pronostico import calentar_en_segundo_plano
+    calentar_en_segundo_plano()
+
+
+def servir_gunicorn():
+    from gunicorn.app.base import BaseApplication
+
+    # pronostico.py reparte los núcleos entre los procesos (PRONOSTICO_WORKERS por defecto)
+    os.environ['WEB_CONCURRENCY'] = str(WORKERS)
+
+    class Servidor(BaseApplication):
+        def __init__(self, opciones):
+            self.opciones = opciones
+            super().__init__()
+
+        def load_config(self):
+            for clave, valor in self.opciones.items():
+                self.cfg.set(clave, valor)
 
-    # Ejecuta faltantes.py en otro proceso
-    p2 = subprocess.Popen(['python', 'faltantes.py'])
+        def load(self):
+            from wsgi import application
+            return application
 
-    # Espera a que ambos procesos terminen
-    p1.wait()
-    p2.wait()
+    Servidor({
+        'bind': f"{HOST}:{PUERTO}",
+        'workers': WORKERS,
+        'threads': THREADS,
+        'timeout': TIMEOUT,
+        'preload_app': True,
+        'post_fork': calentar_worker,
+    }).run()
+
+
+def servir_waitress():
+    from waitress import serve
+    from wsgi import application
+    from pronostico import calentar_en_segundo_plano
+
+    calentar_en_segundo_plano()
+    serve(application, host=HOST, port=PUERTO, threads=WORKERS * THREADS)
+
+
+def elegir_servidor():
+    if SERVIDOR != 'auto':
+        return SERVIDOR
+    if os.name != 'nt':
+        try:
+            import gunicorn  # noqa: F401
+            return 'gunicorn'
+        except ImportError:
+            pass
+    return 'waitress'
+
+
+if __name__ == '__main__':
+    servidor = elegir_servidor()
+    print(f"Iniciando {servidor} en {HOST}:{PUERTO} ({WORKERS} procesos x {THREADS} hilos)")
+    if servidor == 'gunicorn':
+        servir_gunicorn()
+    else:
+        servir_waitress()
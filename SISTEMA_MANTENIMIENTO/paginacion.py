@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# --- Paginación de la tabla de clima ---
+# resultado.html ya no recibe todas las filas: las pide por páginas en JSON, filtradas por sensor
+# y fechas y ordenadas por cualquier columna. Cada resultado del almacén se convierte a DataFrame
+# una sola vez (por clave y versión) junto con el orden de cada columna, de modo que una petición
+# solo filtra con máscaras y corta la página: el tamaño de la respuesta depende de por_pagina y no
+# del total de filas. Mientras la tabla esté en memoria, una página no vuelve a leer (ni a
+# deserializar) el resultado del almacén: basta con su clave y versión.
+
+COLUMNAS = ['Fecha', 'Sensor', 'precipitacion_mm', 'viento_max_kmh', 'temperatura_max']
+POR_PAGINA = 50
+MAX_POR_PAGINA = 500
+MAX_TABLAS = 8
+
+_tablas = OrderedDict()
+_candado = threading.Lock()
+
+
+class Tabla:
+    """Registros de un resultado como DataFrame, con los órdenes por columna calculados al primer uso."""
+
+    def __init__(self, registros):
+        self.df = pd.DataFrame.from_records(registros).reindex(columns=COLUMNAS).reset_index(drop=True)
+        self.df['Fecha'] = pd.to_datetime(self.df['Fecha'], errors='coerce')
+        self.sensores = sorted(self.df['Sensor'].dropna().unique().tolist())
+        self._ordenes = {}
+
+    def orden(self, orden):
+        """Posiciones de las filas según 'columna' o '-columna' (descendente); los nulos al final."""
+        if orden not in self._ordenes:
+            columna = orden.lstrip('-')
+            ordenado = self.df[columna].sort_values(ascending=not orden.startswith('-'),
+                                                    kind='stable', na_position='last')
+            self._ordenes[orden] = ordenado.index.to_numpy()
+        return self._ordenes[orden]
+
+
+def tabla_guardada(almacen, clave, version=None):
+    """
+    Tabla de la versión indicada (o la última) de clave en el almacén de resultados, o None si no
+    existe. Solo se lee la entrada completa si su tabla no está ya en memoria.
+    """
+    if version is None:
+        version = almacen.version(clave)
+        if version is None:
+            return None
+    llave = (clave, version)
+    with _candado:
+        if llave in _tablas:
+            _tablas.move_to_end(llave)
+            return _tablas[llave]
+    entrada = almacen.obtener(clave, version)
+    return tabla_de(entrada) if entrada is not None else None
+
+
+def tabla_de(entrada):
+    """Tabla de una entrada del almacén de resultados, reutilizada mientras no cambie su versión."""
+    llave = (entrada.clave, entrada.version)
+    with _candado:
+        if llave in _tablas:
+            _tablas.move_to_end(llave)
+            return _tablas[llave]
+    tabla = Tabla(entrada.valor)
+    with _candado:
+        _tablas[llave] = tabla
+        while len(_tablas) > MAX_TABLAS:
+            _tablas.popitem(last=False)
+    return tabla
+
+
+def leer_parametros(args):
+    """Página, orden y filtros de la petición; ValueError con un mensaje si no son válidos."""
+    try:
+        pagina = int(args.get('pagina', 1))
+        por_pagina = int(args.get('por_pagina', POR_PAGINA))
+    except ValueError:
+        raise ValueError("pagina y por_pagina deben ser números enteros.")
+    if pagina < 1 or por_pagina < 1:
+        raise ValueError("pagina y por_pagina deben ser mayores que 0.")
+
+    orden = args.get('orden') or None
+    if orden is not None and orden.lstrip('-') not in COLUMNAS:
+        raise ValueError(f"orden debe ser una de: {', '.join(COLUMNAS)} (con '-' para descendente).")
+
+    fechas = []
+    for nombre in ('fecha_desde', 'fecha_hasta'):
+        valor = args.get(nombre)
+        try:
+            fechas.append(pd.Timestamp(datetime.strptime(valor, '%Y-%m-%d')) if valor else None)
+        except ValueError:
+            raise ValueError(f"{nombre} debe tener el formato AAAA-MM-DD.")
+
+    return {
+        'pagina': pagina,
+        'por_pagina': min(por_pagina, MAX_POR_PAGINA),
+        'orden': orden,
+        'sensor': args.get('sensor') or None,
+        'desde': fechas[0],
+        'hasta': fechas[1],
+    }
+
+
+def filas_json(df):
+    """Filas con la fecha como AAAA-MM-DD y los nulos como None."""
+    filas = df.assign(Fecha=df['Fecha'].dt.strftime('%Y-%m-%d')).astype(object)
+    return filas.where(filas.notna(), None).to_dict(orient='records')
+
+
+def paginar(tabla, pagina=1, por_pagina=POR_PAGINA, orden=None, sensor=None, desde=None, hasta=None):
+    """Una página de la tabla filtrada por sensor y fechas (inclusive) y ordenada por orden."""
+    df = tabla.df
+    mascara = np.ones(len(df), dtype=bool)
+    if sensor is not None:
+        mascara &= (df['Sensor'] == sensor).to_numpy()
+    if desde is not None:
+        mascara &= (df['Fecha'] >= desde).to_numpy()
+    if hasta is not None:
+        mascara &= (df['Fecha'] <= hasta).to_numpy()
+
+    # Sin orden se respeta el del resultado (por sensor y fecha)
+    posiciones = tabla.orden(orden) if orden else np.arange(len(df))
+    posiciones = posiciones[mascara[posiciones]]
+    total = len(posiciones)
+    inicio = (pagina - 1) * por_pagina
+
+    return {
+        'filas': filas_json(df.iloc[posiciones[inicio:inicio + por_pagina]]),
+        'pagina': pagina,
+        'por_pagina': por_pagina,
+        'paginas': max(1, -(-total // por_pagina)),
+        'total': total,
+        'total_sin_filtro': len(df),
+        'orden': orden,
+        'sensores': tabla.sensores,
+    }
@@ -0,0 +1,271 @@
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cache_pronostico import cache_pronostico, huella_serie
+
+# --- Pronóstico de datos faltantes por estación ---
+# Hay dos motores intercambiables:
+#   - 'armonico' (por defecto): regresión armónica con tendencia por tramos resuelta con NumPy;
+#     ajusta una serie mensual de unos cientos de puntos en milisegundos.
+#   - 'prophet': Prophet/Stan, importado solo cuando se usa. Su ajuste consume CPU, así que
+#     cada estación se ajusta en un proceso distinto y la latencia total se acerca a la de la
+#     estación más lenta y no a la suma.
+# Con PRONOSTICO_CALENTAR=1 (por defecto si el motor es Prophet) el servidor ajusta una serie
+# sintética en segundo plano al arrancar, para que la primera carga no pague la importación
+# de prophet/cmdstanpy ni la carga del modelo Stan.
+
+MOTOR_PRONOSTICO = os.environ.get('MOTOR_PRONOSTICO', 'armonico')
+PARAMETROS_PROPHET = {'yearly_seasonality': True, 'weekly_seasonality': False, 'daily_seasonality': False}
+# Cada proceso web tiene su propio pool: por defecto los núcleos se reparten entre los
+# WEB_CONCURRENCY procesos (main.py lo fija a WEB_WORKERS con gunicorn) en lugar de que cada uno
+# lance tantos procesos de Prophet como núcleos haya
+PROCESOS_WEB = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+PRONOSTICO_WORKERS = int(os.environ.get('PRONOSTICO_WORKERS', max(1, (os.cpu_count() or 1) // PROCESOS_WEB)))
+CALENTAR_PRONOSTICO = os.environ.get('PRONOSTICO_CALENTAR', '1' if MOTOR_PRONOSTICO == 'prophet' else '0') == '1'
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def fechas_futuras(ultima_fecha, meses_a_predecir):
+    """Fin de mes de los próximos meses, igual que make_future_dataframe(freq='M') de Prophet."""
+    fechas = pd.date_range(start=ultima_fecha, periods=meses_a_predecir + 1, freq=pd.offsets.MonthEnd())
+    return fechas[fechas > ultima_fecha][:meses_a_predecir]
+
+
+class PronosticadorArmonico:
+    """
+    Tendencia lineal por tramos más estacionalidad anual de Fourier, ajustadas por mínimos
+    cuadrados con penalización ridge en los cambios de pendiente (similar al modelo de
+    tendencia de Prophet, pero con solución cerrada en NumPy).
+    """
+
+    nombre = 'armonico'
+    # El ajuste tarda milisegundos: repartirlo en procesos costaría más que hacerlo en serie
+    paralelo = False
+
+    def __init__(self, armonicos=2, puntos_cambio=25, penalizacion=3.0):
+        self.armonicos = armonicos
+        self.puntos_cambio = puntos_cambio
+        self.penalizacion = penalizacion
+
+    @property
+    def parametros(self):
+        return {'motor': self.nombre, 'armonicos': self.armonicos,
+                'puntos_cambio': self.puntos_cambio, 'penalizacion': self.penalizacion}
+
+    def _diseno(self, fechas, origen, cambios):
+        fechas = pd.DatetimeIndex(fechas)
+        anios = ((fechas - origen).days.to_numpy() / 365.25)[:, None]
+        angulo = 2 * np.pi * fechas.dayofyear.to_numpy()[:, None] / 365.25
+        k = np.arange(1, self.armonicos + 1)[None, :]
+        tramos = np.maximum(0.0, anios - cambios[None, :])
+        return np.hstack([np.ones_like(anios), anios, np.sin(k * angulo), np.cos(k * angulo), tramos])
+
+    def ajustar_predecir(self, serie, meses_a_predecir=12):
+        """Devuelve el pronóstico (ds, yhat) histórico y futuro."""
+        ds = pd.DatetimeIndex(pd.to_datetime(serie['ds']))
+        y = serie['y'].to_numpy(dtype=float)
+        origen = ds[0]
+        # Como Prophet, los puntos de cambio se reparten en el primer 80% del histórico
+        duracion = (ds[-1] - origen).days / 365.25
+        cambios = np.linspace(0.0, 0.8 * duracion, self.puntos_cambio + 1)[1:]
+
+        X = self._diseno(ds, origen, cambios)
+        penalizacion = np.zeros(X.shape[1])
+        penalizacion[-len(cambios):] = self.penalizacion
+        coef, *_ = np.linalg.lstsq(X.T @ X + np.diag(penalizacion), X.T @ y, rcond=None)
+
+        todas = ds.append(fechas_futuras(ds[-1], meses_a_predecir))
+        yhat = self._diseno(todas, origen, cambios) @ coef
+        # La serie es una proporción de faltantes
+        return pd.DataFrame({'ds': todas, 'yhat': np.clip(yhat, 0.0, 1.0)})
+
+
+class PronosticadorProphet:
+    """Prophet con estacionalidad anual; se importa de forma diferida."""
+
+    nombre = 'prophet'
+    paralelo = True
+
+    @property
+    def parametros(self):
+        return {'motor': self.nombre, **PARAMETROS_PROPHET}
+
+    def ajustar_predecir(self, serie, meses_a_predecir=12):
+        """Devuelve el pronóstico (ds, yhat) histórico y futuro."""
+        from prophet import Prophet
+
+        model = Prophet(**PARAMETROS_PROPHET)
+        model.fit(serie)
+        future = model.make_future_dataframe(periods=meses_a_predecir, freq='M')
+        forecast = model.predict(future)
+        return forecast[['ds', 'yhat']]
+
+
+MOTORES = {
+    PronosticadorArmonico.nombre: PronosticadorArmonico,
+    PronosticadorProphet.nombre: PronosticadorProphet,
+}
+
+
+def obtener_pronosticador(motor=None):
+    """Instancia el motor de pronóstico por nombre (por defecto MOTOR_PRONOSTICO)."""
+    motor = motor or MOTOR_PRONOSTICO
+    if motor not in MOTORES:
+        raise ValueError(f"Motor de pronóstico desconocido: {motor}. Opciones: {', '.join(MOTORES)}")
+    return MOTORES[motor]()
+
+
+def ajustar_pronostico(serie, meses_a_predecir=12, motor=None):
+    """Ajusta el motor indicado sobre la serie y devuelve el pronóstico (ds, yhat)."""
+    return obtener_pronosticador(motor).ajustar_predecir(serie, meses_a_predecir)
+
+
+def fechas_alerta(forecast, umbral=0.01):
+    """Fechas futuras en las que el pronóstico de faltantes supera el umbral."""
+    hoy = pd.to_datetime(datetime.today().date())
+    # CORRECCIÓN DE UNBOUNDLOCALERROR: Usa 'forecast' para el filtro inicial
+    predicciones_futuras = forecast[forecast['ds'] > hoy]
+
+    return predicciones_futuras[predicciones_futuras['yhat'] > umbral]['ds'].dt.strftime('%Y-%m-%d').tolist()
+
+
+def calentar(motor=None):
+    """Ajusta una serie sintética corta para dejar cargado el motor; devuelve los segundos empleados."""
+    inicio = time.perf_counter()
+    serie = pd.DataFrame({'ds': pd.date_range('2000-01-01', periods=24, freq='MS'), 'y': np.linspace(0, 0.5, 24)})
+    obtener_pronosticador(motor).ajustar_predecir(serie, 1)
+    return time.perf_counter() - inicio
+
+
+def calentar_en_segundo_plano(motor=None):
+    """
+    Lanza calentar() en un hilo si PRONOSTICO_CALENTAR está activo y devuelve el hilo (o None).
+    Debe llamarse en el proceso que atiende peticiones (con gunicorn, después del fork).
+    """
+    if not CALENTAR_PRONOSTICO:
+        return None
+
+    def tarea():
+        try:
+            print(f"Motor de pronóstico listo en {calentar(motor):.1f} s.")
+        except Exception as e:
+            print(f"No se pudo precalentar el motor de pronóstico: {e}")
+
+    hilo = threading.Thread(target=tarea, name='calentar-pronostico', daemon=True)
+    hilo.start()
+    return hilo
+
+
+def _obtener_pool(max_workers):
+    """Pool de procesos persistente, reutilizado entre cargas de archivos."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=max_workers)
+            _pool_workers = max_workers
+        return _pool
+
+
+def _descartar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def predecir_estaciones(series, umbral=0.01, meses_a_predecir=12, max_workers=PRONOSTICO_WORKERS,
+                        cache=cache_pronostico, motor=None):
+    """
+    Ajusta un modelo por estación y devuelve {estacion: fechas_alerta}.
+    series es un diccionario {estacion: DataFrame (ds, y) con la proporción mensual de faltantes},
+    como la 'serie_faltantes' de cada estación en analisis.analizar_estaciones.
+    Con un motor costoso (Prophet) y max_workers > 1 cada estación se ajusta en su propio proceso.
+    """
+    pronosticador = obtener_pronosticador(motor)
+
+    # Solo se ajustan las estaciones cuya serie no está en la caché
+    forecasts = {}
+    pendientes = {}
+    for estacion, serie in series.items():
+        if len(serie) < 3:
+            continue
+        clave = huella_serie(serie, pronosticador.parametros, meses_a_predecir)
+        forecast = cache.leer(clave) if cache is not None else None
+        if forecast is None:
+            pendientes[estacion] = clave
+        else:
+            forecasts[estacion] = forecast
+
+    workers = max_workers if pronosticador.paralelo else 1
+    forecasts.update(_ajustar_estaciones({e: series[e] for e in pendientes}, meses_a_predecir,
+                                         workers, pronosticador.nombre))
+    if cache is not None:
+        for estacion, clave in pendientes.items():
+            if estacion in forecasts:
+                cache.escribir(clave, forecasts[estacion])
+
+    return {
+        estacion: fechas_alerta(forecasts[estacion], umbral) if estacion in forecasts else []
+        for estacion in series
+    }
+
+
+def _ajustar_en_serie(series, estaciones, meses_a_predecir, motor, forecasts=None):
+    """
+    Ajusta en este proceso los modelos de las estaciones indicadas; la que falla se informa y
+    queda fuera de forecasts, igual que en el camino en paralelo.
+    """
+    forecasts = {} if forecasts is None else forecasts
+    for estacion in estaciones:
+        try:
+            forecasts[estacion] = ajustar_pronostico(series[estacion], meses_a_predecir, motor)
+        except Exception as error:
+            print(f"Error al predecir faltantes para {estacion}: {error}")
+            traceback.print_exc()
+    return forecasts
+
+
+def _ajustar_estaciones(series, meses_a_predecir, max_workers, motor):
+    """
+    Ajusta los modelos de varias estaciones, en paralelo si max_workers > 1. Una estación cuyo
+    ajuste falla no tiene pronóstico, sea cual sea el número de workers.
+    """
+    estaciones = list(series)
+    workers = min(max_workers, len(estaciones))
+    if workers <= 1:
+        return _ajustar_en_serie(series, estaciones, meses_a_predecir, motor)
+
+    pool = _obtener_pool(max_workers)
+    try:
+        futuros = {e: pool.submit(ajustar_pronostico, series[e], meses_a_predecir, motor) for e in estaciones}
+    except (BrokenProcessPool, RuntimeError) as error:
+        print(f"Error al usar el pool de procesos para el pronóstico, se ajusta en serie: {error}")
+        _descartar_pool()
+        return _ajustar_en_serie(series, estaciones, meses_a_predecir, motor)
+
+    forecasts = {}
+    for estacion, futuro in futuros.items():
+        try:
+            forecasts[estacion] = futuro.result()
+        except BrokenProcessPool as error:
+            print(f"El proceso de pronóstico para {estacion} terminó inesperadamente: {error}")
+            _descartar_pool()
+            _ajustar_en_serie(series, [estacion], meses_a_predecir, motor, forecasts)
+        except Exception as error:
+            print(f"Error al predecir faltantes para {estacion}: {error}")
+            traceback.print_exc()
+    return forecasts
@@ -6,38 +6,154 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
-from langchain_google_genai import ChatGoogleGenerativeAI
+from ingesta import leer_excel, leer_hojas, hash_contenido
+from almacen import almacen_lecturas
+from cubo import construir_cubo, rebanar_dias, serie_mensual, estacionalidad, resumen_periodo
+from graficos import histograma
+from anomalias import detectar, METODOS, UMBRALES, METODO_ANOMALIAS
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 AI_MODEL = "gemini-2.5-flash"
-llm = ChatGoogleGenerativeAI(model=AI_MODEL, google_api_key=GOOGLE_API_KEY)
 
-st.set_page_config(layout="wide")
-st.title("📊 Estadísticas de Sensores")
 
-archivo = st.file_uploader("📁 Sube el archivo Excel", type=["xlsx"])
-if archivo:
-    hoja = st.selectbox("Selecciona la hoja", ["Original", "Completado_Filas"])
-    df = pd.read_excel(archivo, sheet_name=hoja)
+def flujo_conclusion(prompt):
+    """
+    Conclusión del modelo por la pasarela compartida con app.py (llm.py), por partes a medida que
+    se genera (para st.write_stream). Un prompt idéntico a uno anterior (mismo archivo, sección y
+    rango) se responde desde la caché sin llamar al modelo.
+    """
+    from llm import pasarela_llm
+    recibido = False
+    for texto in pasarela_llm.generar_flujo(prompt, AI_MODEL, api_key=GOOGLE_API_KEY):
+        recibido = True
+        yield texto
+    if not recibido:
+        yield "No se pudo generar una conclusión en este momento."
+
+
+SENSORES = ["P42", "P43", "P55"]
 
+# --- Datos y tablas memorizados ---
+# Streamlit vuelve a ejecutar el script completo en cada interacción. Los datos, el cubo de
+# agregados mensuales (cubo.py) y las tablas que necesitan las lecturas se guardan con
+# st.cache_data bajo una clave pequeña: el origen (huella del archivo y hoja, o versión del
+# almacén y rango consultado) más el rango del filtro. Las secciones de sumas, promedios,
+# extremos y estacionalidad se responden recortando el cubo. Los argumentos con guion bajo no
+# forman parte de la clave, así que el DataFrame no se vuelve a hashear en cada ejecución.
+MAX_ENTRADAS_CACHE = 32
+
+
+def preparar(df):
+    """Añade las columnas de agrupación (Año, AñoMes, Mes) una sola vez por origen."""
     if 'Fecha' in df.columns:
-        df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
         df['Año'] = df['Fecha'].dt.year
         df['AñoMes'] = df['Fecha'].dt.to_period('M').astype(str)
         df['Mes'] = df['Fecha'].dt.month
+    return df
+
+
+@st.cache_data(max_entries=MAX_ENTRADAS_CACHE, show_spinner="Leyendo el archivo...")
+def cargar_excel(huella, hoja, _archivo):
+    return preparar(leer_excel(_archivo, hoja=hoja, huella=huella, errores='coerce'))
+
+
+@st.cache_data(max_entries=MAX_ENTRADAS_CACHE, show_spinner="Consultando el almacén...")
+def cargar_almacen(version, desde, hasta):
+    return preparar(almacen_lecturas.consultar(SENSORES, desde, hasta))
+
+
+@st.cache_data(max_entries=MAX_ENTRADAS_CACHE)
+def estadisticas(origen, _df):
+    return _df[SENSORES].describe()
+
+
+@st.cache_data(max_entries=MAX_ENTRADAS_CACHE, show_spinner="Calculando agregados mensuales...")
+def cubo_de(origen, _df):
+    return construir_cubo(_df, SENSORES)
+
 
+def tabla_mensual(cubo, medida):
+    """Medida del cubo ('suma' o 'promedio') por AñoMes, como columnas por sensor."""
+    tabla = serie_mensual(cubo, medida).reset_index()
+    tabla.insert(0, "AñoMes", tabla.pop("mes").dt.strftime('%Y-%m'))
+    tabla.columns.name = None
+    return tabla
+
+
+@st.cache_data(max_entries=MAX_ENTRADAS_CACHE, show_spinner="Detectando anomalías...")
+def tablas_anomalias(origen, rango, metodo, umbral, _df):
+    """
+    Anomalías de todos los sensores con el mismo motor que Flask (anomalias.py), en una pasada:
+    {sensor: DataFrame con Fecha, lectura y puntaje}.
+    """
+    fechas, puntajes, marcadas = detectar(_df, SENSORES, metodo, umbral)
+    valores = _df.sort_values('Fecha', kind='stable')[SENSORES].to_numpy(dtype=float)
+    return {
+        sensor: pd.DataFrame({"Fecha": fechas[filas], sensor: valores[filas, i], "Puntaje": puntajes[filas, i]})
+        for i, (sensor, filas) in enumerate(marcadas.items())
+    }
+
+
+@st.cache_data(max_entries=MAX_ENTRADAS_CACHE)
+def histograma_sensor(origen, rango, sensor, _df, bins=20):
+    """Histograma ya agrupado: al navegador solo se envían los intervalos, no cada lectura."""
+    datos = histograma(_df[sensor], bins)
+    centros = [(a + b) / 2 for a, b in zip(datos['bordes'][:-1], datos['bordes'][1:])]
+    return pd.DataFrame({sensor: centros, 'Lecturas': datos['conteos']})
+
+
+st.set_page_config(layout="wide")
+st.title("📊 Estadísticas de Sensores")
+
+fuente = st.radio("Origen de los datos", ["Archivo Excel", "Almacén de lecturas"], horizontal=True)
+archivo = None
+huella = None
+origen = None
+df = None
+if fuente == "Archivo Excel":
+    archivo = st.file_uploader("📁 Sube el archivo Excel", type=["xlsx"])
+    if archivo:
+        hoja = st.selectbox("Selecciona la hoja", ["Original", "Completado_Filas"])
+        # El libro se parsea una vez por contenido; cambiar de hoja o recargar reutiliza el snapshot
+        huella = hash_contenido(archivo)
+        origen = ("excel", huella, hoja)
+        df = cargar_excel(huella, hoja, archivo)
+else:
+    # Las lecturas subidas en la aplicación web se consultan por rango sin leer ningún libro
+    rango_almacen = almacen_lecturas.rango_fechas(SENSORES)
+    if rango_almacen is None:
+        st.info("El almacén de lecturas está vacío. Sube un archivo en la aplicación web o usa un archivo Excel.")
+    else:
+        fechas = st.date_input(
+            "Rango de fechas a consultar",
+            value=(rango_almacen[0].date(), rango_almacen[1].date()),
+            min_value=rango_almacen[0].date(),
+            max_value=rango_almacen[1].date(),
+        )
+        if isinstance(fechas, (tuple, list)) and len(fechas) == 2:
+            # La versión cambia con cada escritura en el almacén, así que invalida la caché
+            version = almacen_lecturas.version()
+            origen = ("almacen", version, fechas[0], fechas[1])
+            df = cargar_almacen(version, fechas[0], fechas[1])
+            if df.empty:
+                st.warning("No hay lecturas en el rango seleccionado.")
+                df = None
+
+if df is not None:
+    if 'Fecha' in df.columns:
         # --- Mejora 1: Resumen de calidad de datos ---
         st.subheader(" Resumen de Calidad de Datos")
         col_q1, col_q2 = st.columns(2)
         with col_q2:
             st.markdown('<h4 style="text-align: center;">📈 Estadísticas Descriptivas</h4>', unsafe_allow_html=True)
-            st.write(df[["P42", "P43", "P55"]].describe())
+            st.write(estadisticas(origen, df))
 
 
         # --- Mejora 2: Filtro por rango de fechas ---
         st.markdown("---")
         st.subheader("📅 Filtro por Rango de Fechas")
+        cubo = cubo_de(origen, df)
         min_date = df['Fecha'].min().to_pydatetime()
         max_date = df['Fecha'].max().to_pydatetime()
         rango = st.slider(
@@ -48,6 +164,9 @@ if archivo:
             format="YYYY-MM-DD"
         )
         df = df[(df['Fecha'] >= rango[0]) & (df['Fecha'] <= rango[1])]
+        # Los meses completos del rango salen del cubo; solo el primero y el último se recalculan
+        cubo = rebanar_dias(cubo, df, SENSORES, rango[0], rango[1])
+        resumen_rango = resumen_periodo(cubo)
 
         # Menú lateral
         opcion = st.sidebar.radio("📂 Selecciona una sección para visualizar", [
@@ -61,29 +180,21 @@ if archivo:
             "Estacionalidad Mensual",
         ])
 
-        # Función para detectar anomalías
-        def detectar_anomalias(sensor):
-            media = df[sensor].mean()
-            std = df[sensor].std()
-            df[f"{sensor}_Anomalia"] = ((df[sensor] > media + 2*std) | (df[sensor] < media - 2*std))
-            return df[df[f"{sensor}_Anomalia"]][["Fecha", sensor]].reset_index(drop=True)
-
         # Comparación de hojas con IA
         st.sidebar.markdown("---")
         st.sidebar.header("📋 Comparación de Datos")
         if st.sidebar.button("📊 Generar Comparación"):
             with st.spinner("Analizando los datos..."):
+                if archivo is None:
+                    st.sidebar.warning("La comparación necesita un archivo Excel con las hojas Original y Completado_Filas.")
+                    st.stop()
                 try:
-                    df_original = pd.read_excel(archivo, sheet_name="Original")
-                    df_completado = pd.read_excel(archivo, sheet_name="Completado_Filas")
+                    hojas = leer_hojas(archivo, ["Original", "Completado_Filas"], huella=huella, errores='coerce')
+                    df_original, df_completado = hojas["Original"], hojas["Completado_Filas"]
                 except Exception as e:
                     st.sidebar.error(f"Error al leer hojas: {e}")
                     st.stop()
 
-                for df_temp in [df_original, df_completado]:
-                    if 'Fecha' in df_temp.columns:
-                        df_temp['Fecha'] = pd.to_datetime(df_temp['Fecha'], errors='coerce')
-
                 def resumen(df_tmp, nombre):
                     return f"""
 📄 **{nombre}**
@@ -121,23 +232,21 @@ if archivo:
                 - Cómo estas mejoras podrían ayudar a prevenir fallos o desastres futuros.
                 Considerar en la conclusion no decir hojas , sino "datos originales" y "datos completados".
                 """)
-                conclusion_comparativa = llm.predict(prompt_comparativo)
                 st.sidebar.markdown("### 🤖 Conclusión:")
-                st.sidebar.write(conclusion_comparativa)
+                st.sidebar.write_stream(flujo_conclusion(prompt_comparativo))
 
         # --- Visualizaciones ---
         if opcion == "Métricas Totales":
             st.subheader("📍 Métricas Totales")
             col1, col2, col3 = st.columns(3)
-            col1.metric("Suma de P42", f"{df['P42'].sum():,.2f} mil")
-            col2.metric("Suma de P43", f"{df['P43'].sum():,.2f} mil")
-            col3.metric("Suma de P55", f"{df['P55'].sum():,.2f} mil")
+            col1.metric("Suma de P42", f"{resumen_rango.loc['P42', 'suma']:,.2f} mil")
+            col2.metric("Suma de P43", f"{resumen_rango.loc['P43', 'suma']:,.2f} mil")
+            col3.metric("Suma de P55", f"{resumen_rango.loc['P55', 'suma']:,.2f} mil")
             st.info("📌 Esta sección muestra la suma total de cada sensor durante todo el período de tiempo.")
 
         elif opcion == "Gráfico Combinado por Mes":
             st.subheader("📊 Tendencia mensual combinada")
-            df_mes = df.groupby("AñoMes")[["P42", "P43", "P55"]].sum().reset_index()
-            df_mes = df_mes.sort_values("AñoMes")
+            df_mes = tabla_mensual(cubo, "suma")
             df_mes[["P42", "P43", "P55"]] = df_mes[["P42", "P43", "P55"]].replace(0, pd.NA)
             fig = px.line(df_mes, x="AñoMes", y=["P42", "P43", "P55"],
                           title="Suma mensual de sensores (líneas se cortan con 0s)")
@@ -145,7 +254,7 @@ if archivo:
 
         elif opcion == "Promedios Mensuales":
             st.subheader("📉 Promedio mensual por sensor")
-            df_prom = df.groupby("AñoMes")[["P42", "P43", "P55"]].mean().reset_index()
+            df_prom = tabla_mensual(cubo, "promedio")
             df_prom_long = pd.melt(df_prom, id_vars="AñoMes", value_vars=["P42", "P43", "P55"],
                                    var_name="Sensor", value_name="Promedio")
             fig_prom = px.line(df_prom_long, x="AñoMes", y="Promedio", color="Sensor",
@@ -156,10 +265,13 @@ if archivo:
             st.subheader("📈 Máximos y mínimos por sensor")
             cols_maxmin = st.columns(3)
             for i, sensor in enumerate(["P42", "P43", "P55"]):
-                max_val = df[sensor].max()
-                min_val = df[sensor].min()
-                fecha_max = df.loc[df[sensor] == max_val, "Fecha"].dt.strftime('%Y-%m').values[0]
-                fecha_min = df.loc[df[sensor] == min_val, "Fecha"].dt.strftime('%Y-%m').values[0]
+                extremos = resumen_rango.loc[sensor]
+                if pd.isna(extremos['maximo']):
+                    cols_maxmin[i].markdown(f"### {sensor}\nSin lecturas en el rango.")
+                    continue
+                max_val, min_val = extremos['maximo'], extremos['minimo']
+                fecha_max = extremos['fecha_maximo'].strftime('%Y-%m')
+                fecha_min = extremos['fecha_minimo'].strftime('%Y-%m')
                 cols_maxmin[i].markdown(f"""
                 ### {sensor}
                 🔺 **Máx**: {max_val:,.2f} en `{fecha_max}`  
@@ -168,17 +280,16 @@ if archivo:
 
         elif opcion == "Distribución":
             st.subheader("📊 Distribución de valores por sensor")
-            col_hist1, col_hist2, col_hist3 = st.columns(3)
-            with col_hist1:
-                st.plotly_chart(px.histogram(df, x="P42", nbins=20, title="Distribución P42"), use_container_width=True)
-            with col_hist2:
-                st.plotly_chart(px.histogram(df, x="P43", nbins=20, title="Distribución P43"), use_container_width=True)
-            with col_hist3:
-                st.plotly_chart(px.histogram(df, x="P55", nbins=20, title="Distribución P55"), use_container_width=True)
+            for columna, sensor in zip(st.columns(3), ["P42", "P43", "P55"]):
+                with columna:
+                    fig_hist = px.bar(histograma_sensor(origen, rango, sensor, df), x=sensor, y='Lecturas',
+                                      title=f"Distribución {sensor}")
+                    fig_hist.update_layout(bargap=0)
+                    st.plotly_chart(fig_hist, use_container_width=True)
 
         elif opcion == "Proporción Total":
             st.subheader("📌 Porcentaje que representa cada sensor del total")
-            total = df[["P42", "P43", "P55"]].sum()
+            total = resumen_rango['suma']
             fig_pie = px.pie(
                 names=total.index,
                 values=total.values,
@@ -189,8 +300,13 @@ if archivo:
 
         elif opcion == "Anomalías por Sensor":
             st.subheader("🚨 Anomalías Detectadas")
+            col_metodo, col_umbral = st.columns(2)
+            metodo = col_metodo.selectbox("Método", METODOS, index=METODOS.index(METODO_ANOMALIAS))
+            umbral = col_umbral.number_input("Umbral (|puntaje|)", min_value=0.0, value=float(UMBRALES[metodo]),
+                                             key=f"umbral_{metodo}")
+            tablas = tablas_anomalias(origen, rango, metodo, umbral, df)
             for sensor in ["P42", "P43", "P55"]:
-                df_anom = detectar_anomalias(sensor)
+                df_anom = tablas[sensor]
                 st.markdown(f"### Sensor {sensor}")
                 if df_anom.empty:
                     st.write("No se detectaron anomalías significativas.")
@@ -199,7 +315,7 @@ if archivo:
 
         elif opcion == "Estacionalidad Mensual":
             st.subheader("📅 Estacionalidad Mensual (Promedios)")
-            df_mes = df.groupby("Mes")[["P42", "P43", "P55"]].mean().reset_index()
+            df_mes = estacionalidad(cubo).reset_index()
             fig = px.line(df_mes, x="Mes", y=["P42", "P43", "P55"], markers=True,
                           title="Promedios mensuales por sensor")
             st.plotly_chart(fig, use_container_width=True)
@@ -220,9 +336,9 @@ El rango de fechas va desde {df['Fecha'].min().strftime('%Y-%m-%d')} hasta {df['
                 if opcion_actual == "Métricas Totales":
                     prompt = prompt_intro + f"""
 Las sumas totales de precipitación registradas por los sensores son:
-- P42: {df['P42'].sum():,.2f}
-- P43: {df['P43'].sum():,.2f}
-- P55: {df['P55'].sum():,.2f}
+- P42: {resumen_rango.loc['P42', 'suma']:,.2f}
+- P43: {resumen_rango.loc['P43', 'suma']:,.2f}
+- P55: {resumen_rango.loc['P55', 'suma']:,.2f}
 
 Por favor, genera una conclusión sobre el comportamiento total de los sensores.
 """
@@ -234,7 +350,7 @@ Por favor, analiza las tendencias y patrones observados en el gráfico.
 Por favor, genera una conclusión sobre el comportamiento total de los sensores.
 """
                 elif opcion_actual == "Promedios Mensuales":
-                    mensual = df.groupby(df["Fecha"].dt.month).mean(numeric_only=True)
+                    mensual = estacionalidad(cubo)
                     prompt = prompt_intro + f"""
 Los promedios mensuales por sensor son:
 {mensual.round(2).to_string()}
@@ -242,8 +358,8 @@ Los promedios mensuales por sensor son:
 Describe las tendencias de precipitación a lo largo de los meses y posibles patrones estacionales.
 """
                 elif opcion_actual == "Máximos y Mínimos":
-                    maximos = df[["P42", "P43", "P55"]].max()
-                    minimos = df[["P42", "P43", "P55"]].min()
+                    maximos = resumen_rango['maximo']
+                    minimos = resumen_rango['minimo']
                     prompt = prompt_intro + f"""
 Los valores máximos registrados fueron:
 {maximos.to_string()}
@@ -259,7 +375,7 @@ Se ha visualizado la distribución de los datos por sensor.
 Comenta sobre la forma de las distribuciones, si hay asimetrías, sesgos o valores atípicos.
 """
                 elif opcion_actual == "Proporción Total":
-                    total = df[["P42", "P43", "P55"]].sum()
+                    total = resumen_rango['suma']
                     total_global = total.sum()
                     proporciones = (total / total_global * 100).round(2)
                     prompt = prompt_intro + f"""
@@ -289,5 +405,4 @@ Describe cómo se comportan conjuntamente los sensores y si hay correlaciones vi
 No se ha seleccionado una sección específica. No hay datos adicionales disponibles.
 """
 
-                conclusion = llm.predict(textwrap.dedent(prompt))
-                st.write(conclusion)
+                st.write_stream(flujo_conclusion(textwrap.dedent(prompt)))
@@ -0,0 +1,67 @@
+"""
+El análisis por bloques (AcumuladorEstaciones) y el incremental (analizar_incremental) deben dar
+lo mismo que analizar todas las filas de una vez, con cualquier método de anomalias.METODOS.
+
+Uso (desde SISTEMA_MANTENIMIENTO):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import anomalias
+from analisis import AcumuladorEstaciones, analizar_estaciones, analizar_incremental
+from cache_analisis import CacheAnalisis
+
+ESTACIONES = ['P42', 'P43', 'P55']
+
+
+def lecturas_sinteticas(filas=3000):
+    """Lecturas diarias con estacionalidad, picos y faltantes."""
+    azar = np.random.default_rng(0)
+    fechas = pd.date_range('2010-01-01', periods=filas, freq='D')
+    estacion = 10 + 5 * np.sin(2 * np.pi * fechas.dayofyear.to_numpy() / 365)[:, None]
+    valores = estacion + azar.gamma(2, 2, (filas, len(ESTACIONES)))
+    picos = azar.random(valores.shape) < 0.01
+    valores[picos] *= azar.uniform(3, 6, picos.sum())
+    valores[azar.random(valores.shape) < 0.05] = np.nan
+    return pd.DataFrame({'Fecha': fechas, **dict(zip(ESTACIONES, valores.T))})
+
+
+def comparar(resultado, esperado):
+    for estacion in ESTACIONES:
+        obtenido, completo = resultado[estacion], esperado[estacion]
+        assert obtenido['faltantes'] == completo['faltantes']
+        assert obtenido['fechas_faltantes'] == completo['fechas_faltantes']
+        assert obtenido['total_anomalias'] == completo['total_anomalias']
+        assert [a['Fecha_str'] for a in obtenido['fechas_anomalias']] == \
+               [a['Fecha_str'] for a in completo['fechas_anomalias']]
+        # Los puntajes pueden diferir en el redondeo de las sumas acumuladas por bloque
+        assert [a.get('puntaje') for a in obtenido['fechas_anomalias']] == \
+               pytest.approx([a.get('puntaje') for a in completo['fechas_anomalias']], rel=1e-9, nan_ok=True)
+        pd.testing.assert_frame_equal(obtenido['reporte_mensual'], completo['reporte_mensual'])
+
+
+@pytest.mark.parametrize('metodo', anomalias.METODOS)
+def test_por_bloques_igual_que_completo(metodo):
+    df = lecturas_sinteticas()
+    esperado = analizar_estaciones(df, ESTACIONES, metodo=metodo)
+    acumulador = AcumuladorEstaciones(ESTACIONES, metodo=metodo)
+    for inicio, fin in ((0, 700), (700, 701), (701, 2200), (2200, len(df))):
+        acumulador.agregar(df.iloc[inicio:fin])
+    comparar(acumulador.resultados(), esperado)
+
+
+@pytest.mark.parametrize('metodo', anomalias.METODOS)
+def test_incremental_igual_que_completo(metodo, tmp_path):
+    df = lecturas_sinteticas()
+    cache = CacheAnalisis(str(tmp_path / 'analisis.sqlite'))
+    analizar_incremental(df.iloc[:1800], ESTACIONES, cache=cache, metodo=metodo)
+    # La segunda llamada reutiliza el estado guardado y solo procesa las filas nuevas
+    resultado = analizar_incremental(df, ESTACIONES, cache=cache, metodo=metodo)
+    comparar(resultado, analizar_estaciones(df, ESTACIONES, metodo=metodo))
@@ -0,0 +1,314 @@
+import math
+import os
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from anomalias import UMBRALES, VENTANA
+
+# --- Detección de anomalías en línea ---
+# Las lecturas que envía la pasarela de telemetría (POST /api/lecturas) se evalúan al llegar, sin
+# esperar a que alguien suba un Excel. Por estación se mantiene un estado de tamaño fijo que se
+# actualiza en O(1) por lectura:
+#   - la última lectura válida, para la variación % (mismo umbral que el método variacion de anomalias.py),
+#   - un buffer circular con las últimas `capacidad` lecturas y su media/varianza por Welford
+#     (al entrar una lectura sale la más antigua), para el puntaje z frente a la ventana anterior
+#     (mismo criterio que el método zscore de anomalias.py),
+#   - una media y varianza exponenciales (EWMA), que se informan como tendencia,
+#   - la última fecha y el intervalo entre lecturas (el configurado o la mediana de los últimos
+#     huecos observados), para avisar de intervalos sin datos.
+# El estado vive en memoria del proceso: con varios workers la pasarela debe enviar cada estación
+# siempre al mismo (o la ingesta debe correr en un solo worker).
+
+UMBRAL_PORCENTAJE = 50
+UMBRAL_ZSCORE = UMBRALES['zscore']
+CAPACIDAD = int(os.environ.get('TIEMPO_REAL_VENTANA', VENTANA))
+ALFA_EWMA = float(os.environ.get('TIEMPO_REAL_ALFA', 0.1))
+# Segundos esperados entre lecturas de una estación; vacío = la mediana de los últimos
+# MUESTRA_INTERVALO huecos de la estación, estimada en cuanto hay MIN_HUECOS
+INTERVALO = float(os.environ['TIEMPO_REAL_INTERVALO_S']) if os.environ.get('TIEMPO_REAL_INTERVALO_S') else None
+MUESTRA_INTERVALO = 15
+MIN_HUECOS = 3
+# Un hueco mayor que TOLERANCIA_INTERVALO intervalos se avisa como intervalo sin datos
+TOLERANCIA_INTERVALO = 1.5
+# Eventos recientes que se conservan para GET /api/lecturas/eventos
+MAX_EVENTOS = int(os.environ.get('TIEMPO_REAL_MAX_EVENTOS', 10000))
+# Una desviación menor que esta fracción de la mayor lectura de la ventana se considera ruido numérico
+TOLERANCIA_DESVIACION = 1e-7
+
+# Fechas admitidas en las lecturas (epoch en segundos, UTC): de 1970 a 2100
+MIN_SEGUNDOS = 0.0
+MAX_SEGUNDOS = datetime(2100, 1, 1, tzinfo=timezone.utc).timestamp()
+
+ANOMALIA, FALTANTE, SIN_DATOS = 'anomalia', 'faltante', 'sin_datos'
+
+
+def texto_fecha(segundos):
+    return datetime.fromtimestamp(segundos, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def segundos_de(fecha):
+    """
+    Fecha como epoch en segundos: número o texto ISO (sin zona horaria = UTC). ValueError si no
+    es una fecha finita entre MIN_SEGUNDOS y MAX_SEGUNDOS.
+    """
+    if isinstance(fecha, (int, float)) and not isinstance(fecha, bool):
+        segundos = float(fecha)
+    else:
+        fecha = datetime.fromisoformat(fecha)
+        if fecha.tzinfo is None:
+            fecha = fecha.replace(tzinfo=timezone.utc)
+        segundos = fecha.timestamp()
+    # NaN no cumple ninguna comparación, así que también se rechaza aquí
+    if not MIN_SEGUNDOS <= segundos < MAX_SEGUNDOS:
+        raise ValueError(f"Fecha fuera de rango: {fecha}")
+    return segundos
+
+
+def leer_lote(datos):
+    """
+    Lecturas de la petición como [(estacion, segundos, valor)]. Acepta una lista (o
+    {"lecturas": [...]}) de objetos {"estacion", "fecha", "valor"} o de listas [estacion, fecha, valor];
+    valor null es un dato faltante. ValueError con la posición de la primera lectura no válida.
+    """
+    if isinstance(datos, dict):
+        datos = datos.get('lecturas')
+    if not isinstance(datos, list):
+        raise ValueError("Se espera una lista de lecturas.")
+    lecturas = []
+    for i, lectura in enumerate(datos):
+        try:
+            if isinstance(lectura, dict):
+                estacion, fecha, valor = lectura['estacion'], lectura['fecha'], lectura.get('valor')
+            else:
+                estacion, fecha, valor = lectura
+            valor = None if valor is None else float(valor)
+            if valor is not None and math.isinf(valor):
+                raise ValueError
+            lecturas.append((str(estacion), segundos_de(fecha), valor))
+        except (KeyError, TypeError, ValueError, OverflowError):
+            raise ValueError(f"Lectura {i} no válida: se espera estacion, fecha (ISO o epoch, entre 1970 y 2100)"
+                             " y valor.")
+    return lecturas
+
+
+class EstadoEstacion:
+    __slots__ = ('buffer', 'posicion', 'n', 'media', 'm2', 'escala', 'ewma', 'ewmv', 'ultimo_valor',
+                 'ultima_fecha', 'intervalo', 'huecos', 'pendientes', 'lecturas', 'anomalias', 'faltantes',
+                 'sin_datos')
+
+    def __init__(self, capacidad, intervalo):
+        self.buffer = [math.nan] * capacidad
+        self.posicion = 0
+        # Welford sobre los valores válidos del buffer
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.escala = 0.0
+        self.ewma = None
+        self.ewmv = 0.0
+        self.ultimo_valor = None
+        self.ultima_fecha = None
+        self.intervalo = intervalo
+        # Últimos huecos entre lecturas (para estimar el intervalo) y los vistos antes de estimarlo
+        self.huecos = deque(maxlen=MUESTRA_INTERVALO)
+        self.pendientes = []
+        self.lecturas = 0
+        self.anomalias = 0
+        self.faltantes = 0
+        self.sin_datos = False
+
+    def recalcular(self):
+        """Media y varianza exactas del buffer; se llama en cada vuelta para que no acumulen error."""
+        validos = [x for x in self.buffer if x == x]
+        self.n = len(validos)
+        self.media = sum(validos) / self.n if validos else 0.0
+        self.m2 = sum((x - self.media) ** 2 for x in validos)
+        self.escala = max(map(abs, validos), default=0.0)
+
+    def a_dict(self):
+        desviacion = math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else None
+        return {
+            'lecturas': self.lecturas,
+            'anomalias': self.anomalias,
+            'faltantes': self.faltantes,
+            'ultima_fecha': texto_fecha(self.ultima_fecha) if self.ultima_fecha is not None else None,
+            'ultimo_valor': self.ultimo_valor,
+            'intervalo_s': self.intervalo,
+            'ventana': {'lecturas': self.n, 'media': self.media if self.n else None, 'desviacion': desviacion},
+            'ewma': {'media': self.ewma, 'desviacion': math.sqrt(self.ewmv) if self.ewma is not None else None},
+        }
+
+
+class DetectorEnLinea:
+    """Estado por estación y eventos recientes; procesar() evalúa un lote de lecturas."""
+
+    def __init__(self, capacidad=CAPACIDAD, umbral_porcentaje=UMBRAL_PORCENTAJE, umbral_zscore=UMBRAL_ZSCORE,
+                 alfa=ALFA_EWMA, intervalo=INTERVALO, tolerancia=TOLERANCIA_INTERVALO, max_eventos=MAX_EVENTOS):
+        self.capacidad = capacidad
+        self.umbral_porcentaje = umbral_porcentaje
+        self.umbral_zscore = umbral_zscore
+        # Lecturas mínimas en la ventana para calcular el puntaje z (como anomalias.zscore_movil)
+        self.minimo = max(2, capacidad // 2)
+        self.alfa = alfa
+        self.intervalo = intervalo
+        self.tolerancia = tolerancia
+        self.estaciones = {}
+        self.eventos = deque(maxlen=max_eventos)
+        self.ultimo_evento = 0
+        self.procesadas = 0
+        self.descartadas = 0
+        self._lock = threading.Lock()
+
+    def _evento(self, eventos, tipo, estacion, **datos):
+        self.ultimo_evento += 1
+        evento = {'id': self.ultimo_evento, 'tipo': tipo, 'estacion': estacion, **datos}
+        eventos.append(evento)
+        self.eventos.append(evento)
+
+    def procesar(self, lecturas):
+        """
+        Evalúa lecturas [(estacion, segundos, valor)] en orden de fecha. Devuelve (eventos generados,
+        lecturas aceptadas): se descartan las de fecha igual o anterior a la última de su estación,
+        incluidas las repetidas dentro del mismo lote.
+        """
+        eventos = []
+        aceptadas = []
+        lecturas = sorted(lecturas, key=lambda lectura: lectura[1])
+        with self._lock:
+            for lectura in lecturas:
+                estacion, fecha, valor = lectura
+                estado = self.estaciones.get(estacion)
+                if estado is None:
+                    estado = self.estaciones[estacion] = EstadoEstacion(self.capacidad, self.intervalo)
+                if self._actualizar(estacion, estado, fecha, valor, eventos):
+                    aceptadas.append(lectura)
+            self.procesadas += len(aceptadas)
+            self.descartadas += len(lecturas) - len(aceptadas)
+            if lecturas:
+                self._revisar_silencios(lecturas[-1][1], eventos)
+        return eventos, aceptadas
+
+    def _actualizar(self, estacion, e, fecha, valor, eventos):
+        anterior = e.ultima_fecha
+        if anterior is not None:
+            hueco = fecha - anterior
+            if hueco <= 0:
+                return False
+            if self.intervalo is None:
+                huecos = e.huecos
+                huecos.append(hueco)
+                if len(huecos) >= MIN_HUECOS:
+                    e.intervalo = sorted(huecos)[len(huecos) // 2]
+            if e.intervalo:
+                # Los huecos vistos antes de estimar el intervalo se revisan en cuanto se tiene
+                if e.pendientes:
+                    for desde, hasta in e.pendientes:
+                        self._revisar_hueco(estacion, e, desde, hasta, eventos)
+                    e.pendientes = []
+                self._revisar_hueco(estacion, e, anterior, fecha, eventos)
+            else:
+                e.pendientes.append((anterior, fecha))
+        e.ultima_fecha = fecha
+        e.sin_datos = False
+        e.lecturas += 1
+
+        if valor is None or valor != valor:
+            valor = math.nan
+            e.faltantes += 1
+            self._evento(eventos, FALTANTE, estacion, motivo='nulo', desde=texto_fecha(fecha),
+                         hasta=texto_fecha(fecha), lecturas=1)
+        else:
+            # Variación % respecto a la última lectura válida (división por cero como en pandas)
+            variacion = None
+            ultimo = e.ultimo_valor
+            if ultimo is not None:
+                if ultimo:
+                    variacion = (valor / ultimo - 1) * 100
+                elif valor:
+                    variacion = math.copysign(math.inf, valor)
+            # Puntaje z frente a la ventana anterior (el buffer todavía sin la lectura actual)
+            zscore = None
+            if e.n >= self.minimo:
+                desviacion = math.sqrt(e.m2 / (e.n - 1))
+                if desviacion > TOLERANCIA_DESVIACION * e.escala:
+                    zscore = (valor - e.media) / desviacion
+            criterios = []
+            if variacion is not None and abs(variacion) > self.umbral_porcentaje:
+                criterios.append('variacion')
+            if zscore is not None and abs(zscore) > self.umbral_zscore:
+                criterios.append('zscore')
+            if criterios:
+                e.anomalias += 1
+                self._evento(eventos, ANOMALIA, estacion, fecha=texto_fecha(fecha), valor=valor,
+                             variacion=variacion if variacion is not None and math.isfinite(variacion) else None,
+                             zscore=zscore, ewma=e.ewma, criterios=criterios)
+
+            # EWMA de media y varianza
+            if e.ewma is None:
+                e.ewma = valor
+            else:
+                delta = valor - e.ewma
+                e.ewma += self.alfa * delta
+                e.ewmv = (1 - self.alfa) * (e.ewmv + self.alfa * delta * delta)
+            e.ultimo_valor = valor
+
+        # La lectura (o el nulo) entra en el buffer en lugar de la más antigua
+        buffer, posicion = e.buffer, e.posicion
+        saliente = buffer[posicion]
+        if saliente == saliente:
+            e.n -= 1
+            if e.n:
+                delta = saliente - e.media
+                e.media -= delta / e.n
+                e.m2 = max(e.m2 - delta * (saliente - e.media), 0.0)
+            else:
+                e.media = e.m2 = 0.0
+        buffer[posicion] = valor
+        if valor == valor:
+            e.n += 1
+            delta = valor - e.media
+            e.media += delta / e.n
+            e.m2 += delta * (valor - e.media)
+            if abs(valor) > e.escala:
+                e.escala = abs(valor)
+
+        e.posicion = posicion + 1
+        if e.posicion == self.capacidad:
+            e.posicion = 0
+            e.recalcular()
+        return True
+
+    def _revisar_hueco(self, estacion, e, anterior, fecha, eventos):
+        """Avisa de las lecturas que faltan entre anterior y fecha si el hueco supera la tolerancia."""
+        if fecha - anterior > self.tolerancia * e.intervalo:
+            faltan = round((fecha - anterior) / e.intervalo) - 1
+            e.faltantes += faltan
+            self._evento(eventos, FALTANTE, estacion, motivo='sin_lectura', desde=texto_fecha(anterior + e.intervalo),
+                         hasta=texto_fecha(fecha - e.intervalo), lecturas=faltan)
+
+    def _revisar_silencios(self, referencia, eventos):
+        """Avisa una vez de cada estación que lleva más de tolerancia intervalos sin enviar lecturas."""
+        for estacion, e in self.estaciones.items():
+            if (not e.sin_datos and e.intervalo and e.ultima_fecha is not None
+                    and referencia - e.ultima_fecha > self.tolerancia * e.intervalo):
+                e.sin_datos = True
+                self._evento(eventos, SIN_DATOS, estacion, desde=texto_fecha(e.ultima_fecha),
+                             referencia=texto_fecha(referencia))
+
+    def eventos_desde(self, ultimo=0, limite=1000):
+        """Eventos con id mayor que ultimo (de los últimos conservados), como mucho limite."""
+        with self._lock:
+            return [evento for evento in self.eventos if evento['id'] > ultimo][:limite]
+
+    def estado(self):
+        with self._lock:
+            return {
+                'procesadas': self.procesadas,
+                'descartadas': self.descartadas,
+                'ultimo_evento': self.ultimo_evento,
+                'estaciones': {estacion: e.a_dict() for estacion, e in self.estaciones.items()},
+            }
+
+
+detector_en_linea = DetectorEnLinea()
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Ejecución de trabajos en segundo plano ---
+# Los procesos largos (consulta de clima, interpolación, escritura de Excel) se ejecutan fuera
+# de la petición HTTP. Los trabajos idénticos (misma clave, p. ej. el hash del archivo) se
+# deduplican: mientras uno está en curso o terminado, se devuelve el mismo trabajo.
+# La tabla vive en el proceso; con publicar(trabajo_dict) el estado se copia además a un
+# almacén compartido para que otros workers puedan responder por el mismo trabajo.
+
+MAX_WORKERS_TRABAJOS = int(os.environ.get('TRABAJOS_MAX_WORKERS', 2))
+MAX_TRABAJOS_GUARDADOS = 50
+# Un trabajo fallido se sigue devolviendo durante este tiempo antes de volver a intentarlo
+REINTENTAR_ERROR_TRAS = 60
+
+PENDIENTE = 'pendiente'
+EN_PROCESO = 'en_proceso'
+COMPLETADO = 'completado'
+ERROR = 'error'
+
+
+class Trabajo:
+    def __init__(self, clave, al_cambiar=None):
+        self.id = uuid.uuid4().hex
+        self.clave = clave
+        self.estado = PENDIENTE
+        self.avance = 0
+        self.total = 0
+        self.mensaje = 'En cola'
+        self.resultado = None
+        self.error = None
+        # Datos adicionales que la función publica con el progreso (p. ej. estadísticas de caché)
+        self.detalles = {}
+        self.creado = time.time()
+        self.terminado = None
+        self._al_cambiar = al_cambiar
+
+    @property
+    def progreso(self):
+        if self.estado == COMPLETADO:
+            return 100.0
+        return (self.avance / self.total) * 100 if self.total else 0.0
+
+    def actualizar(self, avance, total=None, mensaje=None, detalles=None):
+        """Callback de progreso que reciben las funciones ejecutadas como trabajo."""
+        self.avance = avance
+        if total is not None:
+            self.total = total
+        if mensaje is not None:
+            self.mensaje = mensaje
+        if detalles is not None:
+            self.detalles.update(detalles)
+        self.notificar()
+
+    def notificar(self):
+        if self._al_cambiar is not None:
+            try:
+                self._al_cambiar(self.a_dict())
+            except Exception as e:
+                print(f"No se pudo publicar el estado del trabajo {self.id}: {e}")
+
+    def a_dict(self):
+        return {
+            'id': self.id,
+            'clave': self.clave,
+            'estado': self.estado,
+            'progreso': round(self.progreso, 1),
+            'avance': self.avance,
+            'total': self.total,
+            'mensaje': self.mensaje,
+            'error': self.error,
+            'detalles': self.detalles,
+            'creado': self.creado,
+            'terminado': self.terminado,
+        }
+
+
+class GestorTrabajos:
+    """Tabla de trabajos en memoria ejecutados por un pool de hilos."""
+
+    def __init__(self, max_workers=MAX_WORKERS_TRABAJOS, publicar=None):
+        self._publicar = publicar
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='trabajo')
+        self._trabajos = {}
+        self._por_clave = {}
+        self._lock = threading.Lock()
+
+    def enviar(self, clave, funcion, *args, **kwargs):
+        """
+        Encola funcion(*args, progreso=trabajo.actualizar, trabajo_id=trabajo.id, **kwargs) y
+        devuelve el trabajo.
+        Si ya existe un trabajo con la misma clave se reutiliza, salvo que haya terminado
+        en error hace más de REINTENTAR_ERROR_TRAS segundos.
+        """
+        with self._lock:
+            existente = self._trabajos.get(self._por_clave.get(clave))
+            if existente is not None and not (
+                existente.estado == ERROR and time.time() - existente.terminado > REINTENTAR_ERROR_TRAS
+            ):
+                return existente
+            trabajo = Trabajo(clave, self._publicar)
+            self._trabajos[trabajo.id] = trabajo
+            self._por_clave[clave] = trabajo.id
+            self._recortar()
+        trabajo.notificar()
+        self._pool.submit(self._ejecutar, trabajo, funcion, args, kwargs)
+        return trabajo
+
+    def _ejecutar(self, trabajo, funcion, args, kwargs):
+        trabajo.estado = EN_PROCESO
+        trabajo.mensaje = 'Procesando'
+        trabajo.notificar()
+        try:
+            trabajo.resultado = funcion(*args, progreso=trabajo.actualizar, trabajo_id=trabajo.id, **kwargs)
+            trabajo.terminado = time.time()
+            trabajo.mensaje = 'Completado'
+            trabajo.estado = COMPLETADO
+        except Exception as e:
+            print(f"Error en el trabajo {trabajo.id}: {e}")
+            traceback.print_exc()
+            trabajo.error = str(e)
+            trabajo.terminado = time.time()
+            trabajo.mensaje = 'Error'
+            trabajo.estado = ERROR
+        trabajo.notificar()
+
+    def _recortar(self):
+        # Descarta los trabajos terminados más antiguos para acotar la memoria
+        terminados = sorted(
+            (t for t in self._trabajos.values() if t.estado in (COMPLETADO, ERROR)),
+            key=lambda t: t.creado,
+        )
+        for t in terminados[:max(0, len(self._trabajos) - MAX_TRABAJOS_GUARDADOS)]:
+            del self._trabajos[t.id]
+            if self._por_clave.get(t.clave) == t.id:
+                del self._por_clave[t.clave]
+
+    def obtener(self, trabajo_id):
+        return self._trabajos.get(trabajo_id)
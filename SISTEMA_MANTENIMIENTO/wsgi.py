@@ -0,0 +1,48 @@
+"""
+Punto de entrada WSGI: una sola aplicación que sirve el sistema de mantenimiento (app.py) en /
+y la aplicación de datos faltantes (faltantes.py) en /faltantes.
+
+Uso (desde SISTEMA_MANTENIMIENTO):
+    python main.py                                              # gunicorn o waitress según el sistema
+    gunicorn --preload -w 4 --threads 4 -b 0.0.0.0:5000 wsgi:application
+    waitress-serve --threads 8 --port 5000 wsgi:application
+
+main.py además precalienta el motor de pronóstico en cada worker tras el fork.
+"""
+import os
+
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+PREFIJO_FALTANTES = os.environ.get('PREFIJO_FALTANTES', '/faltantes')
+
+
+def precargar():
+    """
+    Importa las dependencias pesadas antes de crear los workers. Con gunicorn --preload esto
+    ocurre una vez en el proceso maestro y los workers las heredan al hacer fork, en lugar de
+    importarlas cada uno (Prophet tarda varios segundos).
+    """
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import clima  # noqa: F401  (requests y el cliente de clima; en app.py se importan al primer uso)
+    from pronostico import MOTOR_PRONOSTICO
+
+    if MOTOR_PRONOSTICO == 'prophet':
+        try:
+            import prophet  # noqa: F401
+        except ImportError as e:
+            print(f"No se pudo importar prophet: {e}")
+
+
+def crear_app():
+    """Crea la aplicación WSGI que combina ambas aplicaciones Flask."""
+    precargar()
+    from app import app as app_mantenimiento
+    from faltantes import app as app_faltantes
+
+    for aplicacion in (app_mantenimiento, app_faltantes):
+        os.makedirs(aplicacion.config['UPLOAD_FOLDER'], exist_ok=True)
+    return DispatcherMiddleware(app_mantenimiento, {PREFIJO_FALTANTES: app_faltantes})
+
+
+application = crear_app()